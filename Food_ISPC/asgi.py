@@ -11,5 +11,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Food_ISPC.settings')
+# Bajo ASGI las lecturas usan las vistas async (ver Food_ISPC/asincrono.py)
+os.environ.setdefault('VISTAS_ASINCRONAS', 'True')
 
 application = get_asgi_application()
@@ -0,0 +1,77 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.views import View
+from rest_framework import exceptions
+
+from appUSERS.autenticacion import JWTAuthenticationAsincrona
+from Food_ISPC.db.replica import alecturas_en_replica
+from Food_ISPC.renderers import renderer_para
+
+
+def respuesta_api(request, datos, status=200):
+    """Renderiza con los mismos renderers que las vistas DRF, para que ambos modos devuelvan lo mismo."""
+    renderer = renderer_para(request)
+    return HttpResponse(renderer.render(datos), status=status, content_type=renderer.media_type)
+
+
+class VistaAsincrona(View):
+    """
+    Versión async de una vista DRF de solo lectura, para servir bajo ASGI sin
+    ocupar un hilo por conexión mientras el cliente espera.
+
+    Autentica con JWT por el ORM async y atiende los métodos que define como
+    `async def`; el resto (escrituras, OPTIONS) se delega a `vista_sincrona`,
+    la vista DRF original. Con `lee_de_replica` sus lecturas van a la réplica
+    (ver `Food_ISPC/db/replica.py`).
+    """
+    vista_sincrona = None
+    requiere_autenticacion = True
+    lee_de_replica = False
+    autenticacion = JWTAuthenticationAsincrona()
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        vista = super().as_view(**initkwargs)
+        # Igual que APIView: la autenticación es por token, no por cookie.
+        # No se usa csrf_exempt() porque en Django 4.2 oculta que la vista es async.
+        vista.csrf_exempt = True
+        return vista
+
+    async def dispatch(self, request, *args, **kwargs):
+        metodo = request.method.lower()
+        if metodo == 'options' or not hasattr(self, metodo):
+            return await sync_to_async(type(self).vista_sincrona)(request, *args, **kwargs)
+
+        try:
+            resultado = await self.autenticacion.aauthenticate(request)
+        except exceptions.AuthenticationFailed as exc:
+            return self.no_autorizado(exc)
+        if resultado is None and self.requiere_autenticacion:
+            return self.no_autorizado(exceptions.NotAuthenticated())
+        if resultado is not None:
+            request.user, request.auth = resultado
+        try:
+            if not self.lee_de_replica:
+                return await getattr(self, metodo)(request, *args, **kwargs)
+            async with alecturas_en_replica(getattr(request, 'user', None)):
+                return await getattr(self, metodo)(request, *args, **kwargs)
+        except exceptions.APIException as exc:
+            # Como las vistas DRF, p. ej. un `?fields=` inválido
+            return self.respuesta_error(exc)
+
+    def respuesta_error(self, exc):
+        datos = exc.detail if isinstance(exc.detail, (dict, list)) else {'detail': exc.detail}
+        return respuesta_api(self.request, datos, status=exc.status_code)
+
+    def no_autorizado(self, exc):
+        respuesta = self.respuesta_error(exc)
+        respuesta['WWW-Authenticate'] = self.autenticacion.authenticate_header(self.request)
+        return respuesta
+
+
+def segun_modo(vista_asincrona):
+    """La vista async si `VISTAS_ASINCRONAS` está activo (despliegue ASGI), la DRF original si no."""
+    if settings.VISTAS_ASINCRONAS:
+        return vista_asincrona.as_view()
+    return vista_asincrona.vista_sincrona
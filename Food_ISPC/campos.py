@@ -0,0 +1,118 @@
+"""
+Campos a pedido: `?fields=` elige qué campos trae la respuesta y `?expand=`
+reemplaza el id de una relación por el objeto. Los campos anidados van con
+punto: `?fields=id_pedidos,estado,detalles.nombre_producto`. Sin `fields` la
+respuesta no cambia.
+
+Además de achicar el JSON, las vistas cargan de la base solo las columnas que
+usan los campos pedidos (`.only()`), y no consultan las relaciones que no se
+piden.
+"""
+from rest_framework.exceptions import ValidationError
+
+PARAMETRO_CAMPOS = 'fields'
+PARAMETRO_EXPANDIR = 'expand'
+
+
+def _leer_arbol(request, parametro):
+    # Acepta el request de DRF y el HttpRequest de las vistas async
+    valor = getattr(request, 'query_params', request.GET).get(parametro)
+    if valor is None:
+        return None
+    arbol = {}
+    for ruta in valor.split(','):
+        nodo = arbol
+        for parte in ruta.strip().split('.'):
+            if parte:
+                nodo = nodo.setdefault(parte, {})
+    return arbol
+
+
+def leer_campos(request):
+    """Árbol de `?fields=` (`{'a': {}, 'detalles': {'b': {}}}`); `None` si no vino: todos los campos."""
+    return _leer_arbol(request, PARAMETRO_CAMPOS)
+
+
+def leer_expandir(request):
+    return _leer_arbol(request, PARAMETRO_EXPANDIR) or {}
+
+
+def incluye(campos, nombre):
+    return campos is None or nombre in campos
+
+
+def subcampos(campos, nombre):
+    """Los campos pedidos dentro de `nombre`; `None` (todos) si se pidió `nombre` entero."""
+    return (campos.get(nombre) or None) if campos is not None else None
+
+
+def verificar(campos, validos):
+    desconocidos = sorted(set(campos or ()) - set(validos))
+    if desconocidos:
+        raise ValidationError({PARAMETRO_CAMPOS: f'Campos desconocidos: {", ".join(desconocidos)}.'})
+
+
+def podar(datos, campos):
+    """Deja en `datos` (dicts y listas anidados) solo los campos pedidos."""
+    if campos is None:
+        return datos
+    if isinstance(datos, list):
+        return [podar(dato, campos) for dato in datos]
+    verificar(campos, datos)
+    return {nombre: podar(valor, campos[nombre] or None) for nombre, valor in datos.items() if nombre in campos}
+
+
+def columnas(campos, mapa):
+    """Columnas que usan los campos pedidos, según `mapa` (campo de la respuesta → columnas)."""
+    return [columna for nombre, usadas in mapa.items() if incluye(campos, nombre) for columna in usadas]
+
+
+class CamposDinamicosMixin:
+    """
+    Para los ModelSerializer: toma `fields` y `expand` del request del contexto,
+    o de `campos` y `expandir` al crearlo (así se configuran los anidados).
+
+    `expandibles` mapea un campo a la clase de serializer con la que se expande;
+    `columnas_extra`, los campos calculados a las columnas que leen.
+    """
+    expandibles = {}
+    columnas_extra = {}
+
+    def __init__(self, *args, campos=None, expandir=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        # En las escrituras se validan todos los campos
+        if request is not None and request.method in ('GET', 'HEAD') and campos is None and expandir is None:
+            campos, expandir = leer_campos(request), leer_expandir(request)
+
+        for nombre, anidados in (expandir or {}).items():
+            if nombre not in self.expandibles:
+                raise ValidationError({PARAMETRO_EXPANDIR: f'No se puede expandir {nombre}.'})
+            self.fields[nombre] = self.expandibles[nombre](
+                read_only=True, campos=subcampos(campos, nombre), expandir=anidados,
+            )
+        if campos is not None:
+            verificar(campos, self.fields)
+            for nombre in set(self.fields) - set(campos):
+                self.fields.pop(nombre)
+
+    def columnas(self, prefijo=''):
+        """Columnas del modelo que leen los campos que quedaron, en la sintaxis de `.only()`."""
+        usadas = [prefijo + self.Meta.model._meta.pk.name]
+        for nombre, campo in self.fields.items():
+            if isinstance(campo, CamposDinamicosMixin):
+                usadas += campo.columnas(f'{prefijo}{campo.source}__')
+            elif nombre in self.columnas_extra:
+                usadas += [prefijo + columna for columna in self.columnas_extra[nombre]]
+            else:
+                usadas.append(prefijo + campo.source.replace('.', '__'))
+        return usadas
+
+    def optimizar(self, queryset, *extra):
+        """`queryset` con solo las columnas que usa el serializer (más `extra`) y sus relaciones en el mismo JOIN."""
+        usadas = self.columnas() + list(extra)
+        relaciones = {columna.rsplit('__', 1)[0] for columna in usadas if '__' in columna}
+        if relaciones:
+            # Sin argumentos, select_related seguiría todas las claves foráneas
+            queryset = queryset.select_related(*relaciones)
+        return queryset.only(*usadas)
@@ -0,0 +1,50 @@
+"""
+Backend MySQL de Django con pool de conexiones opcional (`POOL` en la
+configuración de la base). Funciona con `mysqlclient` y, si no está instalado,
+con `PyMySQL`.
+"""
+try:
+    import MySQLdb  # noqa: F401
+except ImportError:
+    import pymysql
+
+    pymysql.install_as_MySQLdb()
+
+from django.db.backends.mysql import base
+
+from Food_ISPC.db.pool import PoolConexiones, pool_para
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Con `POOL` la conexión de cada hilo sale del pool del proceso y vuelve a él
+    al cerrarse (al terminar el request con `CONN_MAX_AGE=0`). Las conexiones que
+    quedaron dentro de una transacción, fuera de autocommit o con errores no se
+    devuelven: se cierran.
+    """
+
+    def pool(self, conn_params=None):
+        opciones = self.settings_dict.get('POOL')
+        if not opciones:
+            return None
+        return pool_para(self.alias, lambda: PoolConexiones(
+            conectar=lambda: base.DatabaseWrapper.get_new_connection(self, conn_params),
+            verificar=lambda conexion: conexion.ping(),
+            **opciones,
+        ))
+
+    def get_new_connection(self, conn_params):
+        pool = self.pool(conn_params)
+        if pool is None:
+            return super().get_new_connection(conn_params)
+        return pool.tomar()
+
+    def _close(self):
+        pool = self.pool()
+        if pool is None:
+            return super()._close()
+        sana = (
+            not self.in_atomic_block and not self.errors_occurred
+            and self.autocommit == self.settings_dict['AUTOCOMMIT']
+        )
+        pool.devolver(self.connection, sana)
@@ -0,0 +1,142 @@
+import logging
+import threading
+import time
+from collections import deque
+
+from django.db import OperationalError
+
+logger = logging.getLogger(__name__)
+
+
+class PoolAgotado(OperationalError):
+    pass
+
+
+class PoolConexiones:
+    """
+    Conexiones abiertas que los hilos de un worker se prestan entre sí, para no
+    pagar el handshake TLS con la base en cada request.
+
+    Hay como mucho `tamanio` conexiones abiertas; si están todas prestadas se
+    espera hasta `espera` segundos a que se devuelva una y después se falla con
+    `PoolAgotado`. Antes de prestar una conexión que estuvo quieta más de
+    `verificar_cada` segundos se la verifica con `verificar`, y las que superan
+    `vida` segundos se cierran para no chocar con el `wait_timeout` del servidor.
+    """
+
+    def __init__(self, conectar, verificar, tamanio=10, espera=5.0, vida=3600, verificar_cada=10):
+        self.conectar = conectar
+        self.verificar = verificar
+        self.tamanio = tamanio
+        self.espera = espera
+        self.vida = vida
+        self.verificar_cada = verificar_cada
+        self.condicion = threading.Condition()
+        # (conexión, creada, devuelta); se presta la última devuelta
+        self.libres = deque()
+        self.en_uso = 0
+        # Momento en que se abrió cada conexión prestada, por id
+        self.abiertas = {}
+        self.creadas = self.descartadas = self.agotado = self.prestamos = 0
+        self.espera_total = self.espera_maxima = 0.0
+
+    def tomar(self):
+        inicio = time.monotonic()
+        with self.condicion:
+            while not self.libres and self.en_uso >= self.tamanio:
+                restante = self.espera - (time.monotonic() - inicio)
+                if restante <= 0:
+                    self.agotado += 1
+                    raise PoolAgotado(f'No hay conexiones libres en el pool después de {self.espera} s.')
+                self.condicion.wait(restante)
+            conexion, creada, devuelta = self.libres.pop() if self.libres else (None, None, None)
+            # Se reserva el lugar; conectar o verificar se hace fuera del lock
+            self.en_uso += 1
+
+        try:
+            ahora = time.monotonic()
+            if conexion is not None and (ahora - creada >= self.vida or (
+                    ahora - devuelta >= self.verificar_cada and not self._sana(conexion))):
+                self._cerrar(conexion)
+                conexion = None
+            if conexion is None:
+                conexion, creada = self.conectar(), time.monotonic()
+                with self.condicion:
+                    self.creadas += 1
+        except BaseException:
+            with self.condicion:
+                self.en_uso -= 1
+                self.condicion.notify()
+            raise
+
+        espera = time.monotonic() - inicio
+        with self.condicion:
+            self.abiertas[id(conexion)] = creada
+            self.prestamos += 1
+            self.espera_total += espera
+            self.espera_maxima = max(self.espera_maxima, espera)
+        return conexion
+
+    def devolver(self, conexion, sana=True):
+        with self.condicion:
+            creada = self.abiertas.pop(id(conexion))
+            self.en_uso -= 1
+            reusar = sana and time.monotonic() - creada < self.vida
+            if reusar:
+                self.libres.append((conexion, creada, time.monotonic()))
+            self.condicion.notify()
+        if not reusar:
+            self._cerrar(conexion)
+
+    def _sana(self, conexion):
+        try:
+            self.verificar(conexion)
+            return True
+        except Exception:
+            return False
+
+    def _cerrar(self, conexion):
+        with self.condicion:
+            self.descartadas += 1
+        try:
+            conexion.close()
+        except Exception:
+            logger.debug('Error al cerrar una conexión descartada', exc_info=True)
+
+    def cerrar_libres(self):
+        with self.condicion:
+            libres, self.libres = self.libres, deque()
+        for conexion, _, _ in libres:
+            self._cerrar(conexion)
+
+    def estadisticas(self):
+        with self.condicion:
+            return {
+                'tamanio': self.tamanio,
+                'en_uso': self.en_uso,
+                'libres': len(self.libres),
+                'creadas': self.creadas,
+                'descartadas': self.descartadas,
+                'agotado': self.agotado,
+                'prestamos': self.prestamos,
+                'espera_media_ms': round(1000 * self.espera_total / self.prestamos, 3) if self.prestamos else 0,
+                'espera_maxima_ms': round(1000 * self.espera_maxima, 3),
+            }
+
+
+_pools = {}
+_lock = threading.Lock()
+
+
+def pool_para(alias, crear):
+    """El pool de `alias` en este proceso; lo arma con `crear()` la primera vez."""
+    with _lock:
+        if alias not in _pools:
+            _pools[alias] = crear()
+        return _pools[alias]
+
+
+def estadisticas():
+    with _lock:
+        pools = dict(_pools)
+    return {alias: pool.estadisticas() for alias, pool in pools.items()}
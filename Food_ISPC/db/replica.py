@@ -0,0 +1,98 @@
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import caches
+
+from appUSERS.cache import USUARIOS_CACHE
+
+REPLICA = 'replica'
+
+# Si las lecturas del contexto actual (request, tarea async) van a la réplica
+_en_replica = ContextVar('en_replica', default=False)
+
+
+class RouterReplica:
+    """
+    Manda a la réplica las lecturas hechas dentro de `lecturas_en_replica`; todo
+    lo demás (escrituras, transacciones, vistas que no lo piden) usa `default`.
+    """
+
+    def db_for_read(self, model, **hints):
+        return REPLICA if _en_replica.get() else None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {'default', REPLICA} or None
+
+
+def _clave(usuario):
+    return f'primaria:{usuario.pk}'
+
+
+def fijar_primaria(usuario):
+    """Después de una escritura, `usuario` lee de `default` durante `REPLICA_VENTANA` segundos."""
+    caches[USUARIOS_CACHE].set(_clave(usuario), True, settings.REPLICA_VENTANA)
+
+
+async def afijar_primaria(usuario):
+    """`fijar_primaria` por la API async de la caché."""
+    await caches[USUARIOS_CACHE].aset(_clave(usuario), True, settings.REPLICA_VENTANA)
+
+
+def _reciente(modificado):
+    return modificado is not None and time.time() - modificado < settings.REPLICA_VENTANA
+
+
+def _autenticado(usuario):
+    return usuario is not None and usuario.is_authenticated
+
+
+@contextmanager
+def lecturas_en_replica(usuario=None, modificado=None):
+    """
+    Manda a la réplica las lecturas del bloque, salvo que `usuario` haya escrito
+    hace poco o que los datos se hayan modificado (`modificado`, timestamp) hace
+    menos de `REPLICA_VENTANA` segundos: la réplica puede no tenerlos todavía.
+    """
+    usar = settings.REPLICA_LECTURAS and not _reciente(modificado) and not (
+        _autenticado(usuario) and caches[USUARIOS_CACHE].get(_clave(usuario))
+    )
+    token = _en_replica.set(usar)
+    try:
+        yield usar
+    finally:
+        _en_replica.reset(token)
+
+
+@asynccontextmanager
+async def alecturas_en_replica(usuario=None, modificado=None):
+    """`lecturas_en_replica` por la API async de la caché."""
+    usar = settings.REPLICA_LECTURAS and not _reciente(modificado) and not (
+        _autenticado(usuario) and await caches[USUARIOS_CACHE].aget(_clave(usuario))
+    )
+    token = _en_replica.set(usar)
+    try:
+        yield usar
+    finally:
+        _en_replica.reset(token)
+
+
+class LecturasEnReplicaMixin:
+    """Para vistas DRF de solo lectura: los GET del usuario autenticado van a la réplica."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if request.method in ('GET', 'HEAD'):
+            self._lecturas = lecturas_en_replica(request.user)
+            self._lecturas.__enter__()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        lecturas = getattr(self, '_lecturas', None)
+        if lecturas is not None:
+            self._lecturas = None
+            lecturas.__exit__(None, None, None)
+        return super().finalize_response(request, response, *args, **kwargs)
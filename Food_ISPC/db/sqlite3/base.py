@@ -0,0 +1,17 @@
+"""
+Backend SQLite de Django para la base local (`DB_ENGINE=sqlite`) cuyas
+transacciones toman el lock de escritura al empezar, como `SELECT ... FOR
+UPDATE` en MySQL.
+"""
+from django.db.backends.sqlite3 import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    Con el `BEGIN` diferido, una transacción que lee y después escribe falla con
+    "database is locked" si otra escribió entre medio, sin esperar el `timeout`.
+    `BEGIN IMMEDIATE` la hace esperar su turno desde el principio.
+    """
+
+    def _start_transaction_under_autocommit(self):
+        self.cursor().execute('BEGIN IMMEDIATE')
@@ -0,0 +1,13 @@
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from Food_ISPC.db.pool import estadisticas
+
+
+class MetricasConexionesView(APIView):
+    """Estado de los pools de conexiones de este worker, por alias de base."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(estadisticas())
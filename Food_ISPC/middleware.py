@@ -0,0 +1,294 @@
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.utils.cache import patch_vary_headers
+from django.utils.functional import SimpleLazyObject, empty
+from django.utils.text import compress_string
+
+from Food_ISPC.db.replica import afijar_primaria, fijar_primaria
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+_LISTA_PARAMETROS = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+_LITERALES = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_ESPACIOS = re.compile(r'\s+')
+
+
+def huella_sql(sql):
+    """Normaliza una sentencia para agrupar las que solo cambian en sus valores."""
+    sql = _LISTA_PARAMETROS.sub('(?)', sql)
+    sql = _LITERALES.sub('?', sql).replace('%s', '?')
+    return _ESPACIOS.sub(' ', sql).strip()
+
+
+class RegistroConsultas:
+    """`execute_wrapper` que mide cada sentencia ejecutada durante el request."""
+
+    def __init__(self):
+        self.cantidad = 0
+        self.duracion = 0.0
+        self.mas_lenta = (0.0, '')
+        self.huellas = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        inicio = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duracion = time.perf_counter() - inicio
+            self.cantidad += 1
+            self.duracion += duracion
+            if duracion > self.mas_lenta[0]:
+                self.mas_lenta = (duracion, sql)
+            if not sql.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+                self.huellas[huella_sql(sql)] += 1
+
+
+class MiddlewareSincronoAsincrono:
+    """
+    Base de los middlewares del proyecto: corren en el modo de la cadena (WSGI
+    o ASGI) y Django no tiene que adaptarlos con `sync_to_async`, que bajo
+    ASGI ocupa un hilo por request. Las subclases implementan `procesar` y
+    `aprocesar`.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.aprocesar(request)
+        return self.procesar(request)
+
+
+# El registro del request en curso. Es una variable de contexto y no un
+# `execute_wrapper` por request porque bajo ASGI las consultas corren en los
+# hilos de `sync_to_async`, cada uno con sus conexiones, y el contexto los sigue.
+_registro_actual = ContextVar('registro_consultas', default=None)
+
+
+def medir_consulta(execute, sql, params, many, context):
+    registro = _registro_actual.get()
+    if registro is None:
+        return execute(sql, params, many, context)
+    return registro(execute, sql, params, many, context)
+
+
+def instalar_medicion(connection, **kwargs):
+    if medir_consulta not in connection.execute_wrappers:
+        connection.execute_wrappers.append(medir_consulta)
+
+
+class InstrumentacionSQLMiddleware(MiddlewareSincronoAsincrono):
+    """
+    Mide por request la cantidad de consultas, el tiempo total en SQL, la
+    sentencia más lenta y el tiempo de la vista. Lo devuelve en `Server-Timing`
+    y en una línea de log JSON, marcando como posible N+1 las sentencias que se
+    repiten con la misma huella.
+
+    Deshabilitado (por defecto) Django lo quita de la cadena de middlewares y
+    no agrega costo; `SQL_INSTRUMENTACION_MUESTREO` instrumenta solo una fracción.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'SQL_INSTRUMENTACION', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.muestreo = getattr(settings, 'SQL_INSTRUMENTACION_MUESTREO', 1.0)
+        self.umbral_repetidas = getattr(settings, 'SQL_INSTRUMENTACION_REPETIDAS', 3)
+        # Las conexiones que se abran desde ahora, en cualquier hilo, y las ya abiertas en este
+        connection_created.connect(instalar_medicion, dispatch_uid='instrumentacion_sql')
+        for conexion in connections.all(initialized_only=True):
+            instalar_medicion(conexion)
+
+    def procesar(self, request):
+        if self.muestreo < 1.0 and random.random() >= self.muestreo:
+            return self.get_response(request)
+
+        registro = RegistroConsultas()
+        token = _registro_actual.set(registro)
+        inicio = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _registro_actual.reset(token)
+        return self.reportar(request, response, registro, time.perf_counter() - inicio)
+
+    async def aprocesar(self, request):
+        if self.muestreo < 1.0 and random.random() >= self.muestreo:
+            return await self.get_response(request)
+
+        registro = RegistroConsultas()
+        token = _registro_actual.set(registro)
+        inicio = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _registro_actual.reset(token)
+        return self.reportar(request, response, registro, time.perf_counter() - inicio)
+
+    def reportar(self, request, response, registro, total):
+        repetidas = [
+            {'sql': huella, 'veces': veces}
+            for huella, veces in registro.huellas.most_common()
+            if veces >= self.umbral_repetidas
+        ]
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={registro.duracion * 1000:.2f};desc="{registro.cantidad} consultas"',
+            f'sql-lenta;dur={registro.mas_lenta[0] * 1000:.2f}',
+            f'app;dur={(total - registro.duracion) * 1000:.2f}',
+            f'total;dur={total * 1000:.2f}',
+        ])
+
+        datos = {
+            'metodo': request.method,
+            'ruta': request.path,
+            'estado': response.status_code,
+            'consultas': registro.cantidad,
+            'sql_ms': round(registro.duracion * 1000, 2),
+            'vista_ms': round(total * 1000, 2),
+            'mas_lenta': {'ms': round(registro.mas_lenta[0] * 1000, 2), 'sql': huella_sql(registro.mas_lenta[1])},
+            'repetidas': repetidas,
+        }
+        if repetidas:
+            logger.warning('posible N+1 %s', json.dumps(datos, ensure_ascii=False))
+        else:
+            logger.info('sql %s', json.dumps(datos, ensure_ascii=False))
+        return response
+
+
+class LeerPropiasEscriturasMiddleware(MiddlewareSincronoAsincrono):
+    """
+    Con réplica de lectura, el usuario que acaba de escribir (cualquier POST,
+    PUT, PATCH o DELETE exitoso) lee de `default` durante `REPLICA_VENTANA`
+    segundos, así ve sus propios cambios aunque la réplica venga atrasada.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'REPLICA_LECTURAS', False):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+
+    @staticmethod
+    def es_escritura(request, response):
+        return request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400
+
+    def procesar(self, request):
+        response = self.get_response(request)
+        # DRF deja en el request el usuario que autenticó por JWT
+        usuario = getattr(request, 'user', None)
+        if self.es_escritura(request, response) and usuario is not None and usuario.is_authenticated:
+            fijar_primaria(usuario)
+        return response
+
+    async def aprocesar(self, request):
+        response = await self.get_response(request)
+        usuario = getattr(request, 'user', None)
+        if not self.es_escritura(request, response) or usuario is None:
+            return response
+        # Si nadie lo reemplazó sigue siendo el usuario perezoso de la sesión, que va al ORM
+        if isinstance(usuario, SimpleLazyObject) and usuario._wrapped is empty:
+            autenticado = await sync_to_async(lambda: usuario.is_authenticated)()
+        else:
+            autenticado = usuario.is_authenticated
+        if autenticado:
+            await afijar_primaria(usuario)
+        return response
+
+
+_TIPOS_COMPRIMIBLES = re.compile(r'^(text/|application/(json|javascript|xml|msgpack)|[^;]*\+json)')
+
+
+def elegir_codificacion(accept_encoding, disponibles):
+    """
+    La codificación de `disponibles` (en orden de preferencia del servidor) con
+    mayor `q` en `Accept-Encoding`, o `None` si el cliente no acepta ninguna.
+    """
+    aceptadas = {}
+    for parte in accept_encoding.split(','):
+        nombre, _, parametros = parte.partition(';')
+        calidad = re.search(r'q\s*=\s*([0-9.]+)', parametros)
+        try:
+            aceptadas[nombre.strip().lower()] = float(calidad.group(1)) if calidad else 1.0
+        except ValueError:
+            continue
+    mejor, mejor_calidad = None, 0
+    for codificacion in disponibles:
+        calidad = aceptadas.get(codificacion, aceptadas.get('*', 0))
+        if calidad > mejor_calidad:
+            mejor, mejor_calidad = codificacion, calidad
+    return mejor
+
+
+class CompresionMiddleware(MiddlewareSincronoAsincrono):
+    """
+    Comprime las respuestas con brotli o gzip según lo que acepte el cliente,
+    solo si pasan de `COMPRESION_MINIMO` bytes: en las chicas no se gana nada.
+    brotli es opcional (`pip install brotli`); sin él se usa gzip.
+
+    No toca las respuestas en streaming: el SSE de eventos tiene que salir
+    evento por evento y bajo ASGI su iterador es async, no se consume acá. Ni
+    las del admin, que llevan el token CSRF en el HTML (ver BREACH); la API se
+    autentica por cabecera, no por cookie.
+    """
+    excluir = ('/admin/',)
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'COMPRESION', True):
+            raise MiddlewareNotUsed
+        super().__init__(get_response)
+        self.minimo = getattr(settings, 'COMPRESION_MINIMO', 1024)
+        self.calidad_brotli = getattr(settings, 'COMPRESION_BROTLI_CALIDAD', 4)
+        self.disponibles = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    def procesar(self, request):
+        return self.comprimir(request, self.get_response(request))
+
+    async def aprocesar(self, request):
+        return self.comprimir(request, await self.get_response(request))
+
+    def comprimir(self, request, response):
+        if (response.streaming or response.has_header('Content-Encoding')
+                or len(response.content) < self.minimo or request.path.startswith(self.excluir)
+                or not _TIPOS_COMPRIMIBLES.match(response.get('Content-Type', ''))):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        codificacion = elegir_codificacion(request.META.get('HTTP_ACCEPT_ENCODING', ''), self.disponibles)
+        if codificacion == 'br':
+            comprimido = brotli.compress(response.content, quality=self.calidad_brotli)
+        elif codificacion == 'gzip':
+            comprimido = compress_string(response.content, max_random_bytes=100)
+        else:
+            return response
+        if len(comprimido) >= len(response.content):
+            return response
+
+        response.content = comprimido
+        response['Content-Length'] = str(len(comprimido))
+        response['Content-Encoding'] = codificacion
+        # El ETag fuerte pasa a débil: el cuerpo ya no es el mismo byte a byte
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
+
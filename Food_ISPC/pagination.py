@@ -0,0 +1,45 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PaginacionCursor(CursorPagination):
+    """
+    Paginación por cursor (keyset) sobre la clave primaria: cada página es un
+    `WHERE pk > cursor ORDER BY pk LIMIT n`, así el costo no depende de cuántas
+    filas haya antes. Con `?sin_paginar=true` se devuelve la forma sin paginar.
+
+    Con `a_pedido` (las rutas que ya existían sin paginar) la forma de siempre
+    sigue siendo la de por defecto y solo se pagina si el cliente lo pide con
+    `?page_size=` o `?cursor=`.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    parametro_sin_paginar = 'sin_paginar'
+    a_pedido = False
+
+    def sin_paginar(self, request):
+        valor = request.query_params.get(self.parametro_sin_paginar, '')
+        if valor.lower() in ('1', 'true', 'si'):
+            return True
+        return self.a_pedido and not (
+            self.page_size_query_param in request.query_params or self.cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.sin_paginar(request):
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+
+class PaginacionProductos(PaginacionCursor):
+    ordering = 'id_producto'
+    page_size = 50
+
+
+class PaginacionCatalogo(PaginacionProductos):
+    a_pedido = True
+
+
+class PaginacionPedidos(PaginacionCursor):
+    ordering = '-id_pedidos'
+    a_pedido = True
@@ -0,0 +1,20 @@
+"""Datos de prueba compartidos por los tests de las apps."""
+from appFOOD.models import CategoriaProducto, Producto
+from appUSERS.models import Usuario
+
+
+def crear_usuario(email='cliente@test.com', **extra):
+    return Usuario.objects.create_user(
+        email=email, password='clave-segura-123', nombre='Cliente',
+        apellido='Test', telefono='123456', **extra
+    )
+
+
+def crear_producto(stock=10, precio=100.0, nombre='Hamburguesa'):
+    categoria, _ = CategoriaProducto.objects.get_or_create(
+        nombre_categoria='Comidas', descripcion='Platos'
+    )
+    return Producto.objects.create(
+        nombre_producto=nombre, descripcion='Rica', precio=precio,
+        stock=stock, id_categoria=categoria,
+    )
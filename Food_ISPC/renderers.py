@@ -0,0 +1,100 @@
+"""
+Renderers y parsers de la API.
+
+`JSONRapidoRenderer` y `JSONRapidoParser` hacen lo mismo que los de DRF con
+orjson: las fechas y horas de los pedidos y los montos (floats) los escribe
+orjson sin pasar por Python, y la salida es la misma que la de `JSONRenderer`.
+Sin orjson instalado usan el módulo `json` como DRF.
+
+`MessagePackRenderer` y `MessagePackParser` sirven `application/msgpack` a los
+clientes nativos que lo pidan en `Accept`/`Content-Type`. Requieren `msgpack`
+(opcional); las fechas y horas viajan como texto ISO 8601, igual que en JSON.
+"""
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+MEDIA_TYPE_MSGPACK = 'application/msgpack'
+
+# Lo que ni orjson ni msgpack saben escribir (Decimal, textos lazy, QuerySet,
+# ...) lo convierte el encoder de DRF, así queda igual que con JSONRenderer
+_convertir = JSONEncoder().default
+
+
+class JSONRapidoRenderer(JSONRenderer):
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        # orjson solo indenta de a 2: la API navegable y `indent=` van por json
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        contenido = orjson.dumps(data, default=_convertir, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        # Como DRF, se escapan U+2028 y U+2029 para que sea un subconjunto de JavaScript
+        if b'\xe2\x80\xa8' in contenido or b'\xe2\x80\xa9' in contenido:
+            contenido = contenido.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return contenido
+
+
+class JSONRapidoParser(JSONParser):
+    renderer_class = JSONRapidoRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if orjson is None:
+            return super().parse(stream, media_type, parser_context)
+        encoding = (parser_context or {}).get('encoding', 'utf-8')
+        try:
+            contenido = stream.read()
+            if encoding.lower().replace('-', '') != 'utf8':
+                contenido = contenido.decode(encoding)
+            return orjson.loads(contenido)
+        except (ValueError, LookupError) as exc:
+            raise ParseError(f'JSON parse error - {exc}')
+
+
+class MessagePackRenderer(BaseRenderer):
+    media_type = MEDIA_TYPE_MSGPACK
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=_convertir, use_bin_type=True)
+
+
+class MessagePackParser(BaseParser):
+    media_type = MEDIA_TYPE_MSGPACK
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False)
+        except (ValueError, msgpack.UnpackException) as exc:
+            raise ParseError(f'MessagePack parse error - {exc}')
+
+
+def renderer_para(request):
+    """
+    El renderer de una respuesta de las vistas async: MessagePack si está
+    habilitado y el cliente lo pide en `Accept`, si no JSON.
+    """
+    if MessagePackRenderer in api_settings.DEFAULT_RENDERER_CLASSES:
+        aceptados = {parte.split(';')[0].strip().lower() for parte in request.headers.get('Accept', '').split(',')}
+        if MEDIA_TYPE_MSGPACK in aceptados:
+            return MessagePackRenderer()
+    return JSONRapidoRenderer()
+
@@ -12,9 +12,11 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+import importlib.util
 import os
 from dotenv import load_dotenv
 from datetime import timedelta
+from corsheaders.defaults import default_headers
 
 # Cargar variables de entorno
 load_dotenv()
@@ -83,6 +85,11 @@ LOGGING = {
             'level': 'INFO',
             'propagate': True,
         },
+        'Food_ISPC': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': True,
+        },
     },
 }
 
@@ -103,9 +110,12 @@ INSTALLED_APPS = [
     'appUSERS.apps.AppusersConfig',
     'appFOOD.apps.AppfoodConfig',
     'appCART.apps.AppcartConfig',
+    'appTAREAS.apps.AppTareasConfig',
 ]
 
 MIDDLEWARE = [
+    'Food_ISPC.middleware.InstrumentacionSQLMiddleware',
+    'Food_ISPC.middleware.CompresionMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -114,9 +124,22 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',    
+    'Food_ISPC.middleware.LeerPropiasEscriturasMiddleware',
 ]
 
 CORS_ALLOW_CREDENTIALS = True
+# Los clientes mandan Idempotency-Key en las escrituras del carrito
+CORS_ALLOW_HEADERS = (*default_headers, 'idempotency-key')
+
+# Instrumentación SQL por request (Server-Timing + log JSON). Opt-in; en
+# producción conviene muestrear una fracción de los requests (0.0 a 1.0).
+SQL_INSTRUMENTACION = os.getenv('SQL_INSTRUMENTACION', 'False').lower() == 'true'
+SQL_INSTRUMENTACION_MUESTREO = float(os.getenv('SQL_INSTRUMENTACION_MUESTREO', '1.0'))
+SQL_INSTRUMENTACION_REPETIDAS = int(os.getenv('SQL_INSTRUMENTACION_REPETIDAS', '3'))
+
+# Vistas de lectura async (catálogo, carrito, dashboard, detalle, perfil). Las
+# activa Food_ISPC/asgi.py; bajo WSGI se sirven las vistas DRF sincrónicas.
+VISTAS_ASINCRONAS = os.getenv('VISTAS_ASINCRONAS', 'False').lower() == 'true'
 
 # Security Settings
 SECURE_SSL_REDIRECT = not DEBUG  # Solo en producción
@@ -167,9 +190,15 @@ WSGI_APPLICATION = 'Food_ISPC.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
+# Conexiones: por defecto cada hilo conserva la suya DB_CONN_MAX_AGE segundos y
+# Django la verifica antes de reusarla. Con DB_POOL_TAMANIO los hilos de cada
+# worker se reparten un pool acotado (Food_ISPC/db/pool.py) y devuelven la
+# conexión al terminar cada request.
+DB_POOL_TAMANIO = int(os.getenv('DB_POOL_TAMANIO', '0'))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        'ENGINE': 'Food_ISPC.db.mysql',
         'NAME': os.getenv('DB_NAME'),
         'USER': os.getenv('DB_USER'),
         'PASSWORD': os.getenv('DB_PASSWORD'),
@@ -178,10 +207,106 @@ DATABASES = {
         'OPTIONS': {
             'sql_mode': 'traditional',
         },
+        'CONN_MAX_AGE': 0 if DB_POOL_TAMANIO else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'tamanio': DB_POOL_TAMANIO,
+            'espera': float(os.getenv('DB_POOL_ESPERA', '5')),
+            'vida': int(os.getenv('DB_POOL_VIDA', '3600')),
+            'verificar_cada': int(os.getenv('DB_POOL_VERIFICAR_CADA', '10')),
+        } if DB_POOL_TAMANIO else None,
+    }
+}
+
+# Réplica de lectura (opcional): recibe el catálogo, el dashboard y el detalle de
+# pedidos (Food_ISPC/db/replica.py). Hereda la configuración de `default`.
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'USER': os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'TEST': {
+            'MIRROR': 'default',
+        },
+    }
+
+# Base local para tests y benchmarks sin depender del MySQL remoto (DB_ENGINE=sqlite).
+# La base de tests es un archivo para que los tests de concurrencia usen conexiones reales.
+if os.getenv('DB_ENGINE') == 'sqlite':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'Food_ISPC.db.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+            'OPTIONS': {
+                'timeout': 20,
+            },
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db.sqlite3',
+            },
+        },
+        # Hace de réplica en los tests (con REPLICA_LECTURAS); no se replica sola
+        'replica': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db_replica.sqlite3',
+            'OPTIONS': {
+                'timeout': 20,
+            },
+            'TEST': {
+                'NAME': BASE_DIR / 'test_db_replica.sqlite3',
+            },
+        },
     }
+
+DATABASE_ROUTERS = ['Food_ISPC.db.replica.RouterReplica']
+REPLICA_LECTURAS = os.getenv('REPLICA_LECTURAS', str(bool(os.getenv('DB_REPLICA_HOST')))).lower() == 'true'
+# Atraso máximo esperado de la réplica: quien escribe lee de `default` durante este tiempo
+REPLICA_VENTANA = float(os.getenv('REPLICA_VENTANA', '5'))
+
+
+# Caché del catálogo de productos (appFOOD). Por defecto en memoria de cada
+# proceso; con varios workers conviene un backend compartido para que la
+# invalidación llegue a todos, p. ej.:
+#   CATALOGO_CACHE_BACKEND=django.core.cache.backends.redis.RedisCache
+#   CATALOGO_CACHE_LOCATION=redis://127.0.0.1:6379/1
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'catalogo': {
+        'BACKEND': os.getenv('CATALOGO_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('CATALOGO_CACHE_LOCATION', 'catalogo'),
+        'TIMEOUT': int(os.getenv('CATALOGO_CACHE_TTL', '300')),
+        'OPTIONS': {
+            'MAX_ENTRIES': 1000,
+        },
+    },
+    # Usuarios autenticados por JWT, para no consultarlos en cada request (ver
+    # USUARIOS_CACHE_ACTIVA), y las marcas de lectura en la principal de la réplica.
+    'usuarios': {
+        'BACKEND': os.getenv('USUARIOS_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('USUARIOS_CACHE_LOCATION', 'usuarios'),
+        'TIMEOUT': int(os.getenv('USUARIOS_CACHE_TTL', '5')),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('USUARIOS_CACHE_MAX', '5000')),
+        },
+    },
 }
 
 
+# Las invalidaciones de la caché `usuarios` (una baja, un cambio de contraseña)
+# solo llegan a los demás procesos con un backend compartido. Con la memoria local
+# y varios workers (WEB_CONCURRENCY, el que gunicorn usa si no se pasa -w) los
+# usuarios no se cachean: otro worker podría seguir autenticando a uno dado de baja.
+WEB_CONCURRENCY = int(os.getenv('WEB_CONCURRENCY', '1'))
+USUARIOS_CACHE_ACTIVA = 'locmem' not in CACHES['usuarios']['BACKEND'].lower() or WEB_CONCURRENCY <= 1
+
+# Lo que el carrito reserva o vende renueva el catálogo cacheado como mucho una vez
+# cada CATALOGO_DEMORA_STOCK segundos (ver appFOOD/cache.py); editar un producto
+# lo renueva enseguida.
+CATALOGO_DEMORA_STOCK = int(os.getenv('CATALOGO_DEMORA_STOCK', '5'))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -200,6 +325,21 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# Los hashes se calculan en un pool acotado (appUSERS/hashers.py): pasado el
+# límite el login responde 503 enseguida. Cada hash en cola tiene un hilo de
+# request esperando, por eso PASSWORD_HASH_COLA es 0 por defecto. Cambiar las
+# iteraciones rehashea cada contraseña en su siguiente login correcto.
+PASSWORD_HASHERS = [
+    'appUSERS.hashers.PBKDF2Acotado',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'django.contrib.auth.hashers.ScryptPasswordHasher',
+]
+PASSWORD_HASH_HILOS = int(os.getenv('PASSWORD_HASH_HILOS', str(os.cpu_count() or 2)))
+PASSWORD_HASH_COLA = int(os.getenv('PASSWORD_HASH_COLA', '0'))
+PASSWORD_HASH_ITERACIONES = int(os.getenv('PASSWORD_HASH_ITERACIONES', '0')) or None
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/4.2/topics/i18n/
@@ -225,10 +365,27 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'appUSERS.Usuario'
 
+# JSON con orjson (Food_ISPC/renderers.py): misma salida que el JSONRenderer de
+# DRF, más rápido en los listados grandes. Con API_MSGPACK y `msgpack` instalado
+# (opcional), los clientes que manden `Accept: application/msgpack` reciben
+# MessagePack, y pueden enviar el cuerpo con ese Content-Type.
+API_MSGPACK = os.getenv('API_MSGPACK', 'True').lower() == 'true' and importlib.util.find_spec('msgpack') is not None
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'appUSERS.autenticacion.JWTAuthenticationCacheada',
     ),
+    'DEFAULT_RENDERER_CLASSES': [
+        'Food_ISPC.renderers.JSONRapidoRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        *(['Food_ISPC.renderers.MessagePackRenderer'] if API_MSGPACK else []),
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'Food_ISPC.renderers.JSONRapidoParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+        *(['Food_ISPC.renderers.MessagePackParser'] if API_MSGPACK else []),
+    ],
 }
 
 SIMPLE_JWT = {
@@ -252,8 +409,65 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
     'TOKEN_USER_CLASS': 'rest_framework_simplejwt.models.TokenUser',
     'JTI_CLAIM': 'jti',
+    'TOKEN_REFRESH_SERIALIZER': 'appUSERS.serializers.RefreshFiltradoSerializer',
 }
 
+# Filtro en memoria de la blacklist de refresh tokens (appUSERS/tokens.py). Un
+# token que otro worker acaba de poner en la blacklist puede pasar en este hasta
+# TOKENS_FILTRO_SINCRONIZACION segundos; con 0 se sincroniza en cada chequeo.
+TOKENS_FILTRO_SINCRONIZACION = float(os.getenv('TOKENS_FILTRO_SINCRONIZACION', '2'))
+TOKENS_FILTRO_RECONSTRUCCION = int(os.getenv('TOKENS_FILTRO_RECONSTRUCCION', '3600'))
+TOKENS_FILTRO_CAPACIDAD = int(os.getenv('TOKENS_FILTRO_CAPACIDAD', '100000'))
+
+# Segundos que un carrito retiene el stock reservado de cada línea desde la
+# última vez que se tocó; después el barrido (liberar_reservas) lo devuelve.
+RESERVA_DURACION = int(os.getenv('RESERVA_DURACION', '900'))
+
+# Idempotency-Key en las escrituras del carrito: cuánto se guarda cada respuesta,
+# cuánto retiene la clave un request en curso (si se cae, se libera al vencer) y
+# cuánto espera un reintento concurrente antes de responder 409.
+IDEMPOTENCIA_TTL = int(os.getenv('IDEMPOTENCIA_TTL', '86400'))
+IDEMPOTENCIA_BLOQUEO = int(os.getenv('IDEMPOTENCIA_BLOQUEO', '60'))
+IDEMPOTENCIA_ESPERA = float(os.getenv('IDEMPOTENCIA_ESPERA', '5'))
+
+# Cola de tareas (appTAREAS): intentos antes de dejar una tarea muerta, backoff
+# exponencial entre reintentos (base y tope, en segundos), cuánto retiene un
+# worker cada tarea antes de que otro pueda tomarla y cuánto se guardan las hechas.
+TAREAS_MAX_INTENTOS = int(os.getenv('TAREAS_MAX_INTENTOS', '5'))
+TAREAS_BACKOFF = float(os.getenv('TAREAS_BACKOFF', '10'))
+TAREAS_BACKOFF_MAXIMO = float(os.getenv('TAREAS_BACKOFF_MAXIMO', '3600'))
+TAREAS_DURACION = int(os.getenv('TAREAS_DURACION', '300'))
+TAREAS_RETENCION = int(os.getenv('TAREAS_RETENCION', '604800'))
+
+# Eventos de estado de los pedidos (appCART/eventos/). El broker por defecto los
+# guarda en la base y cada proceso la sondea cada EVENTOS_SONDEO segundos mientras
+# tenga suscriptores; BrokerEnMemoria solo admite un proceso (WEB_CONCURRENCY=1).
+# Cuántos eventos por usuario guarda BrokerEnMemoria para retomar desde un cursor,
+# por cuántos segundos se guardan los eventos, cuánto espera el long-poll, cada
+# cuánto se manda un latido por el SSE y cuánto dura cada conexión SSE antes de
+# que el cliente se reconecte.
+EVENTOS_BROKER = os.getenv('EVENTOS_BROKER', 'appCART.eventos.BrokerBaseDeDatos')
+EVENTOS_SONDEO = float(os.getenv('EVENTOS_SONDEO', '1'))
+EVENTOS_HISTORIAL = int(os.getenv('EVENTOS_HISTORIAL', '100'))
+EVENTOS_RETENCION = int(os.getenv('EVENTOS_RETENCION', '600'))
+EVENTOS_LONG_POLL = float(os.getenv('EVENTOS_LONG_POLL', '25'))
+EVENTOS_LATIDO = float(os.getenv('EVENTOS_LATIDO', '15'))
+EVENTOS_DURACION = float(os.getenv('EVENTOS_DURACION', '300'))
+
+# Índice de trigramas de los nombres de productos en memoria para
+# /api/producto/buscar/ (appFOOD/busqueda.py). Ocupa memoria en cada proceso;
+# si una búsqueda tiene más candidatos que BUSQUEDA_INDICE_MAXIMO va por SQL.
+BUSQUEDA_INDICE = os.getenv('BUSQUEDA_INDICE', 'False').lower() == 'true'
+BUSQUEDA_INDICE_MAXIMO = int(os.getenv('BUSQUEDA_INDICE_MAXIMO', '1000'))
+
+# Compresión de las respuestas (Food_ISPC/middleware.py): brotli si está
+# instalado y el cliente lo acepta, si no gzip. Las respuestas de menos de
+# COMPRESION_MINIMO bytes salen sin comprimir. Calidad de brotli de 0 a 11; 4
+# comprime casi como gzip -9 y es mucho más rápido, lo justo para respuestas dinámicas.
+COMPRESION = os.getenv('COMPRESION', 'True').lower() == 'true'
+COMPRESION_MINIMO = int(os.getenv('COMPRESION_MINIMO', '1024'))
+COMPRESION_BROTLI_CALIDAD = int(os.getenv('COMPRESION_BROTLI_CALIDAD', '4'))
+
 
 DEFAULT_FILE_STORAGE = 'cloudinary_storage.storage.MediaCloudinaryStorage'
 
@@ -0,0 +1,371 @@
+import gzip
+import json
+import sqlite3
+import threading
+import unittest
+from datetime import date, datetime, time, timezone as tz
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock
+
+from asgiref.sync import async_to_sync, iscoroutinefunction, sync_to_async
+from django.core.asgi import get_asgi_application
+from django.core.cache import caches
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import path
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from appCART.models import Carrito, DetallePedido, Pedido
+from appCART.services import agregar_producto, confirmar_pedido
+from appCART.views import (
+    AgregarProductoAlCarrito, ConfirmarPedido, VerCarritoAsincrono, VerDashboardAsincrono, VerDetallePedidoAsincrono,
+)
+from appFOOD.cache import CATALOGO_CACHE
+from appFOOD.models import CategoriaProducto, Producto
+from appUSERS.cache import USUARIOS_CACHE
+from appUSERS.models import Usuario
+from . import renderers
+from .db.pool import PoolAgotado, PoolConexiones
+from .db.replica import REPLICA
+from .middleware import CompresionMiddleware, InstrumentacionSQLMiddleware, brotli, elegir_codificacion, huella_sql
+from .pruebas import crear_producto, crear_usuario
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, SQL_INSTRUMENTACION=True, SQL_INSTRUMENTACION_MUESTREO=1.0)
+class InstrumentacionSQLTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_server_timing_y_log(self):
+        agregar_producto(self.usuario, crear_producto().pk, 1)
+        with self.assertLogs('Food_ISPC.middleware', 'INFO') as logs:
+            respuesta = self.client.get('/appCART/ver/')
+
+        self.assertRegex(respuesta['Server-Timing'], r'db;dur=[\d.]+;desc="1 consultas", sql-lenta;dur=[\d.]+, app;dur=')
+        self.assertIn('"consultas": 1', logs.output[0])
+
+    def test_marca_consultas_repetidas(self):
+        self.assertEqual(
+            huella_sql("SELECT * FROM producto WHERE id IN (%s, %s, %s) AND nombre = 'x' LIMIT 21"),
+            'SELECT * FROM producto WHERE id IN (?) AND nombre = ? LIMIT ?',
+        )
+
+        def vista_con_n_mas_1(request):
+            for producto_id in range(4):
+                Producto.objects.filter(pk=producto_id).exists()
+            return HttpResponse()
+
+        with self.assertLogs('Food_ISPC.middleware', 'WARNING') as logs:
+            InstrumentacionSQLMiddleware(vista_con_n_mas_1)(RequestFactory().get('/'))
+
+        self.assertIn('posible N+1', logs.output[0])
+        self.assertIn('"veces": 4', logs.output[0])
+
+    def test_asgi_mide_las_consultas_de_sync_to_async(self):
+        async def vista(request):
+            await sync_to_async(Producto.objects.exists)()
+            await Producto.objects.filter(pk=1).aexists()
+            return HttpResponse()
+
+        middleware = InstrumentacionSQLMiddleware(vista)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs('Food_ISPC.middleware', 'INFO') as logs:
+            respuesta = async_to_sync(middleware)(RequestFactory().get('/'))
+
+        self.assertIn('desc="2 consultas"', respuesta['Server-Timing'])
+        self.assertIn('"consultas": 2', logs.output[0])
+
+    @override_settings(SQL_INSTRUMENTACION=False)
+    def test_deshabilitado_no_agrega_cabeceras(self):
+        self.assertNotIn('Server-Timing', self.client.get('/appCART/ver/'))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, COMPRESION_MINIMO=200)
+class CompresionTests(TestCase):
+
+    def setUp(self):
+        caches[CATALOGO_CACHE].clear()
+        for i in range(10):
+            crear_producto(nombre=f'Producto {i}')
+        self.client = APIClient()
+
+    def test_elegir_codificacion(self):
+        self.assertEqual(elegir_codificacion('gzip, deflate, br', ('br', 'gzip')), 'br')
+        self.assertEqual(elegir_codificacion('br;q=0.5, gzip', ('br', 'gzip')), 'gzip')
+        self.assertEqual(elegir_codificacion('*;q=0.1, gzip;q=0', ('gzip',)), None)
+        self.assertEqual(elegir_codificacion('identity', ('br', 'gzip')), None)
+
+    def test_gzip_sobre_el_minimo(self):
+        plano = self.client.get('/api/producto/')
+        comprimido = self.client.get('/api/producto/', HTTP_ACCEPT_ENCODING='gzip')
+
+        self.assertNotIn('Content-Encoding', plano)
+        self.assertEqual(comprimido['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', comprimido['Vary'])
+        self.assertEqual(gzip.decompress(comprimido.content), plano.content)
+        self.assertEqual(comprimido['ETag'], 'W/' + plano['ETag'])
+        self.assertEqual(int(comprimido['Content-Length']), len(comprimido.content))
+
+        # Las respuestas chicas salen sin comprimir
+        chica = self.client.get('/api/producto/?page_size=1&fields=id_producto', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', chica)
+
+    @unittest.skipUnless(brotli, 'brotli no está instalado')
+    def test_brotli_si_el_cliente_lo_acepta(self):
+        plano = self.client.get('/api/producto/')
+        comprimido = self.client.get('/api/producto/', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(comprimido['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(comprimido.content), plano.content)
+
+    def test_no_comprime_streaming(self):
+        def vista(request):
+            return StreamingHttpResponse(iter(['x' * 1000]), content_type='text/event-stream')
+
+        respuesta = CompresionMiddleware(vista)(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertNotIn('Content-Encoding', respuesta)
+
+    def test_asgi_comprime_sin_adaptar(self):
+        async def vista(request):
+            return HttpResponse('x' * 1000, content_type='application/json')
+
+        async def eventos(request):
+            async def generar():
+                yield 'data: 1\n\n'
+            return StreamingHttpResponse(generar(), content_type='text/event-stream')
+
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip')
+        respuesta = async_to_sync(CompresionMiddleware(vista))(request)
+        self.assertEqual(respuesta['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(respuesta.content), b'x' * 1000)
+        respuesta = async_to_sync(CompresionMiddleware(eventos))(request)
+        self.assertNotIn('Content-Encoding', respuesta)
+        self.assertTrue(respuesta.is_async)
+
+    @override_settings(DEBUG=True, SQL_INSTRUMENTACION=True, REPLICA_LECTURAS=True, COMPRESION=True)
+    def test_asgi_ningun_middleware_se_adapta(self):
+        # Django avisa en DEBUG cada middleware que tiene que envolver. No sirve
+        # assertLogs: get_asgi_application() vuelve a configurar el logging.
+        with mock.patch('django.core.handlers.base.logger') as logger:
+            get_asgi_application()
+        adaptados = [llamada.args for llamada in logger.debug.call_args_list if 'adapted' in llamada.args[0]]
+        self.assertEqual(adaptados, [])
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class RenderizadoresTests(TestCase):
+    datos = {
+        'fecha_pedido': date(2024, 5, 1), 'hora_pedido': time(12, 30, 5, 123456),
+        'fecha_modificacion': datetime(2024, 5, 1, 15, 0, tzinfo=tz.utc), 'monto_total': 1234.5,
+        'precio': Decimal('10.25'), 'error': gettext_lazy('No encontrado.'), 'texto': 'Ñandú \u2028', 1: [0.1, None, True],
+    }
+
+    def test_misma_salida_que_drf(self):
+        for media_type in (None, 'application/json; indent=2'):
+            with self.subTest(media_type=media_type):
+                self.assertEqual(renderers.JSONRapidoRenderer().render(self.datos, media_type),
+                                 JSONRenderer().render(self.datos, media_type))
+
+    def test_parser(self):
+        contenido = JSONRenderer().render(self.datos)
+        self.assertEqual(renderers.JSONRapidoParser().parse(BytesIO(contenido)), JSONParser().parse(BytesIO(contenido)))
+        with self.assertRaises(ParseError):
+            renderers.JSONRapidoParser().parse(BytesIO(b'{"cantidad": NaN}'))
+
+        usuario = crear_usuario()
+        client = APIClient()
+        client.force_authenticate(usuario)
+        producto = crear_producto()
+        invalido = client.post(f'/appCART/agregar/{producto.pk}/', '{"cantidad": ', content_type='application/json')
+        self.assertEqual(invalido.status_code, 400)
+        valido = client.post(f'/appCART/agregar/{producto.pk}/', '{"cantidad": 2}', content_type='application/json')
+        self.assertEqual(valido.status_code, 200)
+
+    @unittest.skipUnless(renderers.msgpack, 'msgpack no está instalado')
+    def test_messagepack(self):
+        caches[USUARIOS_CACHE].clear()
+        usuario = crear_usuario(direccion='Calle 1')
+        agregar_producto(usuario, crear_producto().pk, 1)
+        client = APIClient()
+        client.force_authenticate(usuario)
+
+        respuesta = client.get('/appCART/ver_dashboard/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(respuesta['Content-Type'], 'application/msgpack')
+        self.assertEqual(renderers.msgpack.unpackb(respuesta.content), client.get('/appCART/ver_dashboard/').json())
+
+        request = RequestFactory().get('/appCART/ver_dashboard/', HTTP_ACCEPT='application/msgpack',
+                                       HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(usuario)}')
+        self.assertEqual(async_to_sync(VerDashboardAsincrono.as_view())(request).content, respuesta.content)
+
+        cuerpo = renderers.msgpack.packb({'cantidad': 2})
+        agregado = client.post(f'/appCART/agregar/{crear_producto(nombre="Otro").pk}/', cuerpo,
+                               content_type='application/msgpack')
+        self.assertEqual(agregado.status_code, 200)
+
+
+class PoolConexionesTests(TestCase):
+
+    def crear_pool(self, **opciones):
+        return PoolConexiones(
+            conectar=lambda: sqlite3.connect(':memory:', check_same_thread=False),
+            verificar=lambda conexion: conexion.execute('SELECT 1'),
+            **opciones,
+        )
+
+    def test_reusa_la_conexion_devuelta(self):
+        pool = self.crear_pool()
+        conexion = pool.tomar()
+        pool.devolver(conexion)
+        self.assertIs(pool.tomar(), conexion)
+        self.assertEqual(pool.estadisticas()['creadas'], 1)
+        self.assertEqual(pool.estadisticas()['en_uso'], 1)
+
+    def test_agotado_espera_y_falla(self):
+        pool = self.crear_pool(tamanio=1, espera=0.05)
+        conexion = pool.tomar()
+        with self.assertRaises(PoolAgotado):
+            pool.tomar()
+
+        threading.Timer(0.02, pool.devolver, args=(conexion,)).start()
+        self.assertIs(pool.tomar(), conexion)
+        estadisticas = pool.estadisticas()
+        self.assertEqual(estadisticas['agotado'], 1)
+        self.assertGreater(estadisticas['espera_maxima_ms'], 10)
+
+    def test_descarta_conexiones_caidas_o_con_errores(self):
+        pool = self.crear_pool(verificar_cada=0)
+        caida = pool.tomar()
+        pool.devolver(caida)
+        caida.close()
+        nueva = pool.tomar()
+        self.assertIsNot(nueva, caida)
+
+        pool.devolver(nueva, sana=False)
+        self.assertEqual(pool.estadisticas()['libres'], 0)
+        self.assertEqual(pool.estadisticas()['descartadas'], 2)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_metricas_solo_para_admin(self):
+        client = APIClient()
+        client.force_authenticate(crear_usuario())
+        self.assertEqual(client.get('/metricas/db/').status_code, 403)
+        client.force_authenticate(crear_usuario('admin@test.com', is_staff=True))
+        # La base de tests no usa el pool
+        self.assertEqual(client.get('/metricas/db/').json(), {})
+
+
+def replicar():
+    """Pone la réplica al día con `default`, como haría la replicación de MySQL."""
+    modelos = [Usuario, CategoriaProducto, Producto, Pedido, DetallePedido, Carrito]
+    for modelo in reversed(modelos):
+        modelo.objects.using(REPLICA).all().delete()
+    for modelo in modelos:
+        modelo.objects.using(REPLICA).bulk_create(modelo.objects.using('default').all())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, REPLICA_LECTURAS=True)
+class ReplicaLecturaTests(TestCase):
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        caches[USUARIOS_CACHE].clear()
+        caches[CATALOGO_CACHE].clear()
+        self.usuario = crear_usuario(direccion='Calle 1')
+        self.producto = crear_producto(stock=20)
+        agregar_producto(self.usuario, self.producto.pk, 2)
+        self.pedido = confirmar_pedido(self.usuario)
+        replicar()
+        self.token = f'Bearer {AccessToken.for_user(self.usuario)}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.token)
+
+    def pedidos(self):
+        return [pedido['id_pedidos'] for pedido in self.client.get('/appCART/ver_dashboard/?page_size=20').json()['results']]
+
+    def test_historial_y_detalle_se_leen_de_la_replica(self):
+        agregar_producto(self.usuario, self.producto.pk, 1)
+        nuevo = confirmar_pedido(self.usuario)
+
+        # La réplica todavía no tiene el pedido nuevo
+        self.assertEqual(self.pedidos(), [self.pedido.pk])
+        self.assertEqual(self.client.get(f'/appCART/detalle_pedido/{nuevo.pk}/').status_code, 404)
+        respuesta = async_to_sync(VerDashboardAsincrono.as_view())(
+            RequestFactory().get('/appCART/ver_dashboard/', HTTP_AUTHORIZATION=self.token)
+        )
+        self.assertEqual(len(json.loads(respuesta.content)['results']), 1)
+
+        replicar()
+        self.assertEqual(self.pedidos(), [nuevo.pk, self.pedido.pk])
+
+    def test_quien_escribe_lee_de_default(self):
+        self.assertEqual(self.client.post(f'/appCART/agregar/{self.producto.pk}/', {'cantidad': 1},
+                                          format='json').status_code, 200)
+        self.assertEqual(self.client.post('/appCART/confirmar/').status_code, 200)
+        self.assertEqual(len(self.pedidos()), 2)
+
+        # Vencida la ventana vuelve a la réplica, que sigue atrasada
+        caches[USUARIOS_CACHE].clear()
+        self.assertEqual(self.pedidos(), [self.pedido.pk])
+
+    def test_catalogo_recien_modificado_se_lee_de_default(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_producto(nombre='Empanada')
+        self.assertEqual(len(self.client.get('/api/producto/').json()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_producto(nombre='Pizza')
+        with override_settings(REPLICA_VENTANA=0):
+            self.assertEqual(len(self.client.get('/api/producto/').json()), 1)
+
+    @override_settings(REPLICA_LECTURAS=False)
+    def test_sin_replica_todo_va_a_default(self):
+        agregar_producto(self.usuario, self.producto.pk, 1)
+        confirmar_pedido(self.usuario)
+        self.assertEqual(len(self.pedidos()), 2)
+
+
+# Las vistas async que sirve `asgi.py`: `appCART/urls.py` elige el modo al importarse
+urlpatterns = [
+    path('appCART/agregar/<int:producto_id>/', AgregarProductoAlCarrito.as_view()),
+    path('appCART/confirmar/', ConfirmarPedido.as_view()),
+    path('appCART/ver/', VerCarritoAsincrono.as_view()),
+    path('appCART/detalle_pedido/<int:pedido_id>/', VerDetallePedidoAsincrono.as_view()),
+]
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, REPLICA_LECTURAS=True, ROOT_URLCONF=__name__)
+class ReplicaAsgiTests(TestCase):
+    databases = {'default', REPLICA}
+
+    def setUp(self):
+        caches[USUARIOS_CACHE].clear()
+        self.usuario = crear_usuario(direccion='Calle 1')
+        self.producto = crear_producto(stock=20)
+        replicar()
+        self.headers = {'authorization': f'Bearer {AccessToken.for_user(self.usuario)}'}
+
+    async def test_quien_escribe_lee_de_default_por_asgi(self):
+        respuesta = await self.async_client.post(f'/appCART/agregar/{self.producto.pk}/', {'cantidad': 2},
+                                                 content_type='application/json', headers=self.headers)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(await caches[USUARIOS_CACHE].aget(f'primaria:{self.usuario.pk}'))
+        carrito = await self.async_client.get('/appCART/ver/', headers=self.headers)
+        self.assertEqual(carrito.json()['cantidad_items'], 2)
+
+        self.assertEqual((await self.async_client.post('/appCART/confirmar/', headers=self.headers)).status_code, 200)
+        pedido = await Pedido.objects.filter(id_usuario=self.usuario).alatest('pk')
+        detalle = await self.async_client.get(f'/appCART/detalle_pedido/{pedido.pk}/', headers=self.headers)
+        self.assertEqual(detalle.status_code, 200)
+
+        # Sin la ventana la vista lee de la réplica, que no tiene el pedido
+        await caches[USUARIOS_CACHE].aclear()
+        detalle = await self.async_client.get(f'/appCART/detalle_pedido/{pedido.pk}/', headers=self.headers)
+        self.assertEqual(detalle.status_code, 404)
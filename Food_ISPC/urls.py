@@ -19,10 +19,15 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path,include
 
+from Food_ISPC.db.views import MetricasConexionesView
+from appTAREAS.views import MetricasTareasView
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('appUSERS/', include('appUSERS.urls')),
     path('api/producto/', include('appFOOD.urls')),
     path('appCART/', include('appCART.urls')),
+    path('metricas/db/', MetricasConexionesView.as_view(), name='metricas-db'),
+    path('metricas/tareas/', MetricasTareasView.as_view(), name='metricas-tareas'),
 
 ]
@@ -6,7 +6,7 @@ from .models import DetallePedido
 from .models import Carrito
 
 class PedidoAdmin(admin.ModelAdmin):
-    list_display = ( 'id_pedidos', 'id_usuario', 'fecha_pedido', 'hora_pedido', 'direccion_entrega')
+    list_display = ( 'id_pedidos', 'id_usuario', 'fecha_pedido', 'hora_pedido', 'direccion_entrega', 'monto_total', 'cantidad_unidades')
 
 class DetallePedidoAdmin(admin.ModelAdmin):
     list_display = ( 'id_pedido', 'id_producto', 'cantidad_productos', 'precio_producto')    
@@ -0,0 +1,301 @@
+"""
+Eventos de cambio de estado de los pedidos, para que el cliente se entere sin
+volver a pedir `ver_dashboard/`. Se publican al confirmar la transacción que
+cambió el pedido y se leen desde `appCART/eventos/` (SSE o long-poll).
+
+El broker por defecto guarda los eventos en la base (`BrokerBaseDeDatos`), así
+los ve cualquier worker sin importar cuál cambió el pedido. `BrokerEnMemoria`
+no consulta la base, pero solo sirve con un único proceso.
+"""
+import asyncio
+import itertools
+import json
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import EventoPedido
+
+
+# Cuánto espera el navegador antes de reconectarse cuando se corta el SSE
+RECONEXION_MS = 3000
+
+
+def _despertar(futuro):
+    if not futuro.done():
+        futuro.set_result(None)
+
+
+class BrokerEnMemoria:
+    """
+    Guarda los últimos `EVENTOS_HISTORIAL` eventos de cada usuario, con ids
+    crecientes, para que un cliente que se reconecta retome desde su cursor.
+    Los suscriptores esperan en un future de su event loop: mientras no haya
+    eventos no hacen nada, ni consultan la base.
+
+    Se publica desde hilos (vistas sync, el worker de tareas) y se espera desde
+    el loop ASGI, por eso el estado va bajo un lock y los futures se resuelven
+    con `call_soon_threadsafe`.
+
+    Los eventos publicados en un proceso no llegan a los demás: con más de un
+    worker (`WEB_CONCURRENCY`) se rechaza la configuración.
+    """
+
+    def __init__(self, historial=None, retencion=None):
+        if settings.WEB_CONCURRENCY > 1:
+            raise ImproperlyConfigured(
+                'BrokerEnMemoria no comparte eventos entre procesos: con WEB_CONCURRENCY > 1 '
+                'usar appCART.eventos.BrokerBaseDeDatos.'
+            )
+        self.historial = historial or settings.EVENTOS_HISTORIAL
+        self.retencion = retencion or settings.EVENTOS_RETENCION
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._ultimo = 0
+        self._eventos = {}
+        self._esperando = {}
+        # Último id que ya no se puede entregar, por usuario y en general
+        self._descartado = {}
+        self._horizonte = 0
+        self._proxima_depuracion = time.monotonic() + self.retencion
+
+    def ultimo_id(self):
+        return self._ultimo
+
+    def publicar(self, usuario_id, datos):
+        with self._lock:
+            self._ultimo = id_evento = next(self._ids)
+            eventos = self._eventos.setdefault(usuario_id, deque())
+            eventos.append((id_evento, time.monotonic(), datos))
+            if len(eventos) > self.historial:
+                self._descartado[usuario_id] = eventos.popleft()[0]
+            esperando = self._esperando.pop(usuario_id, ())
+            self._depurar()
+        for loop, futuro in esperando:
+            try:
+                loop.call_soon_threadsafe(_despertar, futuro)
+            except RuntimeError:
+                # El loop del suscriptor ya cerró
+                pass
+        return id_evento
+
+    def _depurar(self):
+        # Olvida a los usuarios sin eventos recientes ni suscriptores
+        ahora = time.monotonic()
+        if ahora < self._proxima_depuracion:
+            return
+        self._proxima_depuracion = ahora + self.retencion
+        limite = ahora - self.retencion
+        for usuario_id, eventos in list(self._eventos.items()):
+            if eventos[-1][1] < limite and usuario_id not in self._esperando:
+                self._horizonte = max(self._horizonte, eventos[-1][0])
+                del self._eventos[usuario_id]
+                self._descartado.pop(usuario_id, None)
+
+    def despues(self, usuario_id, desde):
+        """
+        `(eventos, resincronizar)`: los eventos `(id, datos)` del usuario
+        posteriores a `desde`. `resincronizar` indica que el cursor es más viejo
+        que lo guardado (o de antes de un reinicio) y puede haber cambios
+        perdidos: el cliente tiene que volver a leer sus pedidos.
+        """
+        with self._lock:
+            return self._despues(usuario_id, desde)
+
+    def _despues(self, usuario_id, desde):
+        if desde > self._ultimo or desde < max(self._descartado.get(usuario_id, 0), self._horizonte):
+            return [], True
+        return [(id_evento, datos) for id_evento, _, datos in self._eventos.get(usuario_id, ()) if id_evento > desde], False
+
+    async def esperar(self, usuario_id, desde, espera):
+        """Como `despues`, pero si todavía no hay eventos espera hasta `espera` segundos a que llegue alguno."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            eventos, resincronizar = self._despues(usuario_id, desde)
+            if eventos or resincronizar or espera <= 0:
+                return eventos, resincronizar
+            suscripcion = (loop, loop.create_future())
+            self._esperando.setdefault(usuario_id, set()).add(suscripcion)
+        try:
+            await asyncio.wait_for(suscripcion[1], espera)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self._lock:
+                esperando = self._esperando.get(usuario_id)
+                if esperando is not None:
+                    esperando.discard(suscripcion)
+                    if not esperando:
+                        del self._esperando[usuario_id]
+        return self.despues(usuario_id, desde)
+
+    def suscriptores(self):
+        with self._lock:
+            return sum(len(esperando) for esperando in self._esperando.values())
+
+
+class BrokerBaseDeDatos:
+    """
+    Eventos en la tabla `evento_pedido`: los publica cualquier proceso y los lee
+    cualquier otro. Los ids son los de la tabla, así que un cursor sirve en
+    todos los workers y sobrevive a los reinicios.
+
+    Los suscriptores no consultan la base mientras esperan: un único sondeo por
+    proceso mira cada `EVENTOS_SONDEO` segundos si hay eventos nuevos y despierta
+    solo a los usuarios que los tienen. Se guardan `EVENTOS_RETENCION` segundos
+    de eventos (siempre queda el último, para conocer el id más alto).
+    """
+
+    def __init__(self, retencion=None):
+        self.retencion = retencion or settings.EVENTOS_RETENCION
+        self._lock = threading.Lock()
+        self._esperando = {}
+        self._sondeo = None
+        # Último id que ya revisó el sondeo
+        self._visto = None
+        self._proxima_depuracion = time.monotonic()
+
+    def ultimo_id(self):
+        return EventoPedido.objects.aggregate(ultimo=Max('pk'))['ultimo'] or 0
+
+    def publicar(self, usuario_id, datos):
+        id_evento = EventoPedido.objects.create(usuario_id=usuario_id, datos=datos).pk
+        self._depurar(id_evento)
+        return id_evento
+
+    def _depurar(self, ultimo):
+        ahora = time.monotonic()
+        if ahora < self._proxima_depuracion:
+            return
+        self._proxima_depuracion = ahora + self.retencion
+        limite = timezone.now() - timedelta(seconds=self.retencion)
+        EventoPedido.objects.filter(creado__lt=limite, pk__lt=ultimo).delete()
+
+    def despues(self, usuario_id, desde):
+        """Lo mismo que `BrokerEnMemoria.despues`, leyendo de la base."""
+        return self._consultar(usuario_id, desde)[:2]
+
+    def _consultar(self, usuario_id, desde):
+        limites = EventoPedido.objects.aggregate(primero=Min('pk'), ultimo=Max('pk'))
+        ultimo = limites['ultimo'] or 0
+        # Todo lo anterior al primer evento guardado ya se depuró
+        if desde > ultimo or desde < (limites['primero'] or 1) - 1:
+            return [], True, ultimo
+        eventos = list(
+            EventoPedido.objects.filter(usuario_id=usuario_id, pk__gt=desde).order_by('pk').values_list('pk', 'datos')
+        )
+        return eventos, False, ultimo
+
+    async def esperar(self, usuario_id, desde, espera):
+        """Como `despues`, pero si todavía no hay eventos espera hasta `espera` segundos a que llegue alguno."""
+        loop = asyncio.get_running_loop()
+        fin = loop.time() + espera
+        while True:
+            eventos, resincronizar, ultimo = await sync_to_async(self._consultar)(usuario_id, desde)
+            restante = fin - loop.time()
+            if eventos or resincronizar or restante <= 0:
+                return eventos, resincronizar
+            suscripcion = (loop, loop.create_future())
+            with self._lock:
+                self._esperando.setdefault(usuario_id, set()).add(suscripcion)
+                # Lo publicado después de esta consulta lo tiene que ver el sondeo
+                self._visto = ultimo if self._visto is None else min(self._visto, ultimo)
+                if self._sondeo is None or self._sondeo.done() or self._sondeo.get_loop() is not loop:
+                    self._sondeo = loop.create_task(self._sondear())
+            try:
+                await asyncio.wait_for(suscripcion[1], restante)
+            except asyncio.TimeoutError:
+                # El cliente vuelve con el mismo cursor: no se pierde nada
+                return [], False
+            finally:
+                with self._lock:
+                    esperando = self._esperando.get(usuario_id)
+                    if esperando is not None:
+                        esperando.discard(suscripcion)
+                        if not esperando:
+                            del self._esperando[usuario_id]
+
+    async def _sondear(self):
+        while True:
+            with self._lock:
+                if not self._esperando:
+                    self._visto = None
+                    return
+            usuarios = await sync_to_async(self._usuarios_con_eventos)()
+            with self._lock:
+                esperando = [s for usuario_id in usuarios for s in self._esperando.pop(usuario_id, ())]
+            for loop, futuro in esperando:
+                try:
+                    loop.call_soon_threadsafe(_despertar, futuro)
+                except RuntimeError:
+                    pass
+            await asyncio.sleep(settings.EVENTOS_SONDEO)
+
+    def _usuarios_con_eventos(self):
+        with self._lock:
+            visto = self._visto or 0
+        filas = list(EventoPedido.objects.filter(pk__gt=visto).values_list('pk', 'usuario_id'))
+        with self._lock:
+            # Si un suscriptor nuevo lo bajó mientras tanto, se vuelve a revisar desde ahí
+            if filas and self._visto == visto:
+                self._visto = max(pk for pk, _ in filas)
+        return {usuario_id for _, usuario_id in filas}
+
+    def suscriptores(self):
+        with self._lock:
+            return sum(len(esperando) for esperando in self._esperando.values())
+
+
+_broker = None
+
+
+def broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.EVENTOS_BROKER)()
+    return _broker
+
+
+def datos_evento(pedido):
+    return {
+        'id_pedidos': pedido.id_pedidos,
+        'estado': pedido.estado,
+        'fecha_modificacion': pedido.fecha_modificacion.isoformat() if pedido.fecha_modificacion else None,
+    }
+
+
+def publicar_estado(pedido):
+    """Publica el nuevo estado del pedido cuando se confirme la transacción en curso."""
+    usuario_id, datos = pedido.id_usuario_id, datos_evento(pedido)
+    transaction.on_commit(lambda: broker().publicar(usuario_id, datos))
+
+
+async def flujo_sse(usuario_id, desde):
+    """
+    Cuerpo de la respuesta SSE: los eventos del usuario a medida que llegan, con
+    un comentario cada `EVENTOS_LATIDO` segundos para que los proxies no corten
+    la conexión. A los `EVENTOS_DURACION` segundos cierra; el navegador se
+    reconecta solo y manda el último id en `Last-Event-ID`.
+    """
+    fuente = broker()
+    loop = asyncio.get_running_loop()
+    fin = loop.time() + settings.EVENTOS_DURACION
+    yield f'retry: {RECONEXION_MS}\n\n'
+    while (restante := fin - loop.time()) > 0:
+        eventos, resincronizar = await fuente.esperar(usuario_id, desde, min(settings.EVENTOS_LATIDO, restante))
+        if resincronizar:
+            desde = await sync_to_async(fuente.ultimo_id)()
+            yield f'id: {desde}\nevent: resincronizar\ndata: {{}}\n\n'
+        elif not eventos:
+            yield ': latido\n\n'
+        for desde, datos in eventos:
+            yield f'id: {desde}\nevent: pedido\ndata: {json.dumps(datos)}\n\n'
@@ -0,0 +1,160 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from .models import ClaveIdempotencia
+
+CABECERA = 'Idempotency-Key'
+METODOS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+
+class IdempotenciaEnCurso(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = 'Hay un request con la misma Idempotency-Key en curso, reintentá en unos segundos.'
+    default_code = 'idempotencia_en_curso'
+    # DRF lo devuelve como Retry-After
+    wait = 1
+
+
+class ClaveReutilizada(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = 'La Idempotency-Key ya se usó con otro request.'
+    default_code = 'idempotencia_clave_reutilizada'
+
+
+class _Repetir(Exception):
+
+    def __init__(self, registro):
+        super().__init__()
+        self.registro = registro
+
+
+def huella_request(request):
+    return hashlib.sha256(b'\n'.join([
+        request.method.encode(), request.get_full_path().encode(), request.body,
+    ])).hexdigest()
+
+
+def tomar_clave(usuario, clave, huella):
+    """
+    Registra la clave como en curso y devuelve `(registro, True)`. Si ya tiene
+    una respuesta guardada devuelve `(registro, False)`. Si otro request con la
+    misma clave está en curso espera hasta `IDEMPOTENCIA_ESPERA` segundos a que
+    termine; después lanza `IdempotenciaEnCurso`.
+
+    La fila es el lock: la restricción única deja pasar a uno solo. Si el que
+    la tomó se cae, la clave se libera a los `IDEMPOTENCIA_BLOQUEO` segundos.
+    """
+    limite = time.monotonic() + settings.IDEMPOTENCIA_ESPERA
+    while True:
+        ahora = timezone.now()
+        try:
+            with transaction.atomic():
+                return ClaveIdempotencia.objects.create(
+                    usuario=usuario, clave=clave, huella=huella,
+                    vence=ahora + timedelta(seconds=settings.IDEMPOTENCIA_BLOQUEO),
+                ), True
+        except IntegrityError:
+            pass
+
+        registro = ClaveIdempotencia.objects.filter(usuario=usuario, clave=clave).first()
+        if registro is None:
+            continue
+        if registro.vence <= ahora:
+            # Vencida: se puede volver a usar
+            ClaveIdempotencia.objects.filter(pk=registro.pk, vence__lte=ahora).delete()
+            continue
+        if registro.huella != huella:
+            raise ClaveReutilizada()
+        if registro.codigo is not None:
+            return registro, False
+        if time.monotonic() >= limite:
+            raise IdempotenciaEnCurso()
+        time.sleep(0.05)
+
+
+def guardar_respuesta(registro, respuesta):
+    if respuesta.status_code >= 500:
+        # Un error del servidor no se repite: el reintento vuelve a ejecutar la vista
+        soltar_clave(registro)
+        return
+    ClaveIdempotencia.objects.filter(pk=registro.pk).update(
+        codigo=respuesta.status_code,
+        respuesta=json.dumps(respuesta.data, cls=JSONEncoder),
+        vence=timezone.now() + timedelta(seconds=settings.IDEMPOTENCIA_TTL),
+    )
+
+
+def soltar_clave(registro):
+    ClaveIdempotencia.objects.filter(pk=registro.pk).delete()
+
+
+def respuesta_guardada(registro):
+    return Response(json.loads(registro.respuesta), status=registro.codigo, headers={'Idempotent-Replayed': 'true'})
+
+
+class IdempotenciaMixin:
+    """
+    Para vistas DRF que escriben: con la cabecera `Idempotency-Key` la primera
+    respuesta se guarda por usuario y clave durante `IDEMPOTENCIA_TTL` segundos,
+    y los reintentos la reciben tal cual sin volver a ejecutar la vista.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        clave = request.headers.get(CABECERA)
+        if clave is None or request.method not in METODOS:
+            return
+        if not clave or len(clave) > ClaveIdempotencia._meta.get_field('clave').max_length:
+            raise ValidationError({CABECERA: 'La clave debe tener entre 1 y 255 caracteres.'})
+        registro, propio = tomar_clave(request.user, clave, huella_request(request))
+        if not propio:
+            raise _Repetir(registro)
+        self._clave_idempotencia = registro
+
+    def handle_exception(self, exc):
+        if isinstance(exc, _Repetir):
+            return respuesta_guardada(exc.registro)
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            registro = getattr(self, '_clave_idempotencia', None)
+            if registro is not None:
+                self._clave_idempotencia = None
+                soltar_clave(registro)
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        registro = getattr(self, '_clave_idempotencia', None)
+        if registro is not None:
+            self._clave_idempotencia = None
+            guardar_respuesta(registro, response)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+def depurar_claves_vencidas(lote=1000, pausa=0.0):
+    """Borra las claves vencidas en lotes por pk, cada uno en su propia transacción. Devuelve cuántas borró."""
+    ahora = timezone.now()
+    borradas = 0
+    ultimo = 0
+    while True:
+        ids = list(
+            ClaveIdempotencia.objects.filter(pk__gt=ultimo, vence__lte=ahora)
+            .order_by('pk').values_list('pk', flat=True)[:lote]
+        )
+        if not ids:
+            return borradas
+        with transaction.atomic():
+            borradas += ClaveIdempotencia.objects.filter(pk__in=ids, vence__lte=ahora).delete()[0]
+        ultimo = ids[-1]
+        if pausa:
+            time.sleep(pausa)
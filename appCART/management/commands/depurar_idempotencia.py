@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from appCART.idempotencia import depurar_claves_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Borra en lotes las Idempotency-Key vencidas y sus respuestas guardadas.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Claves por transacción (por defecto 1000).')
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help='Segundos de espera entre lotes, para repartir la carga.')
+        parser.add_argument('--cada', type=int,
+                            help='Queda corriendo y repite la depuración cada tantos segundos.')
+
+    def handle(self, *args, **options):
+        while True:
+            borradas = depurar_claves_vencidas(options['lote'], options['pausa'])
+            self.stdout.write(f'{borradas} claves de idempotencia vencidas borradas')
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
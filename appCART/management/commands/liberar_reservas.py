@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from appCART.services import liberar_reservas_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Devuelve al stock disponible las reservas de carrito vencidas, en lotes.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Líneas de carrito por transacción (por defecto 1000).')
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help='Segundos de espera entre lotes, para repartir la carga.')
+        parser.add_argument('--cada', type=int,
+                            help='Queda corriendo y repite el barrido cada tantos segundos.')
+
+    def handle(self, *args, **options):
+        while True:
+            liberadas = liberar_reservas_vencidas(lote=options['lote'], pausa=options['pausa'])
+            self.stdout.write(f'{liberadas} reservas vencidas liberadas')
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
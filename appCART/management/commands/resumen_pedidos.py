@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from appCART.models import Pedido
+from appCART.services import pedidos_inconsistentes, recalcular_resumenes
+
+
+class Command(BaseCommand):
+    help = 'Recalcula y verifica los totales guardados en cada Pedido a partir de sus detalles.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--solo-verificar', action='store_true',
+                            help='No recalcula; solo informa los pedidos inconsistentes.')
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Pedidos por transacción al recalcular (por defecto 1000).')
+
+    def handle(self, *args, **options):
+        if not options['solo_verificar']:
+            recalculados = 0
+            ultimo = 0
+            # Por rangos de pk: cada lote es un UPDATE corto que no bloquea la tabla entera
+            while True:
+                ids = list(
+                    Pedido.objects.filter(pk__gt=ultimo).order_by('pk').values_list('pk', flat=True)[:options['lote']]
+                )
+                if not ids:
+                    break
+                with transaction.atomic():
+                    recalculados += recalcular_resumenes(Pedido.objects.filter(pk__gt=ultimo, pk__lte=ids[-1]))
+                ultimo = ids[-1]
+            self.stdout.write(f'{recalculados} pedidos recalculados')
+
+        inconsistentes = list(pedidos_inconsistentes(Pedido.objects.all()).values_list('pk', flat=True)[:100])
+        if inconsistentes:
+            raise CommandError(f'Pedidos con resumen inconsistente: {", ".join(map(str, inconsistentes))}')
+        self.stdout.write(self.style.SUCCESS('Resúmenes de pedidos verificados'))
@@ -0,0 +1,32 @@
+from django.db import migrations
+from django.db.models import OuterRef, Q, Subquery
+from django.db.models.functions import Left
+
+
+def completar_direccion_entrega(apps, schema_editor):
+    # Antes el dashboard completaba la dirección de los pedidos sin dirección
+    # con la del usuario en cada GET; se hace una única vez acá.
+    Pedido = apps.get_model('appCART', 'Pedido')
+    Usuario = apps.get_model('appUSERS', 'Usuario')
+    # appUSERS no tiene migraciones: en una base nueva sin `--run-syncdb` su
+    # tabla todavía no existe y tampoco hay pedidos que completar.
+    if Usuario._meta.db_table not in schema_editor.connection.introspection.table_names():
+        return
+
+    direccion_usuario = Usuario.objects.filter(pk=OuterRef('id_usuario')).values('direccion')[:1]
+    Pedido.objects.filter(
+        Q(direccion_entrega__isnull=True) | Q(direccion_entrega='') | Q(direccion_entrega='Sin especificar')
+    ).exclude(
+        Q(id_usuario__direccion__isnull=True) | Q(id_usuario__direccion='')
+    ).update(direccion_entrega=Left(Subquery(direccion_usuario), 100))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appCART', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(completar_direccion_entrega, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 4.2 on 2026-10-18 13:53
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def calcular_resumenes(apps, schema_editor):
+    # Igual que appCART.services.recalcular_resumenes, con los modelos históricos.
+    # Para tablas grandes o para verificar: `python manage.py resumen_pedidos`.
+    Pedido = apps.get_model('appCART', 'Pedido')
+    DetallePedido = apps.get_model('appCART', 'DetallePedido')
+
+    detalles = DetallePedido.objects.filter(id_pedido=OuterRef('pk')).order_by().values('id_pedido')
+    Pedido.objects.update(
+        monto_total=Coalesce(Subquery(detalles.annotate(v=Sum('subtotal')).values('v')), 0.0),
+        cantidad_lineas=Coalesce(Subquery(detalles.annotate(v=Count('pk')).values('v')), 0),
+        cantidad_unidades=Coalesce(Subquery(detalles.annotate(v=Sum('cantidad_productos')).values('v')), 0),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appCART', '0002_completar_direccion_entrega'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pedido',
+            name='cantidad_lineas',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='cantidad_unidades',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='fecha_modificacion',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='pedido',
+            name='monto_total',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RunPython(calcular_resumenes, migrations.RunPython.noop),
+    ]
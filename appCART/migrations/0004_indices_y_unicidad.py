@@ -0,0 +1,85 @@
+# Generated by Django 4.2 on 2026-10-18 13:55
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def unificar_duplicados(apps, schema_editor):
+    # Sin restricciones, `get_or_create` concurrentes pudieron duplicar filas:
+    # se unifican antes de crear los índices únicos.
+    Pedido = apps.get_model('appCART', 'Pedido')
+    Carrito = apps.get_model('appCART', 'Carrito')
+    DetallePedido = apps.get_model('appCART', 'DetallePedido')
+
+    # Pedidos pendientes duplicados: queda el más reciente y los demás se cancelan.
+    # Antes sus líneas pasan al que queda (los bucles de abajo las suman), así no
+    # desaparecen del carrito ni queda sin devolver el stock que ya tomaron.
+    pedidos_afectados = set()
+    pendientes = Pedido.objects.filter(estado='Pendiente').values('id_usuario').annotate(
+        n=Count('pk'), ultimo=Max('pk')
+    ).filter(n__gt=1)
+    for grupo in pendientes:
+        duplicados = list(Pedido.objects.filter(id_usuario=grupo['id_usuario'], estado='Pendiente').exclude(
+            pk=grupo['ultimo']
+        ).values_list('pk', flat=True))
+        Carrito.objects.filter(id_pedido__in=duplicados).update(id_pedido=grupo['ultimo'])
+        DetallePedido.objects.filter(id_pedido__in=duplicados).update(id_pedido=grupo['ultimo'])
+        Pedido.objects.filter(pk__in=duplicados).update(estado='Cancelado')
+        pedidos_afectados.add(grupo['ultimo'])
+
+    for linea in Carrito.objects.values('usuario', 'id_pedido', 'producto').annotate(
+        n=Count('pk'), primera=Min('pk'), total=Sum('cantidad')
+    ).filter(n__gt=1):
+        Carrito.objects.filter(pk=linea['primera']).update(cantidad=linea['total'])
+        Carrito.objects.filter(
+            usuario=linea['usuario'], id_pedido=linea['id_pedido'], producto=linea['producto']
+        ).exclude(pk=linea['primera']).delete()
+
+    for detalle in DetallePedido.objects.values('id_pedido', 'id_producto', 'precio_producto').annotate(
+        n=Count('pk'), primera=Min('pk'), cantidad=Sum('cantidad_productos'), subtotal=Sum('subtotal')
+    ).filter(n__gt=1):
+        DetallePedido.objects.filter(pk=detalle['primera']).update(
+            cantidad_productos=detalle['cantidad'], subtotal=detalle['subtotal']
+        )
+        DetallePedido.objects.filter(
+            id_pedido=detalle['id_pedido'], id_producto=detalle['id_producto'],
+            precio_producto=detalle['precio_producto'],
+        ).exclude(pk=detalle['primera']).delete()
+        pedidos_afectados.add(detalle['id_pedido'])
+
+    if pedidos_afectados:
+        # Como en 0003_resumen_pedido
+        lineas = DetallePedido.objects.filter(id_pedido=OuterRef('pk')).order_by().values('id_pedido')
+        Pedido.objects.filter(pk__in=pedidos_afectados).update(
+            monto_total=Coalesce(Subquery(lineas.annotate(v=Sum('subtotal')).values('v')), 0.0),
+            cantidad_lineas=Coalesce(Subquery(lineas.annotate(v=Count('pk')).values('v')), 0),
+            cantidad_unidades=Coalesce(Subquery(lineas.annotate(v=Sum('cantidad_productos')).values('v')), 0),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appCART', '0003_resumen_pedido'),
+    ]
+
+    operations = [
+        migrations.RunPython(unificar_duplicados, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='pedido',
+            index=models.Index(fields=['id_usuario', 'estado'], name='pedido_usuario_estado_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='carrito',
+            constraint=models.UniqueConstraint(fields=('usuario', 'id_pedido', 'producto'), name='carrito_linea_unica'),
+        ),
+        migrations.AddConstraint(
+            model_name='detallepedido',
+            constraint=models.UniqueConstraint(fields=('id_pedido', 'id_producto', 'precio_producto'), name='detalle_producto_precio_unico'),
+        ),
+        migrations.AddConstraint(
+            model_name='pedido',
+            constraint=models.UniqueConstraint(models.F('id_usuario'), models.Case(models.When(estado='Pendiente', then=models.Value(1))), name='pedido_pendiente_unico'),
+        ),
+    ]
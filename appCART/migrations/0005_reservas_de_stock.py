@@ -0,0 +1,60 @@
+# Generated by Django 4.2 on 2026-10-18 14:25
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Sum
+from django.utils import timezone
+
+
+def pendientes_por_producto(apps):
+    Carrito = apps.get_model('appCART', 'Carrito')
+    return Carrito.objects.filter(id_pedido__estado='Pendiente').values('producto').annotate(total=Sum('cantidad'))
+
+
+def convertir_en_reservas(apps, schema_editor):
+    # Hasta ahora el stock de los carritos abiertos ya estaba descontado: se
+    # devuelve al stock y queda como reserva de cada línea.
+    Carrito = apps.get_model('appCART', 'Carrito')
+    Producto = apps.get_model('appFOOD', 'Producto')
+    for grupo in pendientes_por_producto(apps):
+        Producto.objects.filter(pk=grupo['producto']).update(
+            stock=F('stock') + grupo['total'], reservado=F('reservado') + grupo['total']
+        )
+    Carrito.objects.filter(id_pedido__estado='Pendiente').update(
+        reservado=F('cantidad'), reservado_hasta=timezone.now() + timedelta(seconds=settings.RESERVA_DURACION)
+    )
+
+
+def descontar_carritos_abiertos(apps, schema_editor):
+    Producto = apps.get_model('appFOOD', 'Producto')
+    for grupo in pendientes_por_producto(apps):
+        Producto.objects.filter(pk=grupo['producto']).update(stock=F('stock') - grupo['total'])
+    Producto.objects.update(reservado=0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appCART', '0004_indices_y_unicidad'),
+        ('appFOOD', '0002_producto_reservado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='carrito',
+            name='reservado',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='carrito',
+            name='reservado_hasta',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddIndex(
+            model_name='carrito',
+            index=models.Index(fields=['reservado_hasta'], name='carrito_reserva_vence_idx'),
+        ),
+        migrations.RunPython(convertir_en_reservas, descontar_carritos_abiertos),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2 on 2026-10-18 14:35
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('appCART', '0005_reservas_de_stock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('clave', models.CharField(max_length=255)),
+                ('huella', models.CharField(max_length=64)),
+                ('codigo', models.PositiveSmallIntegerField(null=True)),
+                ('respuesta', models.TextField(null=True)),
+                ('vence', models.DateTimeField()),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'clave_idempotencia',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='claveidempotencia',
+            index=models.Index(fields=['vence'], name='idempotencia_vence_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='claveidempotencia',
+            constraint=models.UniqueConstraint(fields=('usuario', 'clave'), name='idempotencia_usuario_clave_uniq'),
+        ),
+    ]
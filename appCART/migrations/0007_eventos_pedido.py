@@ -0,0 +1,37 @@
+# Generated by Django 4.2 on 2026-10-18 15:46
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('appCART', '0006_claves_idempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EventoPedido',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('datos', models.JSONField()),
+                ('creado', models.DateTimeField(default=django.utils.timezone.now)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'evento_pedido',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='eventopedido',
+            index=models.Index(fields=['usuario', 'id'], name='evento_usuario_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventopedido',
+            index=models.Index(fields=['creado'], name='evento_creado_idx'),
+        ),
+    ]
@@ -2,6 +2,7 @@ from django.db import models
 from appUSERS.models import Usuario
 from appFOOD.models import Producto
 from django.conf import settings
+from django.utils import timezone
 
 class Pedido(models.Model):
     id_pedidos = models.AutoField(primary_key=True)
@@ -10,12 +11,29 @@ class Pedido(models.Model):
     hora_pedido = models.TimeField(null=True)  
     direccion_entrega = models.CharField(max_length=100, null=True)
     estado = models.CharField(max_length=50, default='pendiente', null=True)  
+    # Resumen de los detalles, mantenido por cada operación del carrito
+    monto_total = models.FloatField(default=0)
+    cantidad_lineas = models.IntegerField(default=0)
+    cantidad_unidades = models.IntegerField(default=0)
+    fecha_modificacion = models.DateTimeField(null=True)
 
     class Meta:
         managed = True
         db_table = 'pedido'
         verbose_name = 'Pedido'
         verbose_name_plural = 'Pedidos'
+        indexes = [
+            models.Index(fields=['id_usuario', 'estado'], name='pedido_usuario_estado_idx'),
+        ]
+        constraints = [
+            # Un solo pedido pendiente por usuario. La expresión es NULL para los
+            # demás estados y los NULL no chocan en un índice único: funciona como
+            # un índice parcial también en MySQL (8.0.13+), que no los soporta.
+            models.UniqueConstraint(
+                models.F('id_usuario'), models.Case(models.When(estado='Pendiente', then=models.Value(1))),
+                name='pedido_pendiente_unico',
+            ),
+        ]
     def __unicode__(self):
         return self.id_pedidos
     #def __str__(self):
@@ -27,8 +45,17 @@ class Carrito(models.Model):
     usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     comprado = models.BooleanField(default=False)
     id_pedido = models.ForeignKey(Pedido, on_delete=models.CASCADE)
+    # Unidades de la línea que tiene reservadas y hasta cuándo (ver services.reservar)
+    reservado = models.PositiveIntegerField(default=0)
+    reservado_hasta = models.DateTimeField(null=True)
     class Meta:
         db_table = 'carrito'
+        indexes = [
+            models.Index(fields=['reservado_hasta'], name='carrito_reserva_vence_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'id_pedido', 'producto'], name='carrito_linea_unica'),
+        ]
     
 class DetallePedido(models.Model):
     id_detalle = models.AutoField(primary_key=True)  
@@ -43,7 +70,46 @@ class DetallePedido(models.Model):
         db_table = 'detalle_pedido'
         verbose_name = 'Detallepedido'
         verbose_name_plural = 'Detallepedidos'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['id_pedido', 'id_producto', 'precio_producto'], name='detalle_producto_precio_unico'
+            ),
+        ]
     def __unicode__(self):
         return self.id_detalle
     #def __str__(self):
-    #    return self.id_detalle
\ No newline at end of file
+    #    return self.id_detalle
+
+class ClaveIdempotencia(models.Model):
+    """Respuesta guardada de un request con `Idempotency-Key`, para repetirla si el cliente reintenta."""
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    clave = models.CharField(max_length=255)
+    # Hash del método, la ruta y el cuerpo: la misma clave con otro request se rechaza
+    huella = models.CharField(max_length=64)
+    # Sin código todavía: el request original está en curso
+    codigo = models.PositiveSmallIntegerField(null=True)
+    respuesta = models.TextField(null=True)
+    vence = models.DateTimeField()
+
+    class Meta:
+        db_table = 'clave_idempotencia'
+        indexes = [
+            models.Index(fields=['vence'], name='idempotencia_vence_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['usuario', 'clave'], name='idempotencia_usuario_clave_uniq'),
+        ]
+
+
+class EventoPedido(models.Model):
+    """Cambio de estado de un pedido, para `appCART/eventos/` (ver `appCART/eventos.py`)."""
+    usuario = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    datos = models.JSONField()
+    creado = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        db_table = 'evento_pedido'
+        indexes = [
+            models.Index(fields=['usuario', 'id'], name='evento_usuario_id_idx'),
+            models.Index(fields=['creado'], name='evento_creado_idx'),
+        ]
@@ -1,4 +1,6 @@
 from rest_framework import serializers
+from appFOOD.serializers import ProductoResumenSerializer
+from Food_ISPC.campos import CamposDinamicosMixin
 from .models import Carrito, DetallePedido, Pedido
 
 class CarritoSerializer(serializers.ModelSerializer):
@@ -6,13 +8,41 @@ class CarritoSerializer(serializers.ModelSerializer):
         model = Carrito
         fields = ['id', 'producto', 'cantidad', 'usuario']
 
-class DetallePedidoSerializer(serializers.ModelSerializer):
+class DetallePedidoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     id_producto = serializers.ReadOnlyField(source='id_producto.id_producto')
     nombre_producto = serializers.ReadOnlyField(source='id_producto.nombre_producto')
-    
+
+    expandibles = {'id_producto': ProductoResumenSerializer}
+
     class Meta:
         model = DetallePedido
         fields = ["id_detalle", "id_producto", "nombre_producto", "cantidad_productos", "precio_producto", "subtotal", "direccion_entrega"]
 
+class AgregarProductoSerializer(serializers.Serializer):
+    cantidad = serializers.IntegerField(min_value=1)
+    direccion = serializers.CharField(required=False, allow_blank=True, allow_null=True, max_length=100)
+
 class ModificarCantidadSerializer(serializers.Serializer):
     cantidad = serializers.IntegerField(min_value=1)
+
+class OperacionCarritoSerializer(serializers.Serializer):
+    accion = serializers.ChoiceField(choices=['agregar', 'modificar', 'eliminar'])
+    producto_id = serializers.IntegerField(required=False)
+    carrito_id = serializers.IntegerField(required=False)
+    cantidad = serializers.IntegerField(min_value=1, required=False)
+
+    def validate(self, data):
+        requeridos = {
+            'agregar': ('producto_id', 'cantidad'),
+            'modificar': ('carrito_id', 'cantidad'),
+            'eliminar': ('carrito_id',),
+        }[data['accion']]
+        faltantes = [campo for campo in requeridos if campo not in data]
+        if faltantes:
+            raise serializers.ValidationError(f'Campos requeridos faltantes: {", ".join(faltantes)}')
+        return data
+
+class OperacionesCarritoSerializer(serializers.Serializer):
+    operaciones = OperacionCarritoSerializer(many=True, allow_empty=False, max_length=100)
+    direccion = serializers.CharField(required=False, allow_blank=True, allow_null=True, max_length=100)
+    todo_o_nada = serializers.BooleanField(default=False)
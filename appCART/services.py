@@ -0,0 +1,616 @@
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import (BooleanField, Case, Count, ExpressionWrapper, F, FloatField, OuterRef, Q, Subquery, Sum,
+                              Value, When, Window)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from appFOOD.cache import invalidar_disponibilidad
+from appFOOD.models import Producto
+from appFOOD.shards import cargar_shards, disponible_en_shards, mover_en_shards
+from appTAREAS.cola import encolar
+from appUSERS.cache import invalidar_usuario
+from appUSERS.models import Usuario
+from .eventos import publicar_estado
+from .models import Carrito, DetallePedido, Pedido
+
+DIRECCION_POR_DEFECTO = 'Sin especificar'
+
+ERROR_STOCK = 'Stock insuficiente'
+ERROR_PRODUCTO = 'Producto no encontrado'
+ERROR_CARRITO = 'No existe un producto en el carrito con ese id de carrito.'
+ERROR_DETALLE = 'No existe un detalle de pedido para este producto en el carrito.'
+
+# Intentos de aplicar_operaciones; el último bloquea los productos desde el principio
+INTENTOS_OPERACIONES = 3
+
+
+class StockInsuficiente(Exception):
+
+    def __init__(self, producto_ids=()):
+        super().__init__(ERROR_STOCK)
+        self.producto_ids = list(producto_ids)
+
+
+class CarritoVacio(Exception):
+    pass
+
+
+class OperacionesRechazadas(Exception):
+    """Alguna operación de un lote `todo_o_nada` falló; no se guardó nada."""
+
+    def __init__(self, resultados):
+        super().__init__('Operaciones rechazadas')
+        self.resultados = resultados
+
+
+def resolver_direccion(usuario, direccion=None):
+    # Dirección enviada > dirección del perfil > valor por defecto
+    if direccion:
+        return direccion
+    return usuario.direccion or DIRECCION_POR_DEFECTO
+
+
+def vencimiento_reserva():
+    return timezone.now() + timedelta(seconds=settings.RESERVA_DURACION)
+
+
+def mover_stock(cambios, shards=None):
+    """
+    Aplica en un solo UPDATE los movimientos `{producto_id: (reservar, vender)}`:
+    suma `reservar` a lo reservado y descuenta `vender` del stock y de lo
+    reservado. Los productos que reservan exigen disponible suficiente (stock
+    menos reservado) en la misma sentencia, sin leer-modificar-guardar; si a
+    alguno no le alcanza se lanza `StockInsuficiente` y quien llamó deshace su
+    transacción.
+
+    Los productos repartidos (`shards`, `{producto_id: shards_stock}`; si no se
+    pasa se consulta) se mueven en uno de sus shards y no tocan su fila.
+
+    Conviene que sea lo último de la transacción: el lock de las filas de los
+    productos dura desde acá hasta el commit.
+    """
+    if not cambios:
+        return
+    cambios = dict(cambios)
+    if shards is None:
+        shards = dict(Producto.objects.filter(pk__in=cambios, shards_stock__gt=0).values_list('pk', 'shards_stock'))
+    for producto_id in sorted(cambios.keys() & {pk for pk, cantidad in shards.items() if cantidad}):
+        if not mover_en_shards(producto_id, shards[producto_id], *cambios.pop(producto_id)):
+            raise StockInsuficiente([producto_id])
+    if not cambios:
+        return
+    condicion = Q()
+    for producto_id, (reservar, _) in cambios.items():
+        condicion |= Q(pk=producto_id, stock__gte=F('reservado') + reservar) if reservar > 0 else Q(pk=producto_id)
+
+    def por_producto(valores):
+        return Case(*[When(pk=pk, then=Value(valor)) for pk, valor in valores.items()], default=Value(0))
+
+    columnas = {'reservado': F('reservado') + por_producto({pk: r - v for pk, (r, v) in cambios.items()})}
+    if any(vender for _, vender in cambios.values()):
+        columnas['stock'] = F('stock') - por_producto({pk: v for pk, (_, v) in cambios.items()})
+    if Producto.objects.filter(condicion).update(**columnas) != len(cambios):
+        raise StockInsuficiente(cambios)
+
+
+def liberar_reservas_vencidas(producto_ids=None, lote=1000, pausa=0.0):
+    """
+    Devuelve al disponible las reservas vencidas, en lotes de líneas con su
+    propia transacción. Las líneas quedan en el carrito sin reserva; se vuelven
+    a reservar al tocarlas o al confirmar. Saltea las líneas que otro request
+    tiene bloqueadas. Devuelve cuántas líneas liberó.
+    """
+    liberadas = 0
+    while True:
+        with transaction.atomic():
+            vencidas = Carrito.objects.filter(reservado__gt=0, reservado_hasta__lte=timezone.now())
+            if producto_ids is not None:
+                vencidas = vencidas.filter(producto_id__in=producto_ids)
+            lineas = list(
+                vencidas.select_for_update(skip_locked=True).order_by('pk')
+                .values_list('pk', 'producto_id', 'reservado')[:lote]
+            )
+            if not lineas:
+                return liberadas
+            Carrito.objects.filter(pk__in=[pk for pk, _, _ in lineas]).update(reservado=0, reservado_hasta=None)
+            por_producto = Counter()
+            for _, producto_id, reservado in lineas:
+                por_producto[producto_id] += reservado
+            mover_stock({producto_id: (-reservado, 0) for producto_id, reservado in por_producto.items()})
+            invalidar_disponibilidad()
+        liberadas += len(lineas)
+        if len(lineas) < lote:
+            return liberadas
+        if pausa:
+            time.sleep(pausa)
+
+
+def hay_reservas_vencidas(producto_ids):
+    return Carrito.objects.filter(
+        producto_id__in=producto_ids, reservado__gt=0, reservado_hasta__lte=timezone.now()
+    ).exists()
+
+
+def _liberando_vencidas(funcion, *args):
+    # Si falta stock puede ser por reservas vencidas que el barrido todavía no
+    # liberó: se liberan (en su propia transacción) y se reintenta una vez.
+    try:
+        return funcion(*args)
+    except StockInsuficiente as e:
+        if not e.producto_ids or not liberar_reservas_vencidas(e.producto_ids):
+            raise
+    return funcion(*args)
+
+
+def ajustar_resumen(pedido_id, monto=0.0, lineas=0, unidades=0):
+    """Aplica a los totales guardados en el pedido la variación de sus detalles."""
+    Pedido.objects.filter(pk=pedido_id).update(
+        monto_total=F('monto_total') + monto,
+        cantidad_lineas=F('cantidad_lineas') + lineas,
+        cantidad_unidades=F('cantidad_unidades') + unidades,
+        fecha_modificacion=timezone.now(),
+    )
+
+
+def _resumen_desde_detalles():
+    detalles = DetallePedido.objects.filter(id_pedido=OuterRef('pk')).order_by().values('id_pedido')
+    return {
+        'monto_total': Coalesce(Subquery(detalles.annotate(v=Sum('subtotal')).values('v')), 0.0),
+        'cantidad_lineas': Coalesce(Subquery(detalles.annotate(v=Count('pk')).values('v')), 0),
+        'cantidad_unidades': Coalesce(Subquery(detalles.annotate(v=Sum('cantidad_productos')).values('v')), 0),
+    }
+
+
+def recalcular_resumenes(pedidos):
+    """Recalcula desde los detalles, en un solo UPDATE, el resumen de `pedidos`."""
+    return pedidos.update(**_resumen_desde_detalles())
+
+
+def pedidos_inconsistentes(pedidos):
+    """Pedidos cuyo resumen guardado no coincide con sus detalles."""
+    real = _resumen_desde_detalles()
+    return pedidos.annotate(
+        monto_real=real['monto_total'],
+        lineas_real=real['cantidad_lineas'],
+        unidades_real=real['cantidad_unidades'],
+    ).exclude(
+        cantidad_lineas=F('lineas_real'),
+        cantidad_unidades=F('unidades_real'),
+        monto_total__gte=F('monto_real') - 0.005,
+        monto_total__lte=F('monto_real') + 0.005,
+    )
+
+
+def bloquear_pedido_pendiente(usuario):
+    return (
+        Pedido.objects.select_for_update()
+        .filter(id_usuario_id=usuario.id_usuario, estado='Pendiente')
+        .first()
+    )
+
+
+def obtener_pedido_pendiente(usuario, direccion, pedido=None):
+    """Devuelve el pedido pendiente del usuario (bloqueado) o lo crea. `pedido` es el ya bloqueado, si lo hay."""
+    if pedido is None:
+        pedido = bloquear_pedido_pendiente(usuario)
+    if pedido is None:
+        try:
+            with transaction.atomic():
+                return Pedido.objects.create(
+                    id_usuario_id=usuario.id_usuario,
+                    estado='Pendiente',
+                    direccion_entrega=direccion,
+                    fecha_pedido=date.today(),
+                    hora_pedido=datetime.now().time(),
+                )
+        except IntegrityError:
+            # Otro request del mismo usuario lo creó al mismo tiempo (pedido_pendiente_unico)
+            pedido = Pedido.objects.select_for_update().get(id_usuario_id=usuario.id_usuario, estado='Pendiente')
+    if pedido.direccion_entrega != direccion:
+        pedido.direccion_entrega = direccion
+        Pedido.objects.filter(pk=pedido.pk).update(direccion_entrega=direccion)
+        DetallePedido.objects.filter(id_pedido=pedido).update(direccion_entrega=direccion)
+    return pedido
+
+
+def agregar_producto(usuario, producto_id, cantidad, direccion=None):
+    """
+    Agrega `cantidad` unidades de un producto al carrito del usuario y las
+    reserva por `RESERVA_DURACION` segundos (renovando la reserva de la línea).
+
+    Todo ocurre en una sola transacción con un número fijo de consultas. La
+    reserva sobre la fila del producto es la última sentencia: su lock dura solo
+    hasta el commit, así los carritos de un producto muy pedido no esperan cada
+    uno el resto de la transacción del anterior. Los locks se toman siempre en
+    el mismo orden (usuario, pedido, líneas, productos) para no bloquearse en ciclo.
+    """
+    pedido = _liberando_vencidas(_agregar_producto, usuario, producto_id, cantidad, direccion)
+    if direccion:
+        usuario.direccion = direccion
+    return pedido
+
+
+def _agregar_producto(usuario, producto_id, cantidad, direccion):
+    with transaction.atomic():
+        precio, shards = Producto.objects.values_list('precio', 'shards_stock').get(pk=producto_id)
+
+        # Si el usuario envía una dirección, actualizarla en su perfil
+        if direccion and direccion != usuario.direccion:
+            Usuario.objects.filter(pk=usuario.id_usuario).update(direccion=direccion)
+            invalidar_usuario(usuario.id_usuario)
+        direccion = resolver_direccion(usuario, direccion)
+
+        pedido = obtener_pedido_pendiente(usuario, direccion)
+
+        vence = vencimiento_reserva()
+        carrito = Carrito.objects.filter(
+            producto_id=producto_id, usuario_id=usuario.id_usuario, id_pedido=pedido
+        ).update(cantidad=F('cantidad') + cantidad, reservado=F('reservado') + cantidad, reservado_hasta=vence)
+        if not carrito:
+            Carrito.objects.create(
+                producto_id=producto_id, usuario_id=usuario.id_usuario,
+                id_pedido=pedido, cantidad=cantidad, reservado=cantidad, reservado_hasta=vence,
+            )
+
+        # `subtotal` va antes que `cantidad_productos`: MySQL evalúa el SET de
+        # izquierda a derecha y usaría la cantidad ya incrementada.
+        detalle = DetallePedido.objects.filter(
+            id_pedido=pedido, id_producto_id=producto_id, precio_producto=precio
+        ).update(
+            subtotal=(F('cantidad_productos') + cantidad) * F('precio_producto'),
+            cantidad_productos=F('cantidad_productos') + cantidad,
+        )
+        if not detalle:
+            DetallePedido.objects.create(
+                id_pedido=pedido, id_producto_id=producto_id,
+                cantidad_productos=cantidad, precio_producto=precio,
+                subtotal=cantidad * precio, direccion_entrega=direccion,
+            )
+        ajustar_resumen(pedido.pk, cantidad * precio, 0 if detalle else 1, cantidad)
+
+        mover_stock({producto_id: (cantidad, 0)}, {producto_id: shards})
+        invalidar_disponibilidad()
+
+    return pedido
+
+
+def confirmar_pedido(usuario):
+    """
+    Confirma el pedido pendiente con la escritura mínima: el pedido pasa a
+    aprobado y sus líneas quedan compradas, con la reserva retenida sin
+    vencimiento. Lo que no estaba reservado (reservas vencidas) se reserva en el
+    momento; si ya no hay stock se lanza `StockInsuficiente` y el pedido sigue
+    pendiente. El descuento del stock lo hace después la tarea `finalizar_pedido`.
+    """
+    return _liberando_vencidas(_confirmar_pedido, usuario)
+
+
+def _confirmar_pedido(usuario):
+    with transaction.atomic():
+        pedido = Pedido.objects.select_for_update().get(id_usuario_id=usuario.id_usuario, estado='Pendiente')
+        lineas_pedido = Carrito.objects.filter(id_pedido=pedido, comprado=False)
+        lineas = list(lineas_pedido.select_for_update().values_list('producto_id', 'cantidad', 'reservado'))
+        if not lineas:
+            raise CarritoVacio
+
+        # Verificar que el pedido tenga dirección de entrega
+        if not pedido.direccion_entrega or pedido.direccion_entrega == DIRECCION_POR_DEFECTO:
+            if usuario.direccion:
+                pedido.direccion_entrega = usuario.direccion
+
+        pedido.estado = 'Aprobado'
+        pedido.fecha_modificacion = timezone.now()
+        pedido.save()
+        publicar_estado(pedido)
+
+        faltantes = Counter()
+        for producto_id, cantidad, reservado in lineas:
+            if cantidad > reservado:
+                faltantes[producto_id] += cantidad - reservado
+        if faltantes:
+            mover_stock({producto_id: (faltante, 0) for producto_id, faltante in faltantes.items()})
+            invalidar_disponibilidad()
+        lineas_pedido.update(comprado=True, reservado=F('cantidad'), reservado_hasta=None)
+        encolar('finalizar_pedido', {'pedido_id': pedido.pk})
+    return pedido
+
+
+def finalizar_pedido(pedido_id):
+    """
+    Pasa a descuento definitivo del stock las reservas de un pedido confirmado
+    y borra sus líneas del carrito. Si ya se hizo no hace nada, así la tarea se
+    puede reintentar.
+    """
+    lineas = Carrito.objects.filter(id_pedido_id=pedido_id, comprado=True)
+    vendidas = Counter()
+    for producto_id, cantidad in lineas.select_for_update().values_list('producto_id', 'cantidad'):
+        vendidas[producto_id] += cantidad
+    if not vendidas:
+        return
+    lineas.delete()
+    mover_stock({producto_id: (0, cantidad) for producto_id, cantidad in vendidas.items()})
+    invalidar_disponibilidad()
+
+
+def datos_carrito(usuario):
+    """
+    Carrito del usuario con totales, en una sola consulta.
+
+    Solo cuentan las líneas del pedido pendiente: las filas viejas de pedidos
+    ya confirmados no se muestran ni se suman. Los subtotales y totales los
+    calcula la base (los totales con funciones de ventana sobre las mismas filas).
+    """
+    return _armar_carrito(_lineas_carrito(usuario))
+
+
+async def adatos_carrito(usuario):
+    """`datos_carrito` por el ORM async."""
+    return _armar_carrito([linea async for linea in _lineas_carrito(usuario)])
+
+
+def _lineas_carrito(usuario):
+    subtotal = ExpressionWrapper(F('cantidad') * F('producto__precio'), output_field=FloatField())
+    return Carrito.objects.select_related('producto').filter(
+        usuario_id=usuario.id_usuario, id_pedido__estado='Pendiente'
+    ).annotate(
+        subtotal=subtotal,
+        # Se puede confirmar si lo que le falta reservar a la línea entra en el disponible
+        disponible=ExpressionWrapper(
+            Q(producto__stock__gte=F('producto__reservado') + F('cantidad') - F('reservado')
+              - disponible_en_shards('producto_id')),
+            output_field=BooleanField(),
+        ),
+        total=Window(Sum(subtotal)),
+        cantidad_items=Window(Sum('cantidad')),
+    ).order_by('id')
+
+
+def _armar_carrito(lineas):
+    items = []
+    total = 0.0
+    cantidad_items = 0
+    for linea in lineas:
+        total, cantidad_items = linea.total, linea.cantidad_items
+        items.append({
+            'id': linea.id,
+            'producto': linea.producto.nombre_producto,
+            'cantidad': linea.cantidad,
+            'precio': linea.producto.precio,
+            'imageURL': linea.producto.imageURL,
+            'subtotal': linea.subtotal,
+            'disponible': bool(linea.disponible),
+        })
+    # Sin costos de envío ni descuentos por ahora: total == subtotal
+    return {'items': items, 'subtotal': total, 'total': total, 'cantidad_items': cantidad_items}
+
+
+def aplicar_operaciones(usuario, operaciones, direccion=None, todo_o_nada=False):
+    """
+    Aplica un lote de operaciones `agregar`/`modificar`/`eliminar` sobre el
+    carrito en una sola transacción y devuelve el resultado de cada una.
+
+    Las filas se leen en bloque y se escriben con `bulk_create`/`bulk_update`.
+    Un error en un ítem (stock insuficiente, carrito inexistente) sólo descarta
+    ese ítem, salvo con `todo_o_nada`, donde se lanza `OperacionesRechazadas`.
+
+    Las cantidades se reservan como en `agregar_producto`. Los productos se
+    leen sin bloquear y las reservas se aplican al final con un UPDATE
+    condicional; si entre medio otro request tomó el stock se reintenta, y el
+    último intento bloquea las filas de los productos desde el principio.
+    """
+    for intento in range(INTENTOS_OPERACIONES):
+        ultimo = intento == INTENTOS_OPERACIONES - 1
+        try:
+            resultados = _aplicar_operaciones(usuario, operaciones, direccion, todo_o_nada, bloquear=ultimo)
+        except StockInsuficiente as e:
+            if ultimo:
+                raise
+            liberar_reservas_vencidas(e.producto_ids)
+            continue
+        if direccion and any(r['accion'] == 'agregar' and r.get('ok') for r in resultados):
+            usuario.direccion = direccion
+        return resultados
+
+
+def _aplicar_operaciones(usuario, operaciones, direccion, todo_o_nada, bloquear):
+    id_usuario = usuario.id_usuario
+    carrito_ids = {op['carrito_id'] for op in operaciones if op['accion'] != 'agregar'}
+    altas_ids = {op['producto_id'] for op in operaciones if op['accion'] == 'agregar'}
+
+    with transaction.atomic():
+        # Los locks se toman en el mismo orden que en agregar_producto y
+        # confirmar_pedido (usuario, pedido, líneas, productos) para que los
+        # requests concurrentes no se bloqueen en ciclo.
+        pendiente = None
+        if altas_ids:
+            if direccion and direccion != usuario.direccion:
+                Usuario.objects.filter(pk=id_usuario).update(direccion=direccion)
+                invalidar_usuario(id_usuario)
+            pendiente = bloquear_pedido_pendiente(usuario)
+        lineas = list(Carrito.objects.select_for_update().filter(usuario_id=id_usuario, comprado=False).filter(
+            Q(pk__in=carrito_ids)
+            | Q(id_pedido__estado='Pendiente', id_pedido__id_usuario_id=id_usuario, producto_id__in=altas_ids)
+        ).order_by('pk'))
+        producto_ids = altas_ids | {linea.producto_id for linea in lineas}
+        productos = Producto.objects.filter(pk__in=producto_ids).order_by('pk')
+        if bloquear:
+            productos = productos.select_for_update()
+        productos = {producto.pk: producto for producto in productos}
+        cargar_shards(productos.values(), bloquear)
+
+        pedido = None
+        if altas_ids & productos.keys():
+            direccion = resolver_direccion(usuario, direccion)
+            pedido = obtener_pedido_pendiente(usuario, direccion, pendiente)
+
+        por_id = {linea.pk: linea for linea in lineas}
+        en_pedido = {
+            linea.producto_id: linea for linea in lineas
+            if pedido is not None and linea.id_pedido_id == pedido.pk
+        }
+        detalles = {}
+        pedido_ids = {linea.id_pedido_id for linea in lineas} | ({pedido.pk} if pedido else set())
+        for detalle in DetallePedido.objects.filter(
+            id_pedido_id__in=pedido_ids, id_producto_id__in=producto_ids
+        ).order_by('pk'):
+            detalles.setdefault((detalle.id_pedido_id, detalle.id_producto_id), []).append(detalle)
+
+        vence = vencimiento_reserva()
+        reservas = {}
+        sin_stock = set()
+
+        def reservar(producto, unidades):
+            # Reserva (o libera, si es negativo) en memoria; el UPDATE va al final
+            if unidades > 0 and unidades > producto.disponible:
+                sin_stock.add(producto.pk)
+                return False
+            producto.reservado += unidades
+            reservas[producto.pk] = reservas.get(producto.pk, 0) + unidades
+            return True
+
+        carritos_nuevos, carritos_modificados, carritos_eliminados = [], {}, set()
+        detalles_nuevos, detalles_modificados, detalles_eliminados = [], {}, set()
+
+        resumenes = {}
+
+        def ajustar(pedido_id, monto=0.0, lineas=0, unidades=0):
+            resumen = resumenes.setdefault(pedido_id, [0.0, 0, 0])
+            resumen[0] += monto
+            resumen[1] += lineas
+            resumen[2] += unidades
+
+        def descartar_detalles(lista):
+            for detalle in lista:
+                ajustar(detalle.id_pedido_id, -(detalle.subtotal or 0), -1, -(detalle.cantidad_productos or 0))
+                if detalle.pk:
+                    detalles_eliminados.add(detalle.pk)
+                else:
+                    detalles_nuevos.remove(detalle)
+        resultados = []
+
+        for op in operaciones:
+            resultado = {'accion': op['accion']}
+            resultados.append(resultado)
+
+            if op['accion'] == 'agregar':
+                producto = productos.get(op['producto_id'])
+                resultado['producto_id'] = op['producto_id']
+                if producto is None:
+                    resultado['error'] = ERROR_PRODUCTO
+                    continue
+                cantidad = op['cantidad']
+                if not reservar(producto, cantidad):
+                    resultado['error'] = ERROR_STOCK
+                    continue
+
+                linea = en_pedido.get(producto.pk)
+                if linea is None:
+                    linea = Carrito(
+                        producto_id=producto.pk, usuario_id=id_usuario, id_pedido=pedido,
+                        cantidad=cantidad, reservado=cantidad, reservado_hasta=vence,
+                    )
+                    en_pedido[producto.pk] = linea
+                    carritos_nuevos.append(linea)
+                else:
+                    linea.cantidad += cantidad
+                    linea.reservado += cantidad
+                    linea.reservado_hasta = vence
+                    if linea.pk:
+                        carritos_modificados[linea.pk] = linea
+
+                lista = detalles.setdefault((pedido.pk, producto.pk), [])
+                detalle = next((d for d in lista if d.precio_producto == producto.precio), None)
+                if detalle is None:
+                    detalle = DetallePedido(
+                        id_pedido=pedido, id_producto_id=producto.pk, cantidad_productos=cantidad,
+                        precio_producto=producto.precio, direccion_entrega=direccion,
+                    )
+                    lista.append(detalle)
+                    detalles_nuevos.append(detalle)
+                    ajustar(pedido.pk, lineas=1)
+                else:
+                    detalle.cantidad_productos += cantidad
+                    if detalle.pk:
+                        detalles_modificados[detalle.pk] = detalle
+                detalle.subtotal = detalle.cantidad_productos * detalle.precio_producto
+                ajustar(pedido.pk, cantidad * detalle.precio_producto, 0, cantidad)
+                resultado['ok'] = True
+                continue
+
+            linea = por_id.get(op['carrito_id'])
+            resultado['carrito_id'] = op['carrito_id']
+            if linea is None or linea.pk in carritos_eliminados:
+                resultado['error'] = ERROR_CARRITO
+                continue
+            producto = productos[linea.producto_id]
+            lista = detalles.get((linea.id_pedido_id, linea.producto_id), [])
+
+            if op['accion'] == 'modificar':
+                if not lista:
+                    resultado['error'] = ERROR_DETALLE
+                    continue
+                if not reservar(producto, op['cantidad'] - linea.reservado):
+                    resultado['error'] = ERROR_STOCK
+                    continue
+                linea.cantidad = linea.reservado = op['cantidad']
+                linea.reservado_hasta = vence
+                # La cantidad del carrito es única: si hay detalles a precios
+                # distintos se conserva el último y se descartan los demás.
+                detalle = lista[-1]
+                subtotal = op['cantidad'] * detalle.precio_producto
+                ajustar(
+                    detalle.id_pedido_id, subtotal - (detalle.subtotal or 0), 0,
+                    op['cantidad'] - (detalle.cantidad_productos or 0),
+                )
+                detalle.cantidad_productos = op['cantidad']
+                detalle.subtotal = subtotal
+                if detalle.pk:
+                    detalles_modificados[detalle.pk] = detalle
+                descartar_detalles(lista[:-1])
+                lista[:] = [detalle]
+            else:
+                reservar(producto, -linea.reservado)
+                carritos_eliminados.add(linea.pk)
+                descartar_detalles(lista)
+                lista.clear()
+                if en_pedido.get(linea.producto_id) is linea:
+                    del en_pedido[linea.producto_id]
+            carritos_modificados[linea.pk] = linea
+            resultado['ok'] = True
+
+        # Antes de rechazar ítems por stock se liberan las reservas vencidas
+        if sin_stock and not bloquear and hay_reservas_vencidas(sin_stock):
+            raise StockInsuficiente(sin_stock)
+        if todo_o_nada and any('error' in resultado for resultado in resultados):
+            raise OperacionesRechazadas(resultados)
+
+        # Primero se borra: una línea quitada y vuelta a agregar en el mismo
+        # lote chocaría con las restricciones únicas de carrito y detalle
+        if carritos_eliminados:
+            Carrito.objects.filter(pk__in=carritos_eliminados).delete()
+        if detalles_eliminados:
+            DetallePedido.objects.filter(pk__in=detalles_eliminados).delete()
+        Carrito.objects.bulk_create(carritos_nuevos)
+        Carrito.objects.bulk_update(
+            [linea for pk, linea in carritos_modificados.items() if pk not in carritos_eliminados],
+            ['cantidad', 'reservado', 'reservado_hasta'],
+        )
+        DetallePedido.objects.bulk_create(detalles_nuevos)
+        DetallePedido.objects.bulk_update(
+            [d for pk, d in detalles_modificados.items() if pk not in detalles_eliminados],
+            ['cantidad_productos', 'subtotal'],
+        )
+        for pedido_id, (monto, lineas, unidades) in resumenes.items():
+            ajustar_resumen(pedido_id, monto, lineas, unidades)
+
+        reservas = {pk: (unidades, 0) for pk, unidades in reservas.items() if unidades}
+        if reservas:
+            mover_stock(reservas, {pk: productos[pk].shards_stock for pk in reservas})
+            invalidar_disponibilidad()
+
+    return resultados
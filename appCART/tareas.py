@@ -0,0 +1,8 @@
+from appTAREAS.cola import tarea
+
+from . import services
+
+
+@tarea('finalizar_pedido')
+def finalizar_pedido(pedido_id):
+    services.finalizar_pedido(pedido_id)
@@ -1,3 +1,1105 @@
-from django.test import TestCase
+import asyncio
+import json
+import re
+import threading
+import time
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import close_old_connections, connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from appFOOD.cache import CATALOGO_CACHE
+from appFOOD.models import Producto, StockShard
+from appFOOD.shards import repartir_stock
+from Food_ISPC.pruebas import crear_producto, crear_usuario
+from appUSERS.cache import USUARIOS_CACHE
+from . import eventos
+from .models import Carrito, ClaveIdempotencia, DetallePedido, EventoPedido, Pedido
+from .views import EventosPedidosAsincrono, VerCarritoAsincrono, VerDashboardAsincrono, VerDetallePedidoAsincrono
+from .services import (StockInsuficiente, agregar_producto, aplicar_operaciones, confirmar_pedido,
+                       liberar_reservas_vencidas, pedidos_inconsistentes)
+
+
+def procesar_tareas():
+    call_command('procesar_tareas', '--una-vez', stdout=StringIO())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class AgregarProductoAlCarritoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario(direccion='Calle 1')
+        self.producto = crear_producto(stock=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def agregar(self, cantidad, **extra):
+        return self.client.post(
+            f'/appCART/agregar/{self.producto.pk}/', {'cantidad': cantidad, **extra}, format='json'
+        )
+
+    def test_agrega_y_acumula_cantidad(self):
+        self.assertEqual(self.agregar(2).status_code, 200)
+        self.assertEqual(self.agregar(3).status_code, 200)
+
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.stock, self.producto.disponible), (10, 5))
+        carrito = Carrito.objects.get(usuario=self.usuario)
+        self.assertEqual((carrito.cantidad, carrito.reservado), (5, 5))
+        detalle = DetallePedido.objects.get(id_pedido=carrito.id_pedido)
+        self.assertEqual(detalle.cantidad_productos, 5)
+        self.assertEqual(detalle.subtotal, 500.0)
+        self.assertEqual(detalle.direccion_entrega, 'Calle 1')
+
+    def test_direccion_actualiza_perfil_pedido_y_detalles(self):
+        self.agregar(1)
+        self.agregar(1, direccion='Calle 2')
+
+        self.usuario.refresh_from_db()
+        pedido = Pedido.objects.get(id_usuario=self.usuario, estado='Pendiente')
+        self.assertEqual(self.usuario.direccion, 'Calle 2')
+        self.assertEqual(pedido.direccion_entrega, 'Calle 2')
+        self.assertEqual(
+            list(pedido.detalles.values_list('direccion_entrega', flat=True)), ['Calle 2']
+        )
+
+    def test_stock_insuficiente_no_deja_cambios(self):
+        respuesta = self.agregar(11, direccion='Otra calle')
+
+        self.assertEqual(respuesta.status_code, 400)
+        self.producto.refresh_from_db()
+        self.usuario.refresh_from_db()
+        self.assertEqual(self.producto.stock, 10)
+        self.assertEqual(self.usuario.direccion, 'Calle 1')
+        self.assertFalse(Pedido.objects.exists())
+        self.assertFalse(Carrito.objects.exists())
+
+    def test_producto_inexistente(self):
+        respuesta = self.client.post('/appCART/agregar/999/', {'cantidad': 1}, format='json')
+        self.assertEqual(respuesta.status_code, 404)
+
+    def test_cantidad_invalida(self):
+        self.assertEqual(self.agregar(0).status_code, 400)
+        self.assertEqual(self.client.post(f'/appCART/agregar/{self.producto.pk}/').status_code, 400)
+
+    def test_cantidad_de_consultas_acotada(self):
+        agregar_producto(self.usuario, self.producto.pk, 1)
+        with CaptureQueriesContext(connection) as consultas:
+            agregar_producto(self.usuario, self.producto.pk, 1, 'Calle 3')
+        # SELECT precio, UPDATE usuario, SELECT pedido, UPDATE pedido, UPDATE detalles,
+        # UPDATE carrito, UPDATE detalle, UPDATE resumen, UPDATE reserva + savepoint/release
+        self.assertLessEqual(len(consultas), 11)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class OperacionesCarritoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario(direccion='Calle 1')
+        self.pizza = crear_producto(stock=5, precio=50.0, nombre='Pizza')
+        self.empanada = crear_producto(stock=20, precio=10.0, nombre='Empanada')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def operar(self, operaciones, **extra):
+        return self.client.post('/appCART/operaciones/', {'operaciones': operaciones, **extra}, format='json')
+
+    def test_aplica_lote_y_devuelve_carrito(self):
+        agregar_producto(self.usuario, self.pizza.pk, 2)
+        linea_pizza = Carrito.objects.get(producto=self.pizza)
+
+        respuesta = self.operar([
+            {'accion': 'agregar', 'producto_id': self.empanada.pk, 'cantidad': 6},
+            {'accion': 'agregar', 'producto_id': self.empanada.pk, 'cantidad': 2},
+            {'accion': 'modificar', 'carrito_id': linea_pizza.pk, 'cantidad': 4},
+        ])
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(all(r.get('ok') for r in respuesta.data['resultados']))
+        carrito = {linea['producto']: linea['cantidad'] for linea in respuesta.data['carrito']['items']}
+        self.assertEqual(carrito, {'Pizza': 4, 'Empanada': 8})
+        self.pizza.refresh_from_db()
+        self.empanada.refresh_from_db()
+        self.assertEqual((self.pizza.disponible, self.empanada.disponible), (1, 12))
+        detalle = DetallePedido.objects.get(id_producto=self.empanada)
+        self.assertEqual((detalle.cantidad_productos, detalle.subtotal), (8, 80.0))
+
+    def test_errores_por_item_no_descartan_el_lote(self):
+        agregar_producto(self.usuario, self.pizza.pk, 1)
+        linea_pizza = Carrito.objects.get(producto=self.pizza)
+
+        respuesta = self.operar([
+            {'accion': 'agregar', 'producto_id': self.pizza.pk, 'cantidad': 10},
+            {'accion': 'eliminar', 'carrito_id': linea_pizza.pk},
+            {'accion': 'eliminar', 'carrito_id': 999},
+            {'accion': 'agregar', 'producto_id': self.empanada.pk, 'cantidad': 1},
+        ])
+
+        self.assertEqual(respuesta.status_code, 200)
+        resultados = respuesta.data['resultados']
+        self.assertEqual(resultados[0]['error'], 'Stock insuficiente')
+        self.assertTrue(resultados[1]['ok'])
+        self.assertIn('error', resultados[2])
+        self.assertTrue(resultados[3]['ok'])
+        self.pizza.refresh_from_db()
+        self.assertEqual((self.pizza.stock, self.pizza.reservado), (5, 0))
+        self.assertFalse(DetallePedido.objects.filter(id_producto=self.pizza).exists())
+        self.assertEqual([linea['producto'] for linea in respuesta.data['carrito']['items']], ['Empanada'])
+
+    def test_quitar_y_volver_a_agregar_en_el_mismo_lote(self):
+        agregar_producto(self.usuario, self.pizza.pk, 2)
+        linea_pizza = Carrito.objects.get(producto=self.pizza)
+
+        respuesta = self.operar([
+            {'accion': 'eliminar', 'carrito_id': linea_pizza.pk},
+            {'accion': 'agregar', 'producto_id': self.pizza.pk, 'cantidad': 1},
+        ])
+
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertTrue(all(r.get('ok') for r in respuesta.data['resultados']))
+        self.assertEqual([(l['producto'], l['cantidad']) for l in respuesta.data['carrito']['items']], [('Pizza', 1)])
+        detalle = DetallePedido.objects.get(id_producto=self.pizza)
+        self.assertEqual((detalle.cantidad_productos, detalle.subtotal), (1, 50.0))
+        self.pizza.refresh_from_db()
+        self.assertEqual(self.pizza.reservado, 1)
+
+    def test_todo_o_nada_no_guarda_cambios(self):
+        respuesta = self.operar([
+            {'accion': 'agregar', 'producto_id': self.empanada.pk, 'cantidad': 1},
+            {'accion': 'agregar', 'producto_id': self.pizza.pk, 'cantidad': 6},
+        ], todo_o_nada=True)
+
+        self.assertEqual(respuesta.status_code, 409)
+        self.empanada.refresh_from_db()
+        self.assertEqual(self.empanada.stock, 20)
+        self.assertFalse(Carrito.objects.exists())
+        self.assertFalse(Pedido.objects.exists())
+
+    def test_no_modifica_carritos_de_otros_usuarios(self):
+        otro = crear_usuario('otro@test.com')
+        agregar_producto(otro, self.pizza.pk, 1)
+        linea_ajena = Carrito.objects.get(usuario=otro)
+
+        respuesta = self.operar([{'accion': 'eliminar', 'carrito_id': linea_ajena.pk}])
+
+        self.assertIn('error', respuesta.data['resultados'][0])
+        self.assertTrue(Carrito.objects.filter(pk=linea_ajena.pk).exists())
+
+    def test_valida_campos_por_accion(self):
+        respuesta = self.operar([{'accion': 'modificar', 'carrito_id': 1}])
+        self.assertEqual(respuesta.status_code, 400)
+
+    def test_consultas_no_crecen_con_el_tamanio_del_lote(self):
+        productos = [crear_producto(stock=10, nombre=f'Producto {i}') for i in range(10)]
+        operaciones = [{'accion': 'agregar', 'producto_id': p.pk, 'cantidad': 1} for p in productos]
+
+        otro = crear_usuario('otro@test.com')
+        with CaptureQueriesContext(connection) as uno:
+            aplicar_operaciones(otro, operaciones[:1])
+        with CaptureQueriesContext(connection) as diez:
+            aplicar_operaciones(self.usuario, operaciones)
+        self.assertEqual(len(uno), len(diez))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class VerCarritoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.pizza = crear_producto(stock=5, precio=50.0, nombre='Pizza')
+        self.empanada = crear_producto(stock=20, precio=10.0, nombre='Empanada')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_una_consulta_con_totales(self):
+        agregar_producto(self.usuario, self.pizza.pk, 2)
+        agregar_producto(self.usuario, self.empanada.pk, 3)
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get('/appCART/ver/').json()
+
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual((respuesta['subtotal'], respuesta['total'], respuesta['cantidad_items']), (130.0, 130.0, 5))
+        self.assertEqual([item['subtotal'] for item in respuesta['items']], [100.0, 30.0])
+        self.assertTrue(all(item['disponible'] for item in respuesta['items']))
+
+    def test_ignora_filas_de_pedidos_anteriores(self):
+        agregar_producto(self.usuario, self.pizza.pk, 1)
+        Pedido.objects.update(estado='Aprobado')
+        agregar_producto(self.usuario, self.pizza.pk, 2)
+
+        respuesta = self.client.get('/appCART/ver/').json()
+
+        self.assertEqual(Carrito.objects.filter(usuario=self.usuario).count(), 2)
+        self.assertEqual([item['cantidad'] for item in respuesta['items']], [2])
+        self.assertEqual(respuesta['total'], 100.0)
+
+    def test_marca_lineas_sin_stock(self):
+        agregar_producto(self.usuario, self.pizza.pk, 2)
+        Producto.objects.filter(pk=self.pizza.pk).update(stock=1)
+
+        item = self.client.get('/appCART/ver/').json()['items'][0]
+        self.assertFalse(item['disponible'])
+
+    def test_carrito_vacio_y_modo_compatible(self):
+        self.assertEqual(self.client.get('/appCART/ver/').json(),
+                         {'items': [], 'subtotal': 0.0, 'total': 0.0, 'cantidad_items': 0})
+        agregar_producto(self.usuario, self.pizza.pk, 1)
+        self.assertIsInstance(self.client.get('/appCART/ver/?sin_totales=true').json(), list)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class VerDashboardTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario(direccion='Calle 1')
+        self.producto = crear_producto(stock=100)
+        for _ in range(5):
+            agregar_producto(self.usuario, self.producto.pk, 1)
+            Pedido.objects.filter(id_usuario=self.usuario, estado='Pendiente').update(estado='Aprobado')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_pagina_por_cursor_del_mas_reciente_al_mas_antiguo(self):
+        vistos = []
+        url = '/appCART/ver_dashboard/?page_size=2'
+        while url:
+            pagina = self.client.get(url).json()
+            self.assertLessEqual(len(pagina['results']), 2)
+            vistos += [pedido['id_pedidos'] for pedido in pagina['results']]
+            url = pagina['next']
+
+        esperados = list(Pedido.objects.order_by('-id_pedidos').values_list('id_pedidos', flat=True))
+        self.assertEqual(vistos, esperados)
+
+    def test_modo_compatible_sin_paginar(self):
+        respuesta = self.client.get('/appCART/ver_dashboard/?sin_paginar=true').json()
+        self.assertEqual(list(respuesta), ['results'])
+        self.assertEqual(len(respuesta['results']), 5)
+
+    def test_totales_calculados_en_sql(self):
+        otro = crear_producto(stock=10, precio=30.0, nombre='Empanada')
+        agregar_producto(self.usuario, otro.pk, 3)
+
+        pedido = self.client.get('/appCART/ver_dashboard/?page_size=20').json()['results'][0]
+        self.assertEqual(pedido['monto_total'], 90.0)
+        self.assertEqual(pedido['cantidad_productos'], 3)
+        self.assertEqual(pedido['detalles'][0]['nombre_producto'], 'Empanada')
+
+    def test_consultas_constantes_y_sin_escrituras(self):
+        Pedido.objects.update(direccion_entrega=None)
+        self.client.get('/appCART/ver_dashboard/?sin_paginar=true')
+        with CaptureQueriesContext(connection) as pocos:
+            self.client.get('/appCART/ver_dashboard/?sin_paginar=true')
+
+        for _ in range(10):
+            agregar_producto(self.usuario, crear_producto(nombre='Otro').pk, 1)
+            Pedido.objects.filter(estado='Pendiente').update(estado='Aprobado')
+        with CaptureQueriesContext(connection) as muchos:
+            respuesta = self.client.get('/appCART/ver_dashboard/?sin_paginar=true')
+
+        self.assertEqual(len(pocos), len(muchos))
+        self.assertLessEqual(len(muchos), 2)
+        self.assertFalse(any(q['sql'].startswith(('UPDATE', 'INSERT')) for q in muchos.captured_queries))
+        self.assertEqual(respuesta.json()['results'][-1]['direccion_entrega'], 'Calle 1')
+
+    def test_migracion_completa_direccion_entrega(self):
+        from importlib import import_module
+        from django.apps import apps
+
+        migracion = import_module('appCART.migrations.0002_completar_direccion_entrega')
+        Pedido.objects.update(direccion_entrega='Sin especificar')
+        sin_direccion = crear_usuario('sin@test.com')
+        agregar_producto(sin_direccion, self.producto.pk, 1)
+
+        migracion.completar_direccion_entrega(apps, connection.schema_editor())
+
+        self.assertEqual(
+            set(Pedido.objects.filter(id_usuario=self.usuario).values_list('direccion_entrega', flat=True)),
+            {'Calle 1'},
+        )
+        self.assertEqual(Pedido.objects.get(id_usuario=sin_direccion).direccion_entrega, 'Sin especificar')
+
+    def test_fields_y_expand(self):
+        with CaptureQueriesContext(connection) as consultas:
+            sin_detalles = self.client.get('/appCART/ver_dashboard/?sin_paginar=true&fields=id_pedidos,estado').json()
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(set(sin_detalles['results'][0]), {'id_pedidos', 'estado'})
+        self.assertNotIn('direccion_entrega', consultas.captured_queries[0]['sql'])
+
+        url = ('/appCART/ver_dashboard/?sin_paginar=true&fields=id_pedidos,detalles.cantidad_productos,'
+               'detalles.id_producto.nombre_producto&expand=detalles.id_producto')
+        with CaptureQueriesContext(connection) as consultas:
+            pedido = self.client.get(url).json()['results'][0]
+        self.assertEqual(len(consultas), 2)
+        self.assertEqual(pedido['detalles'], [{'id_producto': {'nombre_producto': 'Hamburguesa'}, 'cantidad_productos': 1}])
+
+        self.assertEqual(self.client.get('/appCART/ver_dashboard/?fields=total').status_code, 400)
+        self.assertEqual(self.client.get('/appCART/ver_dashboard/?expand=estado').status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class VerDetallePedidoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario(direccion='Calle 1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.pedidos = []
+        for i in range(3):
+            for j in range(i + 1):
+                agregar_producto(self.usuario, crear_producto(precio=10.0 * (j + 1), nombre=f'P{i}{j}').pk, 2)
+            pedido = Pedido.objects.get(id_usuario=self.usuario, estado='Pendiente')
+            Pedido.objects.filter(pk=pedido.pk).update(estado='Aprobado')
+            self.pedidos.append(pedido.pk)
+
+    def test_detalle_con_total_y_consultas_fijas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(f'/appCART/detalle_pedido/{self.pedidos[2]}/').json()
+
+        self.assertEqual(len(consultas), 2)
+        self.assertEqual(respuesta['pedido']['monto_total'], 120.0)
+        self.assertEqual([d['producto'] for d in respuesta['detalles']], ['P20', 'P21', 'P22'])
+
+    def test_varios_pedidos_en_una_llamada(self):
+        otro = crear_usuario('otro@test.com')
+        agregar_producto(otro, crear_producto().pk, 1)
+        ajeno = Pedido.objects.get(id_usuario=otro).pk
+        ids = ','.join(str(i) for i in [*self.pedidos, ajeno])
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(f'/appCART/detalle_pedido/?ids={ids}').json()
+
+        self.assertEqual(len(consultas), 2)
+        self.assertEqual([r['pedido']['monto_total'] for r in respuesta['results']], [20.0, 60.0, 120.0])
+        self.assertEqual(respuesta['no_encontrados'], [ajeno])
+
+    def test_pedido_inexistente_e_ids_invalidos(self):
+        self.assertEqual(self.client.get('/appCART/detalle_pedido/999/').status_code, 404)
+        self.assertEqual(self.client.get('/appCART/detalle_pedido/?ids=a,b').status_code, 400)
+        self.assertEqual(self.client.get('/appCART/detalle_pedido/').status_code, 400)
+
+    def test_fields_sin_detalles_no_los_consulta(self):
+        url = f'/appCART/detalle_pedido/{self.pedidos[2]}/?fields=pedido.estado,pedido.monto_total'
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url).json()
+
+        self.assertEqual(len(consultas), 1)
+        self.assertEqual(respuesta, {'pedido': {'estado': 'Aprobado', 'monto_total': 120.0}})
+        self.assertEqual(self.client.get(f'{url},pedido.total').status_code, 400)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class VistasAsincronasTests(TestCase):
+
+    def setUp(self):
+        caches[USUARIOS_CACHE].clear()
+        self.usuario = crear_usuario(direccion='Calle 1')
+        self.producto = crear_producto(stock=20)
+        agregar_producto(self.usuario, self.producto.pk, 2)
+        self.confirmado = confirmar_pedido(self.usuario)
+        self.pendiente = agregar_producto(self.usuario, self.producto.pk, 3)
+        self.token = f'Bearer {AccessToken.for_user(self.usuario)}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.token)
+
+    def asincrona(self, vista, url, autorizacion=None, **kwargs):
+        request = RequestFactory().get(url, HTTP_AUTHORIZATION=autorizacion or self.token)
+        return async_to_sync(vista.as_view())(request, **kwargs)
+
+    def test_misma_respuesta_que_las_vistas_drf(self):
+        casos = [
+            (VerCarritoAsincrono, '/appCART/ver/', {}),
+            (VerCarritoAsincrono, '/appCART/ver/?sin_totales=true', {}),
+            (VerDashboardAsincrono, '/appCART/ver_dashboard/', {}),
+            (VerDashboardAsincrono, '/appCART/ver_dashboard/?page_size=1', {}),
+            (VerDashboardAsincrono, '/appCART/ver_dashboard/?sin_paginar=true', {}),
+            (VerDetallePedidoAsincrono, f'/appCART/detalle_pedido/{self.confirmado.pk}/',
+             {'pedido_id': self.confirmado.pk}),
+            (VerDetallePedidoAsincrono, '/appCART/detalle_pedido/999/', {'pedido_id': 999}),
+            (VerDetallePedidoAsincrono, f'/appCART/detalle_pedido/?ids={self.pendiente.pk},{self.confirmado.pk},999', {}),
+            (VerDetallePedidoAsincrono, '/appCART/detalle_pedido/?ids=a', {}),
+            (VerCarritoAsincrono, '/appCART/ver/?fields=id_pedido,productos.nombre', {}),
+            (VerDashboardAsincrono, '/appCART/ver_dashboard/?fields=estado,detalles.subtotal', {}),
+            (VerDashboardAsincrono, '/appCART/ver_dashboard/?fields=no_existe', {}),
+            (VerDetallePedidoAsincrono, f'/appCART/detalle_pedido/{self.confirmado.pk}/?fields=detalles',
+             {'pedido_id': self.confirmado.pk}),
+        ]
+        for vista, url, kwargs in casos:
+            with self.subTest(url=url):
+                sincrona = self.client.get(url)
+                asincrona = self.asincrona(vista, url, **kwargs)
+                self.assertEqual(asincrona.status_code, sincrona.status_code)
+                self.assertEqual(asincrona.content, sincrona.content)
+
+    def test_autenticacion_jwt(self):
+        sin_token = async_to_sync(VerCarritoAsincrono.as_view())(RequestFactory().get('/appCART/ver/'))
+        self.assertEqual(sin_token.status_code, 401)
+        self.assertEqual(sin_token['WWW-Authenticate'], 'Bearer realm="api"')
+
+        invalido = self.asincrona(VerCarritoAsincrono, '/appCART/ver/', autorizacion='Bearer no-es-un-token')
+        self.assertEqual(invalido.status_code, 401)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer no-es-un-token')
+        self.assertEqual(invalido.content, self.client.get('/appCART/ver/').content)
+
+        self.usuario.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+        self.assertEqual(self.asincrona(VerCarritoAsincrono, '/appCART/ver/').status_code, 401)
+
+    def test_consultas_de_la_version_async(self):
+        # Autenticación + la misma consulta única del carrito
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.asincrona(VerCarritoAsincrono, '/appCART/ver/').status_code, 200)
+        self.assertEqual(len(consultas), 2)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class EventosPedidosTests(TestCase):
+
+    def setUp(self):
+        caches[USUARIOS_CACHE].clear()
+        eventos._broker = None
+        self.addCleanup(setattr, eventos, '_broker', None)
+        self.usuario = crear_usuario(direccion='Calle 1')
+        self.producto = crear_producto(stock=20)
+        self.token = f'Bearer {AccessToken.for_user(self.usuario)}'
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=self.token)
+
+    def pedir(self, url, **cabeceras):
+        request = RequestFactory().get(url, HTTP_AUTHORIZATION=self.token, **cabeceras)
+        return async_to_sync(EventosPedidosAsincrono.as_view())(request)
+
+    def leer(self, url, **cabeceras):
+        return json.loads(self.pedir(url, **cabeceras).content)
+
+    def confirmar(self, usuario):
+        agregar_producto(usuario, self.producto.pk, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            return confirmar_pedido(usuario)
+
+    def test_solo_pedidos_cambiados_desde_el_cursor(self):
+        cursor = self.leer('/appCART/eventos/?espera=0')['ultimo_id']
+        pedido = self.confirmar(self.usuario)
+        self.confirmar(crear_usuario('otro@test.com', direccion='Calle 2'))
+
+        datos = self.leer(f'/appCART/eventos/?desde={cursor}')
+        self.assertEqual([(e['id_pedidos'], e['estado']) for e in datos['eventos']], [(pedido.pk, 'Aprobado')])
+        self.assertFalse(datos['resincronizar'])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put('/appCART/ver_dashboard/entregar/', {'id_pedidos': pedido.pk}, format='json')
+        retomado = self.leer('/appCART/eventos/', HTTP_LAST_EVENT_ID=str(datos['ultimo_id']))
+        self.assertEqual([e['estado'] for e in retomado['eventos']], ['Entregado'])
+
+        # Sin ASGI responde enseguida con lo mismo
+        self.assertEqual(self.client.get(f'/appCART/eventos/?desde={cursor}').json()['eventos'],
+                         datos['eventos'] + retomado['eventos'])
+        self.assertEqual(self.pedir('/appCART/eventos/?desde=x').status_code, 400)
+
+    @override_settings(EVENTOS_HISTORIAL=2, EVENTOS_BROKER='appCART.eventos.BrokerEnMemoria')
+    def test_cursor_perdido_pide_resincronizar(self):
+        for _ in range(3):
+            eventos.broker().publicar(self.usuario.pk, {'estado': 'Aprobado'})
+        datos = self.leer('/appCART/eventos/?desde=0')
+        self.assertEqual((datos['eventos'], datos['resincronizar'], datos['ultimo_id']), ([], True, 3))
+        self.assertEqual(len(self.leer('/appCART/eventos/?desde=1')['eventos']), 2)
+        # Cursor de antes de un reinicio del proceso
+        self.assertTrue(self.leer('/appCART/eventos/?desde=50')['resincronizar'])
+
+    @override_settings(EVENTOS_DURACION=0.3, EVENTOS_LATIDO=0.1)
+    def test_server_sent_events(self):
+        pedido = self.confirmar(self.usuario)
+        respuesta = self.pedir('/appCART/eventos/?desde=0', HTTP_ACCEPT='text/event-stream')
+        self.assertEqual(respuesta['Content-Type'], 'text/event-stream')
+
+        async def leer():
+            return b''.join([parte async for parte in respuesta.streaming_content]).decode()
+
+        cuerpo = async_to_sync(leer)()
+        self.assertTrue(cuerpo.startswith('retry: '))
+        evento = EventoPedido.objects.get()
+        self.assertIn(f'id: {evento.pk}\nevent: pedido\ndata: {{"id_pedidos": {pedido.pk}, "estado": "Aprobado"', cuerpo)
+        self.assertIn(': latido', cuerpo)
+
+    @override_settings(EVENTOS_BROKER='appCART.eventos.BrokerEnMemoria')
+    def test_miles_de_suscriptores_inactivos_no_consultan_la_base(self):
+        # La primera conexión deja al usuario en la caché
+        self.pedir('/appCART/eventos/?espera=0')
+        vista = EventosPedidosAsincrono.as_view()
+        suscriptores = 2000
+
+        async def suscribir():
+            fuente = eventos.broker()
+            pedidos = [
+                asyncio.ensure_future(vista(RequestFactory().get('/appCART/eventos/?desde=0&espera=10',
+                                                                 HTTP_AUTHORIZATION=self.token)))
+                for _ in range(suscriptores)
+            ]
+            while fuente.suscriptores() < suscriptores:
+                await asyncio.sleep(0.01)
+            await asyncio.sleep(0.2)
+            fuente.publicar(self.usuario.pk, {'id_pedidos': 1, 'estado': 'Entregado'})
+            return await asyncio.gather(*pedidos)
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuestas = async_to_sync(suscribir)()
+        self.assertEqual(len(consultas), 0)
+        self.assertEqual({r.content for r in respuestas}, {respuestas[0].content})
+        self.assertEqual(json.loads(respuestas[0].content)['eventos'][0]['estado'], 'Entregado')
+        self.assertEqual(eventos.broker().suscriptores(), 0)
+
+
+@override_settings(EVENTOS_SONDEO=0.05)
+class BrokerBaseDeDatosTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+
+    def test_lo_publicado_en_otro_proceso_despierta_al_suscriptor(self):
+        publica, escucha = eventos.BrokerBaseDeDatos(), eventos.BrokerBaseDeDatos()
+
+        async def escenario():
+            esperando = asyncio.ensure_future(escucha.esperar(self.usuario.pk, 0, 5))
+            while escucha.suscriptores() < 1:
+                await asyncio.sleep(0.01)
+            await sync_to_async(publica.publicar)(self.usuario.pk, {'estado': 'Entregado'})
+            return await esperando
+
+        inicio = time.monotonic()
+        recibidos, resincronizar = async_to_sync(escenario)()
+        self.assertEqual([datos for _, datos in recibidos], [{'estado': 'Entregado'}])
+        self.assertFalse(resincronizar)
+        self.assertLess(time.monotonic() - inicio, 2)
+        self.assertEqual(escucha.suscriptores(), 0)
+
+    def test_los_suscriptores_inactivos_comparten_un_sondeo(self):
+        fuente = eventos.BrokerBaseDeDatos()
+        suscriptores = 200
+
+        # Las consultas corren en este hilo (sync_to_async), con esta conexión
+        contar = sync_to_async(lambda: len(connection.queries_log))
+
+        async def escenario():
+            pedidos = [asyncio.ensure_future(fuente.esperar(self.usuario.pk, 0, 10)) for _ in range(suscriptores)]
+            while fuente.suscriptores() < suscriptores:
+                await asyncio.sleep(0.01)
+            antes = await contar()
+            await asyncio.sleep(0.3)
+            inactivos = await contar() - antes
+            await sync_to_async(fuente.publicar)(self.usuario.pk, {'estado': 'Entregado'})
+            return inactivos, await asyncio.gather(*pedidos)
+
+        with CaptureQueriesContext(connection):
+            inactivos, respuestas = async_to_sync(escenario)()
+        # Un sondeo por proceso, no uno por suscriptor
+        self.assertLess(inactivos, 20)
+        self.assertEqual({len(recibidos) for recibidos, _ in respuestas}, {1})
+
+    def test_cursor_depurado_pide_resincronizar(self):
+        fuente = eventos.BrokerBaseDeDatos(retencion=60)
+        for _ in range(3):
+            fuente.publicar(self.usuario.pk, {'estado': 'Aprobado'})
+        EventoPedido.objects.update(creado=timezone.now() - timezone.timedelta(minutes=5))
+        fuente._proxima_depuracion = 0
+        ultimo = fuente.publicar(self.usuario.pk, {'estado': 'Entregado'})
+
+        self.assertEqual(fuente.despues(self.usuario.pk, 0), ([], True))
+        self.assertEqual(fuente.despues(self.usuario.pk, ultimo - 1), ([(ultimo, {'estado': 'Entregado'})], False))
+        self.assertEqual(fuente.despues(self.usuario.pk, ultimo + 50), ([], True))
+
+    @override_settings(WEB_CONCURRENCY=2)
+    def test_el_broker_en_memoria_no_admite_varios_workers(self):
+        with self.assertRaises(ImproperlyConfigured):
+            eventos.BrokerEnMemoria()
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ResumenPedidoTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario(direccion='Calle 1')
+        self.pizza = crear_producto(stock=20, precio=50.0, nombre='Pizza')
+        self.empanada = crear_producto(stock=20, precio=10.0, nombre='Empanada')
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def assertResumen(self, monto, lineas, unidades):
+        pedido = Pedido.objects.get(id_usuario=self.usuario)
+        self.assertEqual((pedido.monto_total, pedido.cantidad_lineas, pedido.cantidad_unidades), (monto, lineas, unidades))
+        self.assertIsNotNone(pedido.fecha_modificacion)
+        self.assertFalse(pedidos_inconsistentes(Pedido.objects.all()).exists())
+
+    def test_cada_operacion_mantiene_el_resumen(self):
+        self.client.post(f'/appCART/agregar/{self.pizza.pk}/', {'cantidad': 2}, format='json')
+        self.client.post(f'/appCART/agregar/{self.empanada.pk}/', {'cantidad': 3}, format='json')
+        self.assertResumen(130.0, 2, 5)
+
+        linea_pizza = Carrito.objects.get(producto=self.pizza)
+        self.client.put(f'/appCART/modificar_cantidad/{linea_pizza.pk}/', {'cantidad': 4}, format='json')
+        self.assertResumen(230.0, 2, 7)
+
+        linea_empanada = Carrito.objects.get(producto=self.empanada)
+        self.client.delete(f'/appCART/eliminar/{linea_empanada.pk}/')
+        self.assertResumen(200.0, 1, 4)
+
+        self.client.post('/appCART/operaciones/', {'operaciones': [
+            {'accion': 'agregar', 'producto_id': self.empanada.pk, 'cantidad': 1},
+            {'accion': 'modificar', 'carrito_id': linea_pizza.pk, 'cantidad': 1},
+        ]}, format='json')
+        self.assertResumen(60.0, 2, 2)
+
+        self.assertEqual(self.client.post('/appCART/confirmar/').status_code, 200)
+        self.assertResumen(60.0, 2, 2)
+        self.assertEqual(Pedido.objects.get(id_usuario=self.usuario).estado, 'Aprobado')
+
+    def test_no_modifica_ni_elimina_lineas_ajenas(self):
+        otro = crear_usuario('otro@test.com')
+        agregar_producto(otro, self.pizza.pk, 1)
+        linea_ajena = Carrito.objects.get(usuario=otro)
+
+        self.assertEqual(self.client.put(f'/appCART/modificar_cantidad/{linea_ajena.pk}/', {'cantidad': 3},
+                                         format='json').status_code, 404)
+        self.assertEqual(self.client.delete(f'/appCART/eliminar/{linea_ajena.pk}/').status_code, 404)
+        self.assertEqual(Carrito.objects.get(pk=linea_ajena.pk).cantidad, 1)
+
+    def test_comando_recalcula_y_verifica(self):
+        from django.core.management import CommandError, call_command
+
+        agregar_producto(self.usuario, self.pizza.pk, 2)
+        Pedido.objects.update(monto_total=0, cantidad_lineas=0, cantidad_unidades=0)
+        with self.assertRaises(CommandError):
+            call_command('resumen_pedidos', '--solo-verificar', stdout=StringIO())
+
+        call_command('resumen_pedidos', '--lote', '1', stdout=StringIO())
+        pedido = Pedido.objects.get()
+        self.assertEqual((pedido.monto_total, pedido.cantidad_lineas, pedido.cantidad_unidades), (100.0, 1, 2))
+
+
+def escaneos_completos(consultas):
+    """Sentencias capturadas cuyo plan recorre una tabla entera."""
+    escaneos = []
+    with connection.cursor() as cursor:
+        for consulta in consultas:
+            sql = consulta['sql']
+            if not sql.startswith(('SELECT', 'UPDATE', 'DELETE')):
+                continue
+            if connection.vendor == 'sqlite':
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                # "SCAN tabla" sin índice; "SCAN (subquery-1)" recorre un resultado intermedio
+                pasos = [fila[-1] for fila in cursor.fetchall()]
+                malos = [paso for paso in pasos if re.fullmatch(r'SCAN [^(\s]+', paso)]
+            elif connection.vendor == 'mysql':
+                cursor.execute('EXPLAIN ' + sql)
+                columnas = [columna[0] for columna in cursor.description]
+                filas = [dict(zip(columnas, fila)) for fila in cursor.fetchall()]
+                malos = [fila['table'] for fila in filas if fila['type'] == 'ALL' and fila['table']]
+            else:
+                malos = []
+            if malos:
+                escaneos.append((sql, malos))
+    return escaneos
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PlanesDeConsultaTests(TestCase):
+    """Cada consulta de los endpoints de appCART debe usar un índice."""
+
+    @classmethod
+    def setUpTestData(cls):
+        productos = [crear_producto(stock=1000, precio=10.0 + i, nombre=f'Producto {i}') for i in range(30)]
+        cls.usuarios = [crear_usuario(f'cliente{i}@test.com', direccion='Calle 1') for i in range(3)]
+        for usuario in cls.usuarios:
+            for pedido in range(5):
+                for producto in productos[pedido:pedido + 3]:
+                    agregar_producto(usuario, producto.pk, 1)
+                if pedido < 4:
+                    confirmar_pedido(usuario)
+        procesar_tareas()
+        cls.usuario = cls.usuarios[0]
+        cls.producto = productos[-1]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def assertSinEscaneos(self, metodo, url, datos=None):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = getattr(self.client, metodo)(url, datos, format='json')
+        self.assertLess(respuesta.status_code, 400, respuesta.content)
+        self.assertEqual(escaneos_completos(consultas.captured_queries), [])
+
+    def test_endpoints_usan_indices(self):
+        linea = Carrito.objects.filter(usuario=self.usuario).first()
+        pedidos = list(Pedido.objects.filter(id_usuario=self.usuario).values_list('pk', flat=True))
+        casos = [
+            ('post', f'/appCART/agregar/{self.producto.pk}/', {'cantidad': 1}),
+            ('get', '/appCART/ver/', None),
+            ('put', f'/appCART/modificar_cantidad/{linea.pk}/', {'cantidad': 2}),
+            ('post', '/appCART/operaciones/', {'operaciones': [
+                {'accion': 'agregar', 'producto_id': self.producto.pk, 'cantidad': 1},
+                {'accion': 'eliminar', 'carrito_id': linea.pk},
+            ]}),
+            ('get', '/appCART/ver_dashboard/', None),
+            ('get', f'/appCART/detalle_pedido/{pedidos[0]}/', None),
+            ('get', f'/appCART/detalle_pedido/?ids={pedidos[0]},{pedidos[1]}', None),
+            ('post', '/appCART/confirmar/', None),
+            ('put', '/appCART/ver_dashboard/entregar/', {'id_pedidos': pedidos[0]}),
+        ]
+        for metodo, url, datos in casos:
+            with self.subTest(url=url):
+                self.assertSinEscaneos(metodo, url, datos)
+
+    def test_eliminar_usa_indices(self):
+        linea = Carrito.objects.filter(usuario=self.usuario).first()
+        self.assertSinEscaneos('delete', f'/appCART/eliminar/{linea.pk}/')
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class ReservasStockTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.otro = crear_usuario('otro@test.com')
+        self.producto = crear_producto(stock=3)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def vencer(self, usuario):
+        Carrito.objects.filter(usuario=usuario).update(reservado_hasta=timezone.now())
+
+    def test_confirmar_descuenta_el_stock_reservado(self):
+        agregar_producto(self.usuario, self.producto.pk, 2)
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.stock, self.producto.reservado), (3, 2))
+
+        self.assertEqual(self.client.post('/appCART/confirmar/').status_code, 200)
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.stock, self.producto.reservado), (3, 2))
+        self.assertEqual(self.client.get('/appCART/ver/').json()['items'], [])
+
+        procesar_tareas()
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.stock, self.producto.reservado), (1, 0))
+        self.assertFalse(Carrito.objects.exists())
+
+    def test_barrido_libera_reservas_vencidas(self):
+        agregar_producto(self.usuario, self.producto.pk, 2)
+        agregar_producto(self.otro, self.producto.pk, 1)
+        self.vencer(self.usuario)
+
+        salida = StringIO()
+        call_command('liberar_reservas', '--lote', '1', stdout=salida)
+        self.assertIn('1 reservas vencidas liberadas', salida.getvalue())
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.reservado, 1)
+        linea = Carrito.objects.get(usuario=self.usuario)
+        self.assertEqual((linea.cantidad, linea.reservado, linea.reservado_hasta), (2, 0, None))
+
+        # Al confirmar, la línea sin reserva se vuelve a reservar
+        confirmar_pedido(self.usuario)
+        procesar_tareas()
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.stock, self.producto.reservado), (1, 1))
+
+    def test_sin_stock_libera_vencidas_y_reintenta(self):
+        agregar_producto(self.usuario, self.producto.pk, 3)
+        with self.assertRaises(StockInsuficiente):
+            agregar_producto(self.otro, self.producto.pk, 1)
+
+        self.vencer(self.usuario)
+        agregar_producto(self.otro, self.producto.pk, 1)
+        resultado, = aplicar_operaciones(
+            self.otro, [{'accion': 'agregar', 'producto_id': self.producto.pk, 'cantidad': 1}]
+        )
+        self.assertTrue(resultado['ok'])
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.stock, self.producto.reservado), (3, 2))
+
+        # Su reserva venció y otro tomó el stock: no se puede confirmar
+        respuesta = self.client.post('/appCART/confirmar/')
+        self.assertEqual((respuesta.status_code, respuesta.json()), (400, {'error': 'Stock insuficiente'}))
+        self.assertTrue(Pedido.objects.filter(id_usuario=self.usuario, estado='Pendiente').exists())
+
+    def test_modificar_y_eliminar_ajustan_la_reserva(self):
+        agregar_producto(self.usuario, self.producto.pk, 1)
+        linea = Carrito.objects.get(usuario=self.usuario)
+        self.vencer(self.usuario)
+        liberar_reservas_vencidas()
+
+        resultado, = aplicar_operaciones(self.usuario, [{'accion': 'modificar', 'carrito_id': linea.pk, 'cantidad': 3}])
+        self.assertTrue(resultado['ok'])
+        self.producto.refresh_from_db()
+        self.assertEqual(self.producto.reservado, 3)
+
+        aplicar_operaciones(self.usuario, [{'accion': 'eliminar', 'carrito_id': linea.pk}])
+        self.producto.refresh_from_db()
+        self.assertEqual((self.producto.stock, self.producto.reservado), (3, 0))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class StockRepartidoTests(TestCase):
+
+    def setUp(self):
+        caches[CATALOGO_CACHE].clear()
+        self.usuario = crear_usuario()
+        self.producto = crear_producto(stock=10)
+        repartir_stock(self.producto.pk, 4)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def totales(self):
+        producto = Producto.objects.con_shards().get(pk=self.producto.pk)
+        return producto.stock + producto.stock_shards, producto.disponible
+
+    def test_reparte_sin_cambiar_los_totales(self):
+        self.assertEqual(
+            sorted(StockShard.objects.filter(producto=self.producto).values_list('stock', flat=True)), [2, 2, 3, 3]
+        )
+        producto = Producto.objects.get(pk=self.producto.pk)
+        self.assertEqual((producto.stock, producto.shards_stock), (0, 4))
+        item = self.client.get('/api/producto/').json()[0]
+        self.assertEqual((item['stock'], item['disponible'], item['reservado']), (10, 10, 0))
+
+    def test_reserva_y_vende_desde_los_shards(self):
+        agregar_producto(self.usuario, self.producto.pk, 2)
+        # Ningún shard tiene 7 libres: se reparte la reserva entre varios
+        resultado, = aplicar_operaciones(
+            self.usuario, [{'accion': 'agregar', 'producto_id': self.producto.pk, 'cantidad': 7}]
+        )
+        self.assertTrue(resultado['ok'])
+        self.assertEqual(self.totales(), (10, 1))
+        with self.assertRaises(StockInsuficiente):
+            agregar_producto(self.usuario, self.producto.pk, 2)
+        self.assertTrue(self.client.get('/appCART/ver/').json()['items'][0]['disponible'])
+
+        confirmar_pedido(self.usuario)
+        procesar_tareas()
+        self.assertEqual(self.totales(), (1, 1))
+        self.assertEqual(Producto.objects.get(pk=self.producto.pk).stock, 0)
+
+    def test_rebalancea_y_vuelve_a_una_fila(self):
+        agregar_producto(self.usuario, self.producto.pk, 5)
+
+        call_command('repartir_stock', stdout=StringIO())
+        disponibles = [s.stock - s.reservado for s in StockShard.objects.filter(producto=self.producto)]
+        self.assertEqual(sorted(disponibles), [1, 1, 1, 2])
+
+        call_command('repartir_stock', str(self.producto.pk), '--shards', '0', stdout=StringIO())
+        producto = Producto.objects.get(pk=self.producto.pk)
+        self.assertEqual((producto.stock, producto.reservado, producto.shards_stock), (10, 5, 0))
+        self.assertFalse(StockShard.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class IdempotenciaTests(TestCase):
+
+    def setUp(self):
+        self.usuario = crear_usuario()
+        self.producto = crear_producto(stock=10)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def agregar(self, cantidad, clave='clave-1'):
+        return self.client.post(f'/appCART/agregar/{self.producto.pk}/', {'cantidad': cantidad},
+                                format='json', HTTP_IDEMPOTENCY_KEY=clave)
+
+    def test_reintento_repite_la_respuesta_sin_ejecutar(self):
+        primera = self.agregar(2)
+        segunda = self.agregar(2)
+
+        self.assertEqual((segunda.status_code, segunda.json()), (primera.status_code, primera.json()))
+        self.assertEqual(segunda['Idempotent-Replayed'], 'true')
+        self.assertEqual(Carrito.objects.get(usuario=self.usuario).cantidad, 2)
+        # Otra clave es otro request
+        self.agregar(2, clave='clave-2')
+        self.assertEqual(Carrito.objects.get(usuario=self.usuario).cantidad, 4)
+
+        linea = Carrito.objects.get(usuario=self.usuario)
+        for _ in range(2):
+            respuesta = self.client.delete(f'/appCART/eliminar/{linea.pk}/', HTTP_IDEMPOTENCY_KEY='borrar')
+            self.assertEqual(respuesta.status_code, 200)
+
+    def test_clave_con_otro_request_o_en_curso(self):
+        self.agregar(1)
+        self.assertEqual(self.agregar(3).status_code, 422)
+
+        # Como si el primer request todavía no hubiera terminado
+        ClaveIdempotencia.objects.update(codigo=None, respuesta=None)
+        with override_settings(IDEMPOTENCIA_ESPERA=0):
+            respuesta = self.agregar(1)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertIn('Retry-After', respuesta)
+
+    def test_claves_vencidas_se_reusan_y_se_depuran(self):
+        self.agregar(1)
+        ClaveIdempotencia.objects.update(vence=timezone.now())
+        self.agregar(1)
+        self.assertEqual(Carrito.objects.get(usuario=self.usuario).cantidad, 2)
+
+        ClaveIdempotencia.objects.update(vence=timezone.now())
+        salida = StringIO()
+        call_command('depurar_idempotencia', '--lote', '1', stdout=salida)
+        self.assertIn('1 claves de idempotencia vencidas borradas', salida.getvalue())
+        self.assertFalse(ClaveIdempotencia.objects.exists())
+
+
+class AgregarProductoConcurrenteTests(TransactionTestCase):
+
+    def comprar_en_paralelo(self, producto):
+        usuarios = [crear_usuario(f'cliente{i}@test.com') for i in range(8)]
+        resultados = []
+        errores = []
+
+        def comprar(usuario):
+            try:
+                for _ in range(4):
+                    try:
+                        agregar_producto(usuario, producto.pk, 1)
+                        resultados.append(usuario.pk)
+                    except StockInsuficiente:
+                        pass
+            except Exception as exc:
+                errores.append(exc)
+            finally:
+                close_old_connections()
+                connection.close()
+
+        hilos = [threading.Thread(target=comprar, args=(u,)) for u in usuarios]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(timeout=60)
+
+        self.assertFalse(any(hilo.is_alive() for hilo in hilos))
+        self.assertEqual(errores, [])
+        return resultados
+
+    def test_no_sobrevende_ni_se_bloquea(self):
+        producto = crear_producto(stock=15)
+        resultados = self.comprar_en_paralelo(producto)
+
+        producto.refresh_from_db()
+        self.assertEqual((producto.stock, producto.disponible), (15, 0))
+        self.assertEqual(len(resultados), 15)
+        vendidos = sum(Carrito.objects.values_list('cantidad', flat=True))
+        self.assertEqual(vendidos, 15)
+        self.assertEqual(Pedido.objects.filter(estado='Pendiente').count(), len(set(resultados)))
+
+    def test_no_sobrevende_con_stock_repartido(self):
+        producto = crear_producto(stock=15)
+        repartir_stock(producto.pk, 4)
+        resultados = self.comprar_en_paralelo(producto)
+
+        self.assertEqual(len(resultados), 15)
+        self.assertEqual(Producto.objects.con_shards().get(pk=producto.pk).disponible, 0)
+        self.assertEqual(sum(StockShard.objects.values_list('reservado', flat=True)), 15)
+
+    @override_settings(SECURE_SSL_REDIRECT=False)
+    def test_reintentos_concurrentes_con_la_misma_clave(self):
+        usuario = crear_usuario()
+        producto = crear_producto(stock=10)
+        respuestas = []
+
+        def agregar():
+            cliente = APIClient()
+            cliente.force_authenticate(usuario)
+            try:
+                respuestas.append(cliente.post(f'/appCART/agregar/{producto.pk}/', {'cantidad': 1},
+                                               format='json', HTTP_IDEMPOTENCY_KEY='reintento'))
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=agregar) for _ in range(4)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(timeout=60)
+
+        self.assertEqual([r.status_code for r in respuestas], [200] * 4)
+        self.assertEqual(sum(r.has_header('Idempotent-Replayed') for r in respuestas), 3)
+        self.assertEqual(Carrito.objects.get(usuario=usuario).cantidad, 1)
+
+    def test_un_solo_pedido_pendiente_por_usuario(self):
+        usuario = crear_usuario()
+        productos = [crear_producto(stock=5, nombre=f'Producto {i}') for i in range(6)]
+        errores = []
+
+        def comprar(producto):
+            try:
+                agregar_producto(usuario, producto.pk, 1)
+            except Exception as exc:
+                errores.append(exc)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=comprar, args=(p,)) for p in productos]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join(timeout=60)
+
+        self.assertEqual(errores, [])
+        pedido = Pedido.objects.get(id_usuario=usuario, estado='Pendiente')
+        self.assertEqual(pedido.cantidad_lineas, 6)
+        self.assertEqual(Carrito.objects.filter(id_pedido=pedido).count(), 6)
+
+
+class MigracionDuplicadosTests(TransactionTestCase):
+    """`0004_indices_y_unicidad` con dos pedidos pendientes del mismo usuario."""
+    antes = [('appCART', '0003_resumen_pedido'), ('appFOOD', '0001_initial')]
+    despues = [('appCART', '0005_reservas_de_stock'), ('appFOOD', '0002_producto_reservado')]
+
+    def setUp(self):
+        self.executor = MigrationExecutor(connection)
+        self.executor.migrate(self.antes)
+        self.executor.loader.build_graph()
+
+    def tearDown(self):
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.executor.loader.graph.leaf_nodes())
+
+    def test_unifica_las_lineas_en_el_pedido_que_queda(self):
+        apps = self.executor.loader.project_state(self.antes).apps
+        Pedido, Carrito, DetallePedido = (apps.get_model('appCART', m) for m in ('Pedido', 'Carrito', 'DetallePedido'))
+        Producto = apps.get_model('appFOOD', 'Producto')
+        usuario = apps.get_model('appUSERS', 'Usuario').objects.create(
+            email='cliente@test.com', nombre='Cliente', apellido='Test', telefono='1'
+        )
+        categoria = apps.get_model('appFOOD', 'CategoriaProducto').objects.create(
+            nombre_categoria='Comidas', descripcion='Platos'
+        )
+        # Antes de las reservas el stock de los carritos abiertos ya estaba descontado
+        producto = Producto.objects.create(nombre_producto='Hamburguesa', descripcion='Rica', precio=100.0,
+                                           stock=7, id_categoria=categoria)
+        viejo, nuevo = (Pedido.objects.create(id_usuario=usuario, estado='Pendiente') for _ in range(2))
+        for pedido, cantidad in ((viejo, 2), (nuevo, 1)):
+            Carrito.objects.create(usuario=usuario, id_pedido=pedido, producto=producto, cantidad=cantidad)
+            DetallePedido.objects.create(id_pedido=pedido, id_producto=producto, cantidad_productos=cantidad,
+                                         precio_producto=100.0, subtotal=100.0 * cantidad)
+
+        self.executor.loader.build_graph()
+        self.executor.migrate(self.despues)
+        apps = self.executor.loader.project_state(self.despues).apps
+        Pedido, Carrito, DetallePedido = (apps.get_model('appCART', m) for m in ('Pedido', 'Carrito', 'DetallePedido'))
+
+        self.assertEqual(Pedido.objects.get(pk=viejo.pk).estado, 'Cancelado')
+        linea = Carrito.objects.get()
+        self.assertEqual((linea.id_pedido_id, linea.cantidad, linea.reservado), (nuevo.pk, 3, 3))
+        detalle = DetallePedido.objects.get()
+        self.assertEqual((detalle.id_pedido_id, detalle.cantidad_productos, detalle.subtotal), (nuevo.pk, 3, 300.0))
+        pedido = Pedido.objects.get(pk=nuevo.pk)
+        self.assertEqual((pedido.monto_total, pedido.cantidad_lineas, pedido.cantidad_unidades), (300.0, 1, 3))
+        # El stock que tomaron las dos líneas vuelve y queda reservado
+        producto = apps.get_model('appFOOD', 'Producto').objects.get(pk=producto.pk)
+        self.assertEqual((producto.stock, producto.reservado), (10, 3))
@@ -1,21 +1,28 @@
 from django.urls import path
+from Food_ISPC.asincrono import segun_modo
 from .views import *
 
 urlpatterns = [
     path('agregar/<int:producto_id>/', AgregarProductoAlCarrito.as_view()),
     path('agregar/<int:producto_id>', AgregarProductoAlCarrito.as_view()),
-    path('ver/', VerCarrito.as_view()),
-    path('ver', VerCarrito.as_view()),
+    path('operaciones/', OperacionesCarrito.as_view(), name='operaciones_carrito'),
+    path('operaciones', OperacionesCarrito.as_view(), name='operaciones_carrito_sin_slash'),
+    path('ver/', segun_modo(VerCarritoAsincrono)),
+    path('ver', segun_modo(VerCarritoAsincrono)),
     path('confirmar/', ConfirmarPedido.as_view()),
     path('confirmar', ConfirmarPedido.as_view()),
     path('eliminar/<int:carrito_id>/', EliminarProductoDelCarrito.as_view()),
     path('eliminar/<int:carrito_id>', EliminarProductoDelCarrito.as_view()),
-    path('ver_dashboard/', VerDashboard.as_view()),
-    path('ver_dashboard', VerDashboard.as_view()),
+    path('ver_dashboard/', segun_modo(VerDashboardAsincrono)),
+    path('ver_dashboard', segun_modo(VerDashboardAsincrono)),
     path('modificar_cantidad/<int:carrito_id>/', ModificarCantidadProductoCarrito.as_view(), name='modificar_cantidad_producto_carrito'),
     path('modificar_cantidad/<int:carrito_id>', ModificarCantidadProductoCarrito.as_view(), name='modificar_cantidad_producto_carrito_sin_slash'),
-    path('detalle_pedido/<int:pedido_id>/', VerDetallePedido.as_view(), name='detalle_pedido'),
-    path('detalle_pedido/<int:pedido_id>', VerDetallePedido.as_view(), name='detalle_pedido_sin_slash'),
+    path('detalle_pedido/', segun_modo(VerDetallePedidoAsincrono), name='detalle_pedidos'),
+    path('detalle_pedido', segun_modo(VerDetallePedidoAsincrono), name='detalle_pedidos_sin_slash'),
+    path('detalle_pedido/<int:pedido_id>/', segun_modo(VerDetallePedidoAsincrono), name='detalle_pedido'),
+    path('detalle_pedido/<int:pedido_id>', segun_modo(VerDetallePedidoAsincrono), name='detalle_pedido_sin_slash'),
+    path('eventos/', segun_modo(EventosPedidosAsincrono), name='eventos_pedidos'),
+    path('eventos', segun_modo(EventosPedidosAsincrono), name='eventos_pedidos_sin_slash'),
     path('ver_dashboard/entregar/', EntregarPedido.as_view(), name='entregar_pedido'),
     path('ver_dashboard/entregar', EntregarPedido.as_view(), name='entregar_pedido_sin_slash'),
 ]
@@ -1,265 +1,332 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import DetallePedido, Pedido, Carrito
+from django.db.models import Prefetch
+from .models import DetallePedido, Pedido
 from appFOOD.models import Producto
-from datetime import date, datetime
-from .serializers import DetallePedidoSerializer, ModificarCantidadSerializer
+from .serializers import (AgregarProductoSerializer, DetallePedidoSerializer, ModificarCantidadSerializer,
+                          OperacionesCarritoSerializer)
+from .services import (ERROR_STOCK, CarritoVacio, OperacionesRechazadas, StockInsuficiente, adatos_carrito,
+                       agregar_producto, aplicar_operaciones, confirmar_pedido, datos_carrito)
 from asgiref.sync import sync_to_async
-from appUSERS.models import Usuario
 from rest_framework import status
-from asgiref.sync import sync_to_async
-from appUSERS.models import Usuario
-from rest_framework import status
-
-class AgregarProductoAlCarrito(APIView):
+from rest_framework.request import Request
+from Food_ISPC.asincrono import VistaAsincrona, respuesta_api
+from Food_ISPC.db.replica import LecturasEnReplicaMixin
+from Food_ISPC.pagination import PaginacionPedidos
+from .idempotencia import IdempotenciaMixin
+from .eventos import broker, flujo_sse, publicar_estado
+from Food_ISPC.campos import columnas, incluye, leer_campos, leer_expandir, podar, subcampos, verificar
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+class AgregarProductoAlCarrito(IdempotenciaMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request, producto_id):
+        serializer = AgregarProductoSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        producto = Producto.objects.get(pk=producto_id)
-        cantidad = int(request.data.get('cantidad'))
-        id_usuario = request.user.id_usuario
-        direccion = request.data.get('direccion')
-
-        current_time = datetime.now().time()
-        pedido, created  = Pedido.objects.get_or_create(id_usuario_id=id_usuario, estado="Pendiente")
-
-        # Si el usuario envía una dirección, actualizarla en su perfil
-        if direccion:
-            request.user.direccion = direccion
-            request.user.save()
-            # Actualizar la dirección de entrega en todos los detalles del pedido pendiente
-            if not created:
-                DetallePedido.objects.filter(id_pedido=pedido).update(direccion_entrega=direccion)
-        # Si no hay dirección en la petición, intentar usar la del perfil
-        elif request.user.direccion:
-            direccion = request.user.direccion
-        # Si no hay dirección en ninguna parte, usar valor por defecto
-        else:
-            direccion = 'Sin especificar'
-
-        if cantidad > producto.stock:
+        try:
+            agregar_producto(
+                request.user,
+                producto_id,
+                serializer.validated_data['cantidad'],
+                serializer.validated_data.get('direccion'),
+            )
+        except Producto.DoesNotExist:
+            return Response({'error': 'Producto no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        except StockInsuficiente:
             return Response({'error': 'Stock insuficiente'}, status=400)
 
-        # Actualizar dirección de entrega siempre
-        pedido.direccion_entrega = direccion
-        pedido.save()
-        # Actualizar la dirección de entrega en todos los detalles del pedido (incluido el nuevo)
-        DetallePedido.objects.filter(id_pedido=pedido).update(direccion_entrega=direccion)
-
-        if created:
-            pedido.hora_pedido = current_time
-            pedido.fecha_pedido = date.today()
-            pedido.save()
-
-        carrito, carritoCreated = Carrito.objects.get_or_create(producto_id=producto.id_producto, usuario_id=id_usuario, id_pedido_id=pedido.id_pedidos)
-        if carritoCreated:
-            carrito.cantidad = cantidad
-            carrito.save()
-        else:
-            carrito.cantidad += cantidad
-            carrito.save()
+        return Response({'message': 'Producto agregado al carrito'})
 
-        detallePedido, detalleCreated = DetallePedido.objects.get_or_create(
-            precio_producto=producto.precio, id_pedido_id=pedido.id_pedidos, id_producto_id=producto.id_producto)
+class OperacionesCarrito(IdempotenciaMixin, APIView):
+    permission_classes = [IsAuthenticated]
 
-        if detalleCreated:
-            detallePedido.cantidad_productos = cantidad
-            detallePedido.subtotal = detallePedido.cantidad_productos * detallePedido.precio_producto
-            detallePedido.save()
-        else:
-            detallePedido.cantidad_productos += cantidad
-            detallePedido.subtotal = detallePedido.cantidad_productos * detallePedido.precio_producto
-            detallePedido.save()
+    def post(self, request):
+        serializer = OperacionesCarritoSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        # Ahora sí, actualizar la dirección en todos los detalles del pedido (incluido el nuevo)
-        DetallePedido.objects.filter(id_pedido=pedido).update(direccion_entrega=pedido.direccion_entrega)
+        try:
+            resultados = aplicar_operaciones(
+                request.user,
+                serializer.validated_data['operaciones'],
+                serializer.validated_data.get('direccion'),
+                serializer.validated_data['todo_o_nada'],
+            )
+        except OperacionesRechazadas as e:
+            return Response({'error': 'No se aplicó ninguna operación', 'resultados': e.resultados},
+                            status=status.HTTP_409_CONFLICT)
 
-        producto.stock -= cantidad
-        producto.save()
-        return Response({'message': 'Producto agregado al carrito'})
+        return Response({'resultados': resultados, 'carrito': datos_carrito(request.user)})
 
 class VerCarrito(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        usuario = request.user
-        id_usuario = usuario.id_usuario
+        carrito_data = datos_carrito(request.user)
+        # Clientes anteriores esperan solo la lista de productos
+        if sin_totales(request.query_params):
+            return Response(podar(carrito_data['items'], leer_campos(request)))
+        return Response(podar(carrito_data, leer_campos(request)))
 
-        detalles_carrito = Carrito.objects.select_related("id_pedido").all().filter(usuario_id=id_usuario)
-        carrito_data = [
-            {
-                "id": detalle.id,
-                'producto': detalle.producto.nombre_producto,
-                'cantidad': detalle.cantidad,
-                "precio": detalle.producto.precio,
-                "imageURL": detalle.producto.imageURL
-            } for detalle in detalles_carrito]
 
-        return Response(carrito_data)
+def sin_totales(parametros):
+    return parametros.get('sin_totales', '').lower() in ('1', 'true', 'si')
+
+
+class VerCarritoAsincrono(VistaAsincrona):
+    vista_sincrona = VerCarrito.as_view()
+
+    async def get(self, request):
+        carrito_data = await adatos_carrito(request.user)
+        if sin_totales(request.GET):
+            return respuesta_api(request, podar(carrito_data['items'], leer_campos(request)))
+        return respuesta_api(request, podar(carrito_data, leer_campos(request)))
 
-class ConfirmarPedido(APIView):
+class ConfirmarPedido(IdempotenciaMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
         try:
-            usuario = request.user
-            id_usuario = usuario.id_usuario
-
-            detalles_carrito = Carrito.objects.filter(usuario_id=id_usuario)
-            pedido = Pedido.objects.get(id_usuario_id=id_usuario, estado="Pendiente")
-            
-            if not detalles_carrito.exists():
-                return Response({'error': 'El carrito está vacío'}, status=400)
-                
-            # Verificar que el pedido tenga dirección de entrega
-            if not pedido.direccion_entrega or pedido.direccion_entrega == 'Sin especificar':
-                if usuario.direccion:
-                    pedido.direccion_entrega = usuario.direccion
-                    
-            detalles_carrito.delete()
-            pedido.estado = "Aprobado"
-            pedido.save()
-            
+            confirmar_pedido(request.user)
             return Response({'message': 'Pedido confirmado'})
-        except Carrito.DoesNotExist:
-            return Response({"error": "El carrito está vacio."}, status=status.HTTP_404_NOT_FOUND)
+        except CarritoVacio:
+            return Response({'error': 'El carrito está vacío'}, status=400)
+        except StockInsuficiente:
+            return Response({'error': ERROR_STOCK}, status=400)
         except Pedido.DoesNotExist:
             return Response({"error": "El carrito está vacio."}, status=status.HTTP_404_NOT_FOUND)
 
-class EliminarProductoDelCarrito(APIView):
+class EliminarProductoDelCarrito(IdempotenciaMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def delete(self, request, carrito_id):
-
-        try:
-
-            carrito_item = Carrito.objects.get(pk=carrito_id)
-
-            detalle_item = DetallePedido.objects.get(id_producto_id=carrito_item.producto.id_producto, id_pedido_id = carrito_item.id_pedido)
-
-            producto = carrito_item.producto
-            producto.stock += carrito_item.cantidad
-            producto.save()
-            carrito_item.delete()
-            detalle_item.delete()
-            return Response({'message': 'Producto eliminado del carrito'})
-        except Carrito.DoesNotExist:
-            return Response({"error": "No existe un producto en el carrito con ese id de carrito."}, status=status.HTTP_404_NOT_FOUND)
-
-class VerDashboard(APIView):
+        resultado, = aplicar_operaciones(request.user, [{'accion': 'eliminar', 'carrito_id': carrito_id}])
+        if 'error' in resultado:
+            return Response({"error": resultado['error']}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'message': 'Producto eliminado del carrito'})
+
+# Campos de cada pedido del dashboard (además de `detalles`): cómo se calculan y qué columnas leen
+VALORES_DASHBOARD = {
+    'id_pedidos': lambda pedido, direccion_usuario: pedido.id_pedidos,
+    'fecha_pedido': lambda pedido, direccion_usuario: pedido.fecha_pedido,
+    'direccion_entrega': lambda pedido, direccion_usuario: (
+        # La del pedido o, si no tiene, la del usuario
+        pedido.direccion_entrega if pedido.direccion_entrega and pedido.direccion_entrega != 'Sin especificar'
+        else direccion_usuario
+    ),
+    'estado': lambda pedido, direccion_usuario: pedido.estado,
+    'monto_total': lambda pedido, direccion_usuario: pedido.monto_total,
+    'cantidad_productos': lambda pedido, direccion_usuario: pedido.cantidad_unidades,
+}
+COLUMNAS_DASHBOARD = {
+    'id_pedidos': (), 'fecha_pedido': ('fecha_pedido',), 'direccion_entrega': ('direccion_entrega',),
+    'estado': ('estado',), 'monto_total': ('monto_total',), 'cantidad_productos': ('cantidad_unidades',),
+}
+
+
+class CamposDashboard:
+    """`?fields=` y `?expand=` del dashboard; los de `detalles` los resuelve `DetallePedidoSerializer`."""
+
+    def __init__(self, request):
+        self.campos, expandir = leer_campos(request), leer_expandir(request)
+        verificar(self.campos, [*VALORES_DASHBOARD, 'detalles'])
+        verificar(expandir, ['detalles'])
+        self.detalles = None
+        if incluye(self.campos, 'detalles'):
+            self.detalles = {'campos': subcampos(self.campos, 'detalles'), 'expandir': expandir.get('detalles')}
+
+
+def pedidos_dashboard(usuario, campos):
+    # Solo lectura: los totales vienen del resumen guardado en el pedido y los
+    # detalles con su producto en una sola consulta, la cantidad de consultas
+    # no depende de los pedidos. Solo se leen las columnas de los campos pedidos.
+    pedidos = Pedido.objects.filter(id_usuario_id=usuario.id_usuario).only(
+        *columnas(campos.campos, COLUMNAS_DASHBOARD)
+    )
+    if campos.detalles is None:
+        return pedidos
+    detalles = DetallePedidoSerializer(**campos.detalles).optimizar(DetallePedido.objects.all(), 'id_pedido')
+    return pedidos.prefetch_related(Prefetch('detalles', queryset=detalles))
+
+
+def datos_dashboard(pedidos, usuario, campos):
+    direccion_usuario = usuario.direccion if usuario.direccion else 'Sin especificar'
+    carrito_data = []
+    for pedido in pedidos:
+        datos = {
+            nombre: valor(pedido, direccion_usuario)
+            for nombre, valor in VALORES_DASHBOARD.items() if incluye(campos.campos, nombre)
+        }
+        if campos.detalles is not None:
+            datos['detalles'] = DetallePedidoSerializer(pedido.detalles.all(), many=True, **campos.detalles).data
+        carrito_data.append(datos)
+    return carrito_data
+
+
+class VerDashboard(LecturasEnReplicaMixin, APIView):
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        usuario = request.user
-        id_usuario = usuario.id_usuario
-        vistaPedidos = Pedido.objects.prefetch_related('detalles').all().filter(id_usuario_id=id_usuario)
-        # Eliminar print innecesario
-        
-        carrito_data = []
-        for pedido in vistaPedidos:
-            # Obtener dirección del pedido, o usar la del usuario, o usar valor por defecto
-            direccion_entrega = pedido.direccion_entrega
-            if not direccion_entrega or direccion_entrega == 'Sin especificar':
-                direccion_entrega = usuario.direccion if usuario.direccion else 'Sin especificar'
-                
-                # Si estamos usando la dirección del usuario, actualizar también el pedido
-                if direccion_entrega != 'Sin especificar' and direccion_entrega != pedido.direccion_entrega:
-                    pedido.direccion_entrega = direccion_entrega
-                    pedido.save()
-                
-            carrito_data.append({
-                "id_pedidos": pedido.id_pedidos,
-                "fecha_pedido": pedido.fecha_pedido,
-                "direccion_entrega": direccion_entrega,
-                "estado": pedido.estado,
-                "detalles": DetallePedidoSerializer(pedido.detalles.all(), many=True).data
-            })
-
+        campos = CamposDashboard(request)
+        vistaPedidos = pedidos_dashboard(request.user, campos)
+        paginador = PaginacionPedidos()
+        pagina = paginador.paginate_queryset(vistaPedidos, request, view=self)
+        carrito_data = datos_dashboard(vistaPedidos if pagina is None else pagina, request.user, campos)
+
+        if pagina is not None:
+            return paginador.get_paginated_response(carrito_data)
         return Response({"results": carrito_data})
 
-class ModificarCantidadProductoCarrito(APIView):
+
+class VerDashboardAsincrono(VistaAsincrona):
+    vista_sincrona = VerDashboard.as_view()
+    lee_de_replica = True
+
+    async def get(self, request):
+        campos = CamposDashboard(request)
+        vistaPedidos = pedidos_dashboard(request.user, campos)
+        paginador = PaginacionPedidos()
+        # La paginación de DRF evalúa el queryset de forma sincrónica
+        pagina = await sync_to_async(paginador.paginate_queryset)(vistaPedidos, Request(request), view=self)
+
+        if pagina is not None:
+            return respuesta_api(request, paginador.get_paginated_response(datos_dashboard(pagina, request.user, campos)).data)
+        pedidos = [pedido async for pedido in vistaPedidos]
+        return respuesta_api(request, {"results": datos_dashboard(pedidos, request.user, campos)})
+
+class ModificarCantidadProductoCarrito(IdempotenciaMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def put(self, request, carrito_id):
         serializer = ModificarCantidadSerializer(data=request.data)
         if serializer.is_valid():
-            nueva_cantidad = serializer.validated_data['cantidad']
+            resultado, = aplicar_operaciones(request.user, [{
+                'accion': 'modificar', 'carrito_id': carrito_id, 'cantidad': serializer.validated_data['cantidad'],
+            }])
+            if resultado.get('error') == ERROR_STOCK:
+                return Response({'error': ERROR_STOCK}, status=400)
+            if 'error' in resultado:
+                return Response({"error": resultado['error']}, status=status.HTTP_404_NOT_FOUND)
+            return Response({'message': 'Cantidad de producto actualizada en el carrito'})
+        else:
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+MAX_PEDIDOS_POR_LLAMADA = 50
+
+
+def pedidos_con_detalles(usuario, campos=None):
+    # Pedido con su total guardado y sus detalles con el producto ya
+    # cargado: dos consultas, sin importar cuántos pedidos o líneas. Si
+    # `?fields=` no pide los detalles, una sola.
+    verificar(campos, ['pedido', 'detalles'])
+    pedidos = Pedido.objects.filter(id_usuario=usuario.id_usuario)
+    if not incluye(campos, 'detalles'):
+        return pedidos
+    return pedidos.prefetch_related(
+        Prefetch('detalles', queryset=DetallePedido.objects.select_related('id_producto').order_by('id_detalle'))
+    )
+
+
+def leer_ids_pedidos(valor):
+    """Ids de `?ids=1,2,3` sin repetir; ValueError con el mensaje para el cliente si no son válidos."""
+    try:
+        ids = [int(i) for i in valor.split(',') if i.strip()]
+    except ValueError:
+        raise ValueError("ids debe ser una lista de números separados por comas")
+    if not ids:
+        raise ValueError("Falta el parámetro ids")
+    if len(ids) > MAX_PEDIDOS_POR_LLAMADA:
+        raise ValueError(f"Se pueden pedir hasta {MAX_PEDIDOS_POR_LLAMADA} pedidos por llamada")
+    return list(dict.fromkeys(ids))
+
+
+def datos_pedidos(ids, pedidos, usuario, campos=None):
+    encontrados = {pedido.id_pedidos: pedido for pedido in pedidos}
+    return {
+        'results': [datos_pedido(encontrados[i], usuario, campos) for i in ids if i in encontrados],
+        'no_encontrados': [i for i in ids if i not in encontrados],
+    }
+
+
+def datos_pedido(pedido, usuario, campos=None):
+    # Verificar la dirección de entrega
+    direccion_entrega = pedido.direccion_entrega
+    if not direccion_entrega or direccion_entrega == 'Sin especificar':
+        direccion_entrega = usuario.direccion if usuario.direccion else 'Sin especificar'
+
+    datos = {
+        'pedido': {
+            'id_pedidos': pedido.id_pedidos,
+            'fecha_pedido': pedido.fecha_pedido,
+            'hora_pedido': pedido.hora_pedido,
+            'direccion_entrega': direccion_entrega,
+            'estado': pedido.estado,
+            'monto_total': pedido.monto_total
+        },
+        'detalles': [
+            {
+                'producto': detalle.id_producto.nombre_producto,
+                'cantidad': detalle.cantidad_productos,
+                'precio_unitario': detalle.precio_producto,
+                'subtotal': detalle.subtotal,
+                'imagen': detalle.id_producto.imageURL
+            } for detalle in pedido.detalles.all()
+        ] if incluye(campos, 'detalles') else None,
+    }
+    return podar(datos, campos)
+
+
+class VerDetallePedido(LecturasEnReplicaMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, pedido_id=None):
+        usuario = request.user
+        campos = leer_campos(request)
+        pedidos = pedidos_con_detalles(usuario, campos)
+
+        if pedido_id is not None:
             try:
-                carrito_item = Carrito.objects.get(pk=carrito_id)
-                producto = carrito_item.producto
+                return Response(datos_pedido(pedidos.get(id_pedidos=pedido_id), usuario, campos))
+            except Pedido.DoesNotExist:
+                return Response({"error": "Pedido no encontrado"}, status=status.HTTP_404_NOT_FOUND)
 
-                if nueva_cantidad > producto.stock + carrito_item.cantidad:
-                    return Response({'error': 'Stock insuficiente'}, status=400)
+        # Varios pedidos en una llamada: ?ids=1,2,3
+        try:
+            ids = leer_ids_pedidos(request.query_params.get('ids', ''))
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        return Response(datos_pedidos(ids, pedidos.filter(id_pedidos__in=ids), usuario, campos))
 
-                diferencia_cantidad = nueva_cantidad - carrito_item.cantidad
-                carrito_item.cantidad = nueva_cantidad
-                carrito_item.save()
 
-                producto.stock -= diferencia_cantidad
-                producto.save()
+class VerDetallePedidoAsincrono(VistaAsincrona):
+    vista_sincrona = VerDetallePedido.as_view()
+    lee_de_replica = True
 
-                detalle_item = DetallePedido.objects.get(id_producto_id=carrito_item.producto.id_producto, id_pedido_id=carrito_item.id_pedido)
-                detalle_item.cantidad_productos = nueva_cantidad
-                detalle_item.subtotal = detalle_item.cantidad_productos * detalle_item.precio_producto
-                detalle_item.save()
+    async def get(self, request, pedido_id=None):
+        usuario = request.user
+        campos = leer_campos(request)
+        pedidos = pedidos_con_detalles(usuario, campos)
 
-                return Response({'message': 'Cantidad de producto actualizada en el carrito'})
-            except Carrito.DoesNotExist:
-                return Response({"error": "No existe un producto en el carrito con ese id de carrito."}, status=status.HTTP_404_NOT_FOUND)
-            except DetallePedido.DoesNotExist:
-                return Response({"error": "No existe un detalle de pedido para este producto en el carrito."}, status=status.HTTP_404_NOT_FOUND)
-        else:
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        if pedido_id is not None:
+            try:
+                return respuesta_api(request, datos_pedido(await pedidos.aget(id_pedidos=pedido_id), usuario, campos))
+            except Pedido.DoesNotExist:
+                return respuesta_api(request, {"error": "Pedido no encontrado"}, status=status.HTTP_404_NOT_FOUND)
 
-class VerDetallePedido(APIView):
-    permission_classes = [IsAuthenticated]
-    
-    def get(self, request, pedido_id):
         try:
-            usuario = request.user
-            pedido = Pedido.objects.prefetch_related('detalles').get(
-                id_pedidos=pedido_id, id_usuario=usuario.id_usuario
-            )
-            
-            # Obtener los detalles del pedido
-            detalles = DetallePedido.objects.filter(id_pedido=pedido)
-            
-            # Calcular monto total
-            monto_total = sum(detalle.subtotal for detalle in detalles)
-            
-            # Verificar la dirección de entrega
-            direccion_entrega = pedido.direccion_entrega
-            if not direccion_entrega or direccion_entrega == 'Sin especificar':
-                direccion_entrega = usuario.direccion if usuario.direccion else 'Sin especificar'
-            
-            # Crear respuesta con información completa
-            respuesta = {
-                'pedido': {
-                    'id_pedidos': pedido.id_pedidos,
-                    'fecha_pedido': pedido.fecha_pedido,
-                    'hora_pedido': pedido.hora_pedido,
-                    'direccion_entrega': direccion_entrega,
-                    'estado': pedido.estado,
-                    'monto_total': monto_total
-                },
-                'detalles': [
-                    {
-                        'producto': detalle.id_producto.nombre_producto,
-                        'cantidad': detalle.cantidad_productos,
-                        'precio_unitario': detalle.precio_producto,
-                        'subtotal': detalle.subtotal,
-                        'imagen': detalle.id_producto.imageURL if hasattr(detalle.id_producto, 'imageURL') else None
-                    } for detalle in detalles
-                ]
-            }
-            
-            return Response(respuesta)
-        except Pedido.DoesNotExist:
-            return Response({"error": "Pedido no encontrado"}, status=status.HTTP_404_NOT_FOUND)
+            ids = leer_ids_pedidos(request.GET.get('ids', ''))
+        except ValueError as e:
+            return respuesta_api(request, {"error": str(e)}, status=400)
+        encontrados = [pedido async for pedido in pedidos.filter(id_pedidos__in=ids)]
+        return respuesta_api(request, datos_pedidos(ids, encontrados, usuario, campos))
 
-class EntregarPedido(APIView):
+class EntregarPedido(IdempotenciaMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def put(self, request):
@@ -271,8 +338,86 @@ class EntregarPedido(APIView):
             if pedido.estado != 'Aprobado':
                 return Response({'error': 'Solo se pueden entregar pedidos aprobados'}, status=400)
             pedido.estado = 'Entregado'
+            pedido.fecha_modificacion = timezone.now()
             pedido.save()
+            publicar_estado(pedido)
             return Response({'message': 'Pedido entregado correctamente'})
         except Pedido.DoesNotExist:
             return Response({'error': 'Pedido no encontrado'}, status=404)
 
+
+def leer_cursor(request):
+    """Id del último evento que recibió el cliente: `Last-Event-ID` (reconexión SSE) o `?desde=`."""
+    valor = request.headers.get('Last-Event-ID') or request.GET.get('desde')
+    if valor is None:
+        return None
+    if not valor.isdigit():
+        raise ValueError("El cursor debe ser el id de un evento.")
+    return int(valor)
+
+
+def leer_espera(request):
+    valor = request.GET.get('espera')
+    if valor is None:
+        return settings.EVENTOS_LONG_POLL
+    try:
+        return min(max(float(valor), 0), settings.EVENTOS_LONG_POLL)
+    except ValueError:
+        raise ValueError("La espera debe ser un número de segundos.")
+
+
+def datos_eventos(eventos, resincronizar, desde):
+    # `ultimo_id` es el cursor para el próximo request
+    if eventos:
+        ultimo = eventos[-1][0]
+    else:
+        ultimo = broker().ultimo_id() if resincronizar else desde
+    return {
+        'eventos': [{'id': id_evento, **datos} for id_evento, datos in eventos],
+        'ultimo_id': ultimo,
+        'resincronizar': resincronizar,
+    }
+
+
+class EventosPedidos(APIView):
+    """
+    Cambios de estado de los pedidos del usuario posteriores a `?desde=`. Sin
+    ASGI responde enseguida con lo que haya; la versión async espera (long-poll)
+    o los manda a medida que llegan (SSE).
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            desde = leer_cursor(request)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=400)
+        if desde is None:
+            desde = broker().ultimo_id()
+        return Response(datos_eventos(*broker().despues(request.user.pk, desde), desde))
+
+
+class EventosPedidosAsincrono(VistaAsincrona):
+    vista_sincrona = EventosPedidos.as_view()
+
+    async def get(self, request):
+        # Después de autenticar se espera en el broker, sin ocupar un hilo
+        try:
+            desde = leer_cursor(request)
+            espera = leer_espera(request)
+        except ValueError as e:
+            return respuesta_api(request, {"error": str(e)}, status=400)
+        if desde is None:
+            desde = await sync_to_async(broker().ultimo_id)()
+
+        if 'text/event-stream' in request.headers.get('Accept', ''):
+            respuesta = StreamingHttpResponse(flujo_sse(request.user.pk, desde), content_type='text/event-stream')
+            respuesta['Cache-Control'] = 'no-cache'
+            # Que nginx no acumule el stream
+            respuesta['X-Accel-Buffering'] = 'no'
+            return respuesta
+
+        eventos, resincronizar = await broker().esperar(request.user.pk, desde, espera)
+        # Para resincronizar hace falta el último id, que puede estar en la base
+        return respuesta_api(request, await sync_to_async(datos_eventos)(eventos, resincronizar, desde))
+
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AppfoodConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'appFOOD'
+
+    def ready(self):
+        from . import signals  # noqa: F401
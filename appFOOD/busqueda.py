@@ -0,0 +1,188 @@
+"""
+Búsqueda de productos: nombre por prefijo o por substring, categoría, rango de
+precio y solo con stock.
+
+Los filtros van a la base, apoyados en los índices de `Producto`. Con
+`BUSQUEDA_INDICE` cada proceso arma además un índice de trigramas de los
+nombres en memoria: resuelve el nombre (y categoría y precio, que guarda junto)
+sin `LIKE '%...%'`, y a la base solo va un `pk IN (...)` con los candidatos.
+El índice se reconstruye cuando cambia un producto o una categoría; los
+movimientos de stock no lo tocan.
+"""
+import threading
+import time
+import unicodedata
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.exceptions import ValidationError
+
+from .cache import CATALOGO_CACHE
+from .models import Producto
+
+CLAVE_INDICE = 'catalogo:indice'
+MODOS = ('prefijo', 'contiene')
+N = 3
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes, como compara la collation `*_ai_ci` de MySQL."""
+    return ''.join(c for c in unicodedata.normalize('NFKD', texto.casefold()) if not unicodedata.combining(c))
+
+
+def leer_filtros(parametros):
+    errores = {}
+    filtros = {
+        'q': parametros.get('q', '').strip(),
+        'modo': parametros.get('modo', 'prefijo'),
+        'con_stock': parametros.get('con_stock', '').lower() in ('1', 'true', 'si'),
+    }
+    if filtros['modo'] not in MODOS:
+        errores['modo'] = f'Debe ser uno de: {", ".join(MODOS)}.'
+    for nombre, tipo in (('categoria', int), ('precio_min', float), ('precio_max', float)):
+        valor = parametros.get(nombre)
+        try:
+            filtros[nombre] = tipo(valor) if valor not in (None, '') else None
+        except ValueError:
+            errores[nombre] = 'Debe ser un número.'
+    if errores:
+        raise ValidationError(errores)
+    return filtros
+
+
+def filtrar(productos, q, modo, categoria, precio_min, precio_max, **_):
+    if q:
+        productos = productos.filter(**{f'nombre_producto__{"istartswith" if modo == "prefijo" else "icontains"}': q})
+    if categoria is not None:
+        productos = productos.filter(id_categoria_id=categoria)
+    if precio_min is not None:
+        productos = productos.filter(precio__gte=precio_min)
+    if precio_max is not None:
+        productos = productos.filter(precio__lte=precio_max)
+    return productos
+
+
+def _ngramas(texto):
+    return {texto[i:i + N] for i in range(len(texto) - N + 1)}
+
+
+class IndiceNgramas:
+    """
+    Nombres normalizados con su categoría y precio, en listas paralelas por
+    posición. Para `contiene` hay listas de posiciones por trigrama; para
+    `prefijo`, los nombres ordenados para buscar con `bisect`.
+    """
+
+    def __init__(self, filas):
+        self.ids, self.nombres, self.categorias = array('q'), [], array('q')
+        self.precios = array('d')
+        trigramas = {}
+        for posicion, (pk, nombre, categoria, precio) in enumerate(filas):
+            nombre = normalizar(nombre)
+            self.ids.append(pk)
+            self.nombres.append(nombre)
+            self.categorias.append(categoria)
+            self.precios.append(precio)
+            for trigrama in _ngramas(nombre):
+                trigramas.setdefault(trigrama, array('l')).append(posicion)
+        self.trigramas = trigramas
+        self.orden = sorted(range(len(self.nombres)), key=self.nombres.__getitem__)
+        self.ordenados = [self.nombres[posicion] for posicion in self.orden]
+
+    def _por_nombre(self, q, modo):
+        if not q:
+            return range(len(self.ids))
+        if modo == 'prefijo':
+            inicio = bisect_left(self.ordenados, q)
+            fin = bisect_left(self.ordenados, q + '\U0010ffff', inicio)
+            return self.orden[inicio:fin]
+        if len(q) < N:
+            return (posicion for posicion, nombre in enumerate(self.nombres) if q in nombre)
+        # Se cruzan las listas de trigramas de la más corta a la más larga y se
+        # confirma el substring: tener los trigramas no garantiza que estén seguidos
+        listas = sorted((self.trigramas.get(trigrama, ()) for trigrama in _ngramas(q)), key=len)
+        candidatas = set(listas[0])
+        for lista in listas[1:]:
+            if not candidatas:
+                break
+            candidatas.intersection_update(lista)
+        return (posicion for posicion in sorted(candidatas) if q in self.nombres[posicion])
+
+    def buscar(self, q, modo, categoria, precio_min, precio_max, maximo, **_):
+        """Ids que cumplen los filtros, o `None` si son más de `maximo`."""
+        ids = []
+        for posicion in self._por_nombre(normalizar(q), modo):
+            if categoria is not None and self.categorias[posicion] != categoria:
+                continue
+            precio = self.precios[posicion]
+            if (precio_min is not None and precio < precio_min) or (precio_max is not None and precio > precio_max):
+                continue
+            if len(ids) == maximo:
+                return None
+            ids.append(self.ids[posicion])
+        return ids
+
+
+def construir_indice():
+    filas = Producto.objects.order_by().values_list('pk', 'nombre_producto', 'id_categoria_id', 'precio')
+    return IndiceNgramas(filas.iterator(chunk_size=5000))
+
+
+def version_indice():
+    cache = caches[CATALOGO_CACHE]
+    version = cache.get(CLAVE_INDICE)
+    if version is None:
+        cache.add(CLAVE_INDICE, time.time_ns(), None)
+        version = cache.get(CLAVE_INDICE)
+    return version
+
+
+def invalidar_indice():
+    """Pide reconstruir el índice de todos los procesos cuando confirme la transacción actual."""
+    transaction.on_commit(lambda: caches[CATALOGO_CACHE].set(CLAVE_INDICE, time.time_ns(), None))
+
+
+_indice = None
+_construyendo = threading.Lock()
+
+
+def indice_actual():
+    """
+    El índice de la versión vigente del catálogo, armándolo si hace falta.
+    Devuelve `None` si está deshabilitado o si otro hilo lo está armando: en
+    ese rato las búsquedas van por SQL en lugar de esperar.
+    """
+    global _indice
+    if not settings.BUSQUEDA_INDICE:
+        return None
+    version = version_indice()
+    if _indice is not None and _indice[0] == version:
+        return _indice[1]
+    if not _construyendo.acquire(blocking=False):
+        return None
+    try:
+        if _indice is None or _indice[0] != version:
+            _indice = (version, construir_indice())
+        return _indice[1]
+    finally:
+        _construyendo.release()
+
+
+def buscar(filtros, productos=None):
+    """Los `productos` (por defecto, todos) que cumplen `filtros` (ver `leer_filtros`), sin ordenar."""
+    if productos is None:
+        productos = Producto.objects.con_shards()
+    # Sin nombre que buscar, categoría y precio los resuelven mejor los índices de la base
+    indice = indice_actual() if filtros['q'] else None
+    ids = indice.buscar(maximo=settings.BUSQUEDA_INDICE_MAXIMO, **filtros) if indice is not None else None
+    if ids is not None:
+        productos = productos.filter(pk__in=ids)
+    else:
+        # Sin índice, o demasiados candidatos para un IN
+        productos = filtrar(productos, **filtros)
+    if filtros['con_stock']:
+        productos = productos.con_stock()
+    return productos
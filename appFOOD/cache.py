@@ -0,0 +1,153 @@
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from Food_ISPC.asincrono import respuesta_api
+from Food_ISPC.db.replica import lecturas_en_replica
+from Food_ISPC.renderers import renderer_para
+
+CATALOGO_CACHE = 'catalogo'
+CLAVE_VERSION = 'catalogo:version'
+CLAVE_STOCK = 'catalogo:stock'
+
+
+def _cache():
+    return caches[CATALOGO_CACHE]
+
+
+def _ahora():
+    return time.time_ns() // 1_000_000
+
+
+def _stock_vencido(version, stock):
+    # Hubo movimientos de stock después de la versión y ya pasó la demora
+    return stock is not None and stock >= version and _ahora() - version >= settings.CATALOGO_DEMORA_STOCK * 1000
+
+
+def version_catalogo():
+    # La versión es el instante (en ms) de la última modificación del catálogo.
+    # Si se pierde la clave (reinicio, desalojo) se regenera con la hora actual,
+    # que siempre es mayor: nunca se reutiliza una versión ya servida.
+    valores = _cache().get_many([CLAVE_VERSION, CLAVE_STOCK])
+    version = valores.get(CLAVE_VERSION)
+    if version is None:
+        _cache().add(CLAVE_VERSION, _ahora(), None)
+        version = _cache().get(CLAVE_VERSION)
+    elif _stock_vencido(version, valores.get(CLAVE_STOCK)):
+        version = _incrementar_version()
+    return version
+
+
+async def aversion_catalogo():
+    """`version_catalogo` por la API async de la caché."""
+    valores = await _cache().aget_many([CLAVE_VERSION, CLAVE_STOCK])
+    version = valores.get(CLAVE_VERSION)
+    if version is None:
+        await _cache().aadd(CLAVE_VERSION, _ahora(), None)
+        version = await _cache().aget(CLAVE_VERSION)
+    elif _stock_vencido(version, valores.get(CLAVE_STOCK)):
+        version = await sync_to_async(_incrementar_version)()
+    return version
+
+
+def _incrementar_version():
+    actual = _cache().get(CLAVE_VERSION) or 0
+    version = max(_ahora(), actual + 1)
+    _cache().set(CLAVE_VERSION, version, None)
+    return version
+
+
+def _marcar_stock():
+    _cache().set(CLAVE_STOCK, _ahora(), None)
+
+
+def invalidar_catalogo():
+    """Invalida el catálogo cacheado cuando la transacción actual confirma."""
+    transaction.on_commit(_incrementar_version)
+
+
+def invalidar_disponibilidad():
+    """
+    Avisa que el carrito movió stock (reservas, ventas). No invalida en el acto:
+    la primera lectura pasados `CATALOGO_DEMORA_STOCK` segundos desde la última
+    versión arma una nueva, así el carrito no vacía la caché en cada agregado.
+    """
+    transaction.on_commit(_marcar_stock)
+
+
+class CatalogoCacheMixin:
+    """
+    Sirve `list` y `retrieve` desde la caché del catálogo, con ETag y
+    Last-Modified derivados de la versión para responder 304 a los clientes
+    que ya tienen la última copia.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.respuesta_cacheada(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.respuesta_cacheada(request, super().retrieve, *args, **kwargs)
+
+    def respuesta_cacheada(self, request, vista, *args, **kwargs):
+        version = version_catalogo()
+        etag, ultima_modificacion = validadores(version, request.accepted_renderer)
+
+        no_modificado = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+        if no_modificado is not None:
+            return no_modificado
+
+        clave = clave_respuesta(version, request)
+        datos = _cache().get(clave)
+        if datos is None:
+            # La versión es el instante de la última modificación: si es reciente
+            # la réplica puede no tenerla y se lee de `default`
+            with lecturas_en_replica(request.user, modificado=version / 1000):
+                respuesta = vista(request, *args, **kwargs)
+            if respuesta.status_code != 200:
+                return respuesta
+            datos = respuesta.data
+            _cache().set(clave, datos)
+
+        return con_validadores(Response(datos), etag, ultima_modificacion)
+
+
+def validadores(version, renderer):
+    # JSON y MessagePack son representaciones distintas de la misma versión
+    return f'"catalogo-{version}-{renderer.format}"', version // 1000
+
+
+def clave_respuesta(version, request):
+    return f'catalogo:{version}:{request.get_full_path()}'
+
+
+def con_validadores(respuesta, etag, ultima_modificacion):
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = http_date(ultima_modificacion)
+    # La misma versión se sirve en JSON o en MessagePack
+    patch_vary_headers(respuesta, ('Accept',))
+    return respuesta
+
+
+async def arespuesta_cacheada(request, vista_sincrona, *args, **kwargs):
+    """
+    Lo mismo que `CatalogoCacheMixin` sin salir del event loop mientras la
+    respuesta esté cacheada; si no lo está, la arma `vista_sincrona` (que
+    también la guarda en la caché).
+    """
+    version = await aversion_catalogo()
+    etag, ultima_modificacion = validadores(version, renderer_para(request))
+
+    no_modificado = get_conditional_response(request, etag=etag, last_modified=ultima_modificacion)
+    if no_modificado is not None:
+        return no_modificado
+
+    datos = await _cache().aget(clave_respuesta(version, request))
+    if datos is None:
+        return await sync_to_async(vista_sincrona)(request, *args, **kwargs)
+    return con_validadores(respuesta_api(request, datos), etag, ultima_modificacion)
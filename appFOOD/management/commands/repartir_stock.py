@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from appFOOD.models import Producto
+from appFOOD.shards import rebalancear_stock, repartir_stock
+
+
+class Command(BaseCommand):
+    help = 'Reparte el stock de productos muy pedidos en sub-contadores (shards) o los rebalancea.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('productos', nargs='*', type=int,
+                            help='Ids de los productos; sin ids, todos los repartidos.')
+        parser.add_argument('--shards', type=int,
+                            help='Cantidad de shards para los productos indicados (0 vuelve a una sola fila).')
+        parser.add_argument('--cada', type=int,
+                            help='Queda corriendo y rebalancea cada tantos segundos.')
+
+    def handle(self, *args, **options):
+        productos = options['productos'] or None
+        if options['shards'] is not None:
+            if not productos:
+                raise CommandError('--shards necesita los ids de los productos.')
+            if options['shards'] < 0:
+                raise CommandError('--shards no puede ser negativo.')
+            for producto_id in productos:
+                try:
+                    repartir_stock(producto_id, options['shards'])
+                except Producto.DoesNotExist:
+                    raise CommandError(f'No existe el producto {producto_id}.')
+            self.stdout.write(f'{len(productos)} productos repartidos en {options["shards"]} shards')
+            return
+
+        while True:
+            rebalanceados = rebalancear_stock(productos)
+            self.stdout.write(f'{rebalanceados} productos rebalanceados')
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
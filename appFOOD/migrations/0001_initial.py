@@ -0,0 +1,47 @@
+# Generated by Django 4.2 on 2026-10-18 13:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoriaProducto',
+            fields=[
+                ('id_categoria', models.AutoField(primary_key=True, serialize=False)),
+                ('nombre_categoria', models.CharField(max_length=45)),
+                ('descripcion', models.CharField(max_length=45)),
+            ],
+            options={
+                'verbose_name': 'Categoriaproducto',
+                'verbose_name_plural': 'Categoriaproductos',
+                'db_table': 'categoria_producto',
+                'managed': True,
+            },
+        ),
+        migrations.CreateModel(
+            name='Producto',
+            fields=[
+                ('id_producto', models.AutoField(primary_key=True, serialize=False)),
+                ('nombre_producto', models.CharField(max_length=45)),
+                ('descripcion', models.CharField(max_length=200)),
+                ('precio', models.FloatField()),
+                ('stock', models.IntegerField(default=0)),
+                ('imageURL', models.CharField(max_length=100, null=True)),
+                ('id_categoria', models.ForeignKey(on_delete=django.db.models.deletion.DO_NOTHING, to='appFOOD.categoriaproducto')),
+            ],
+            options={
+                'verbose_name': 'Producto',
+                'verbose_name_plural': 'Productos',
+                'db_table': 'producto',
+                'managed': True,
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 14:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appFOOD', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='reservado',
+            field=models.IntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2 on 2026-10-18 14:31
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('appFOOD', '0002_producto_reservado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='producto',
+            name='shards_stock',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('numero', models.PositiveSmallIntegerField()),
+                ('stock', models.IntegerField(default=0)),
+                ('reservado', models.IntegerField(default=0)),
+                ('producto', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='appFOOD.producto')),
+            ],
+            options={
+                'db_table': 'producto_stock_shard',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='stockshard',
+            constraint=models.UniqueConstraint(fields=('producto', 'numero'), name='stock_shard_producto_numero_uniq'),
+        ),
+    ]
@@ -1,4 +1,6 @@
 from django.db import models
+from django.db.models import Sum
+from django.db.models.functions import Coalesce
 
 # Create your models here.
 
@@ -18,23 +20,87 @@ class CategoriaProducto(models.Model):
         return self.nombre_categoria
 
 
+class ProductoQuerySet(models.QuerySet):
+
+    def con_shards(self):
+        """Anota lo que los productos repartidos tienen en sus shards (`stock_shards`, `reservado_shards`)."""
+        shards = StockShard.objects.filter(producto_id=models.OuterRef('pk')).values('producto_id')
+        return self.annotate(
+            stock_shards=Coalesce(models.Subquery(shards.annotate(total=Sum('stock')).values('total')), 0),
+            reservado_shards=Coalesce(models.Subquery(shards.annotate(total=Sum('reservado')).values('total')), 0),
+        )
+
+    def con_stock(self):
+        """
+        Solo los productos con disponible. La suma de los shards se calcula solo
+        para los repartidos; el resto se resuelve con las columnas de la fila.
+        """
+        en_shards = Coalesce(models.Subquery(
+            StockShard.objects.filter(producto_id=models.OuterRef('pk')).values('producto_id')
+            .annotate(total=Sum(models.F('stock') - models.F('reservado'))).values('total')
+        ), 0)
+        return self.alias(disponible_repartido=models.F('stock') - models.F('reservado') + en_shards).filter(
+            models.Q(shards_stock=0, stock__gt=models.F('reservado'))
+            | models.Q(shards_stock__gt=0, disponible_repartido__gt=0)
+        )
+
+
 class Producto(models.Model):
     id_producto = models.AutoField(primary_key=True)  
     nombre_producto = models.CharField(max_length=45)  
     descripcion = models.CharField(max_length=200)
     precio = models.FloatField()
     stock = models.IntegerField(default = 0 )
+    # Unidades reservadas por carritos abiertos; se descuentan de `stock` al confirmar
+    reservado = models.IntegerField(default=0)
     imageURL = models.CharField( max_length=100, null=True )
     id_categoria = models.ForeignKey(CategoriaProducto, models.DO_NOTHING)
+    # Productos muy pedidos: su stock se reparte en esta cantidad de StockShard (0: todo en esta fila)
+    shards_stock = models.PositiveSmallIntegerField(default=0)
+
+    objects = ProductoQuerySet.as_manager()
 
     class Meta:
         managed = True
         db_table = 'producto'
         verbose_name = 'Producto'
         verbose_name_plural = 'Productos'
+        # Búsqueda (appFOOD/busqueda.py): prefijo del nombre, categoría con rango
+        # u orden de precio, y precio solo
+        indexes = [
+            models.Index(fields=['nombre_producto'], name='producto_nombre_idx'),
+            models.Index(fields=['id_categoria', 'precio'], name='producto_categoria_precio_idx'),
+            models.Index(fields=['precio'], name='producto_precio_idx'),
+        ]
     def __unicode__(self):
         return self.nombre_producto
     def __str__(self):
         return self.nombre_producto
 
+    @property
+    def disponible(self):
+        # Con `con_shards()` o `cargar_shards()` incluye lo repartido en los shards
+        return (
+            self.stock + getattr(self, 'stock_shards', 0)
+            - self.reservado - getattr(self, 'reservado_shards', 0)
+        )
+
+
+class StockShard(models.Model):
+    """
+    Sub-contador de stock de un producto repartido. El stock de un producto es
+    el de su fila más el de sus shards; cada alta en el carrito actualiza un
+    shard al azar en lugar de la fila del producto.
+    """
+    producto = models.ForeignKey(Producto, models.CASCADE, related_name='shards')
+    numero = models.PositiveSmallIntegerField()
+    stock = models.IntegerField(default=0)
+    reservado = models.IntegerField(default=0)
+
+    class Meta:
+        db_table = 'producto_stock_shard'
+        constraints = [
+            models.UniqueConstraint(fields=['producto', 'numero'], name='stock_shard_producto_numero_uniq'),
+        ]
+
 
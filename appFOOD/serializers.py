@@ -1,12 +1,49 @@
 from rest_framework import serializers
+from Food_ISPC.campos import CamposDinamicosMixin
 from .models import Producto, CategoriaProducto
 
-class ProductoSerializer(serializers.ModelSerializer):
+# Campos que leen el stock; sin ellos el listado no necesita sumar los shards
+CAMPOS_STOCK = {'stock', 'reservado', 'disponible'}
+
+
+class CategoriaProductoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
     class Meta:
-            model = Producto
+            model = CategoriaProducto
             fields = '__all__'
 
-class CategoriaProductoSerializer(serializers.ModelSerializer):
+class ProductoSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    # Stock menos lo reservado por carritos abiertos: lo que se puede agregar
+    disponible = serializers.IntegerField(read_only=True)
+
+    expandibles = {'id_categoria': CategoriaProductoSerializer}
+    columnas_extra = {'disponible': ('stock', 'reservado', 'shards_stock')}
+
     class Meta:
-            model = CategoriaProducto
+            model = Producto
             fields = '__all__'
+            read_only_fields = ['reservado', 'shards_stock']
+
+    def muestra_stock(self):
+        return bool(CAMPOS_STOCK & set(self.fields))
+
+    def to_representation(self, instance):
+        datos = super().to_representation(instance)
+        # En los productos repartidos se muestran los totales con sus shards
+        if 'stock' in datos:
+            datos['stock'] += getattr(instance, 'stock_shards', 0)
+        if 'reservado' in datos:
+            datos['reservado'] += getattr(instance, 'reservado_shards', 0)
+        return datos
+
+    def update(self, instance, validated_data):
+        # El stock que se carga es el total: a la fila va lo que no está en los shards
+        if 'stock' in validated_data:
+            validated_data['stock'] -= getattr(instance, 'stock_shards', 0)
+        return super().update(instance, validated_data)
+
+
+class ProductoResumenSerializer(CamposDinamicosMixin, serializers.ModelSerializer):
+    """Lo que muestra un listado: para expandir el producto dentro de otros recursos."""
+    class Meta:
+            model = Producto
+            fields = ['id_producto', 'nombre_producto', 'precio', 'imageURL', 'id_categoria']
@@ -0,0 +1,125 @@
+import random
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from .cache import invalidar_catalogo
+from .models import Producto, StockShard
+
+
+def disponible_en_shards(campo_producto):
+    """Expresión con el disponible que suman los shards del producto de `campo_producto` (0 si no está repartido)."""
+    return Coalesce(Subquery(
+        StockShard.objects.filter(producto_id=OuterRef(campo_producto)).values('producto_id')
+        .annotate(total=Sum(F('stock') - F('reservado'))).values('total')
+    ), 0)
+
+
+def cargar_shards(productos, bloquear=False):
+    """
+    Carga en los productos repartidos lo que tienen en sus shards, para que
+    `disponible` dé el total. Con `bloquear` toma el lock de los shards (después
+    del de los productos, si lo hay). No consulta nada si no hay repartidos.
+    """
+    repartidos = {producto.pk: producto for producto in productos if producto.shards_stock}
+    if not repartidos:
+        return
+    for producto in repartidos.values():
+        producto.stock_shards = producto.reservado_shards = 0
+    shards = StockShard.objects.filter(producto_id__in=repartidos).order_by('pk')
+    if bloquear:
+        shards = shards.select_for_update()
+    for shard in shards:
+        producto = repartidos[shard.producto_id]
+        producto.stock_shards += shard.stock
+        producto.reservado_shards += shard.reservado
+
+
+def mover_en_shards(producto_id, shards, reservar, vender):
+    """
+    `mover_stock` para un producto repartido en `shards` sub-contadores.
+
+    Prueba primero un shard al azar con un UPDATE condicional, así los carritos
+    concurrentes se reparten los locks. Liberar y vender lo ya reservado no
+    tiene condición y va siempre a uno al azar. Si al shard elegido no le
+    alcanza, bloquea todos y reparte la reserva entre ellos. Devuelve si había
+    disponible suficiente.
+    """
+    columnas = {'reservado': F('reservado') + (reservar - vender)}
+    if vender:
+        columnas['stock'] = F('stock') - vender
+    filas = StockShard.objects.filter(producto_id=producto_id)
+    elegido = filas.filter(numero=random.randrange(shards))
+    if reservar > 0:
+        elegido = elegido.filter(stock__gte=F('reservado') + reservar)
+    if elegido.update(**columnas):
+        return True
+
+    with transaction.atomic():
+        bloqueados = list(filas.select_for_update().order_by('numero'))
+        if not bloqueados or sum(shard.stock - shard.reservado for shard in bloqueados) < reservar:
+            return False
+        pendiente = reservar
+        for shard in bloqueados:
+            toma = min(pendiente, max(shard.stock - shard.reservado, 0))
+            shard.reservado += toma
+            pendiente -= toma
+        bloqueados[0].reservado -= vender
+        bloqueados[0].stock -= vender
+        StockShard.objects.bulk_update(bloqueados, ['stock', 'reservado'])
+    return True
+
+
+def _repartir(total, partes):
+    cociente, resto = divmod(total, partes)
+    return [cociente + (i < resto) for i in range(partes)]
+
+
+def repartir_stock(producto_id, shards):
+    """
+    Reparte el stock y lo reservado del producto en partes iguales entre
+    `shards` sub-contadores, creando o borrando los que hagan falta. Con 0 todo
+    vuelve a la fila del producto. Sirve también para rebalancear los shards
+    de un producto que ya estaba repartido.
+    """
+    with transaction.atomic():
+        producto = Producto.objects.select_for_update().get(pk=producto_id)
+        actuales = list(StockShard.objects.select_for_update().filter(producto_id=producto_id).order_by('numero'))
+        stock = producto.stock + sum(shard.stock for shard in actuales)
+        reservado = producto.reservado + sum(shard.reservado for shard in actuales)
+
+        if shards:
+            StockShard.objects.filter(producto_id=producto_id, numero__gte=shards).delete()
+            por_numero = {shard.numero: shard for shard in actuales if shard.numero < shards}
+            nuevos = []
+            # Cada shard queda con la misma parte del disponible
+            for numero, (parte_stock, parte_disponible) in enumerate(zip(_repartir(stock, shards),
+                                                                         _repartir(stock - reservado, shards))):
+                parte_reservado = parte_stock - parte_disponible
+                shard = por_numero.get(numero)
+                if shard is None:
+                    nuevos.append(StockShard(producto_id=producto_id, numero=numero,
+                                             stock=parte_stock, reservado=parte_reservado))
+                else:
+                    shard.stock, shard.reservado = parte_stock, parte_reservado
+            StockShard.objects.bulk_update(por_numero.values(), ['stock', 'reservado'])
+            StockShard.objects.bulk_create(nuevos)
+            stock = reservado = 0
+        else:
+            StockShard.objects.filter(producto_id=producto_id).delete()
+
+        Producto.objects.filter(pk=producto_id).update(stock=stock, reservado=reservado, shards_stock=shards)
+        invalidar_catalogo()
+
+
+def rebalancear_stock(producto_ids=None):
+    """Empareja los shards de los productos repartidos; devuelve cuántos productos rebalanceó."""
+    repartidos = Producto.objects.filter(shards_stock__gt=0)
+    if producto_ids is not None:
+        repartidos = repartidos.filter(pk__in=producto_ids)
+    rebalanceados = 0
+    for producto_id, shards in repartidos.values_list('pk', 'shards_stock'):
+        repartir_stock(producto_id, shards)
+        rebalanceados += 1
+    return rebalanceados
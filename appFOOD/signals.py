@@ -0,0 +1,13 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .busqueda import invalidar_indice
+from .cache import invalidar_catalogo
+from .models import CategoriaProducto, Producto
+
+
+@receiver([post_save, post_delete], sender=Producto)
+@receiver([post_save, post_delete], sender=CategoriaProducto)
+def invalidar_catalogo_al_guardar(sender, **kwargs):
+    invalidar_catalogo()
+    invalidar_indice()
@@ -1,3 +1,257 @@
-from django.test import TestCase
+from urllib.parse import parse_qs, urlparse
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from . import busqueda
+from .cache import CATALOGO_CACHE
+from .models import CategoriaProducto, Producto
+from .shards import repartir_stock
+from .views import CatalogoAsincrono
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CatalogoCacheTests(TestCase):
+
+    def setUp(self):
+        caches[CATALOGO_CACHE].clear()
+        self.categoria = CategoriaProducto.objects.create(nombre_categoria='Comidas', descripcion='Platos')
+        self.producto = Producto.objects.create(
+            nombre_producto='Pizza', descripcion='Muzzarella', precio=50.0, stock=5, id_categoria=self.categoria
+        )
+        self.client = APIClient()
+
+    def test_segunda_lectura_no_consulta_la_base(self):
+        primera = self.client.get('/api/producto/')
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = self.client.get('/api/producto/')
+
+        self.assertEqual(len(consultas), 0)
+        self.assertEqual(primera.json(), segunda.json())
+        self.assertEqual(self.client.get(f'/api/producto/{self.producto.pk}/').json()['nombre_producto'], 'Pizza')
+
+    def test_etag_y_last_modified_devuelven_304(self):
+        respuesta = self.client.get('/api/producto/')
+        self.assertIn('ETag', respuesta)
+        self.assertIn('Last-Modified', respuesta)
+
+        por_etag = self.client.get('/api/producto/', HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        por_fecha = self.client.get('/api/producto/', HTTP_IF_MODIFIED_SINCE=respuesta['Last-Modified'])
+        self.assertEqual(por_etag.status_code, 304)
+        self.assertEqual(por_fecha.status_code, 304)
+
+    def test_version_async_sirve_la_copia_cacheada(self):
+        vista = async_to_sync(CatalogoAsincrono.as_view())
+        # Sin copia cacheada la arma la vista DRF; la segunda sale de la caché sin consultas
+        primera = vista(RequestFactory().get('/api/producto/'))
+        with CaptureQueriesContext(connection) as consultas:
+            segunda = vista(RequestFactory().get('/api/producto/'))
+
+        self.assertEqual(len(consultas), 0)
+        self.assertEqual(segunda.content, self.client.get('/api/producto/').content)
+        self.assertEqual(segunda['ETag'], primera['ETag'])
+        self.assertEqual(vista(RequestFactory().get('/api/producto/', HTTP_IF_NONE_MATCH=segunda['ETag'])).status_code, 304)
+        # Lo que no es lectura lo atiende ProductoViewSet
+        self.assertEqual(vista(RequestFactory().options('/api/producto/')).status_code, 200)
+
+    def test_guardar_producto_invalida_el_catalogo(self):
+        etag = self.client.get('/api/producto/')['ETag']
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.precio = 60.0
+            self.producto.save()
+
+        respuesta = self.client.get('/api/producto/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(respuesta.json()[0]['precio'], 60.0)
+
+    def test_etag_distingue_la_representacion(self):
+        json = self.client.get('/api/producto/')
+        html = self.client.get('/api/producto/', HTTP_ACCEPT='text/html')
+
+        self.assertNotEqual(json['ETag'], html['ETag'])
+        self.assertIn('Accept', json['Vary'])
+        self.assertEqual(self.client.get('/api/producto/', HTTP_ACCEPT='text/html',
+                                         HTTP_IF_NONE_MATCH=json['ETag']).status_code, 200)
+
+    def test_el_carrito_renueva_el_catalogo_pasada_la_demora(self):
+        from appCART.services import agregar_producto
+        from appUSERS.models import Usuario
+
+        usuario = Usuario.objects.create_user(
+            email='cliente@test.com', password='clave-segura-123', nombre='Cliente', apellido='Test', telefono='1'
+        )
+        etag = self.client.get('/api/producto/')['ETag']
+
+        with self.settings(CATALOGO_DEMORA_STOCK=3600):
+            with self.captureOnCommitCallbacks(execute=True):
+                agregar_producto(usuario, self.producto.pk, 2)
+            # Agregar al carrito no vacía la caché de todos
+            self.assertEqual(self.client.get('/api/producto/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            self.assertEqual(self.client.get('/api/producto/').json()[0]['disponible'], 5)
+
+        with self.settings(CATALOGO_DEMORA_STOCK=0):
+            respuesta = self.client.get('/api/producto/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()[0]['disponible'], 3)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CatalogoPaginadoTests(TestCase):
+
+    def setUp(self):
+        caches[CATALOGO_CACHE].clear()
+        categoria = CategoriaProducto.objects.create(nombre_categoria='Comidas', descripcion='Platos')
+        Producto.objects.bulk_create(
+            Producto(nombre_producto=f'Producto {i}', descripcion='-', precio=10.0, stock=1, id_categoria=categoria)
+            for i in range(7)
+        )
+        self.client = APIClient()
+
+    def test_recorre_el_catalogo_por_cursor(self):
+        vistos = []
+        url = '/api/producto/?page_size=3'
+        while url:
+            pagina = self.client.get(url).json()
+            self.assertLessEqual(len(pagina['results']), 3)
+            vistos += [producto['id_producto'] for producto in pagina['results']]
+            url = pagina['next']
+
+        self.assertEqual(vistos, sorted(Producto.objects.values_list('id_producto', flat=True)))
+
+    def test_page_size_tiene_tope(self):
+        pagina = self.client.get('/api/producto/?page_size=1000').json()
+        self.assertEqual(len(pagina['results']), 7)
+        self.assertIsNone(pagina['next'])
+
+    def test_sin_parametros_devuelve_la_lista_completa(self):
+        respuesta = self.client.get('/api/producto/').json()
+        self.assertIsInstance(respuesta, list)
+        self.assertEqual(len(respuesta), 7)
+
+    def test_cursor_pagina_aunque_no_se_pida_page_size(self):
+        primera = self.client.get('/api/producto/?page_size=3').json()
+        cursor = parse_qs(urlparse(primera['next']).query)['cursor'][0]
+        siguiente = self.client.get('/api/producto/', {'cursor': cursor}).json()
+        self.assertEqual(len(siguiente['results']), 4)
+
+    def test_busqueda_sigue_paginada(self):
+        self.assertIn('results', self.client.get('/api/producto/buscar/').json())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BusquedaProductosTests(TestCase):
+
+    def setUp(self):
+        caches[CATALOGO_CACHE].clear()
+        busqueda._indice = None
+        self.addCleanup(setattr, busqueda, '_indice', None)
+        comidas = CategoriaProducto.objects.create(nombre_categoria='Comidas', descripcion='Platos')
+        self.bebidas = CategoriaProducto.objects.create(nombre_categoria='Bebidas', descripcion='Frías')
+        for nombre, precio, stock, categoria in [
+            ('Pizza Muzzarella', 50.0, 5, comidas), ('Pizza Napolitana', 70.0, 0, comidas),
+            ('Empanada de carne', 10.0, 20, comidas), ('Agua con gas', 8.0, 3, self.bebidas),
+            ('Limonada', 12.0, 0, self.bebidas),
+        ]:
+            Producto.objects.create(nombre_producto=nombre, descripcion='-', precio=precio, stock=stock,
+                                    id_categoria=categoria)
+        # Sin stock en la fila, pero con disponible en sus shards
+        limonada = Producto.objects.get(nombre_producto='Limonada')
+        Producto.objects.filter(pk=limonada.pk).update(stock=6)
+        repartir_stock(limonada.pk, 2)
+        self.client = APIClient()
+
+    def nombres(self, consulta):
+        respuesta = self.client.get(f'/api/producto/buscar/?{consulta}')
+        self.assertEqual(respuesta.status_code, 200)
+        return [producto['nombre_producto'] for producto in respuesta.json()['results']]
+
+    def test_filtros_con_y_sin_indice_en_memoria(self):
+        casos = [
+            ('q=piz', ['Pizza Muzzarella', 'Pizza Napolitana']),
+            ('q=PIZZA%20n', ['Pizza Napolitana']),
+            ('q=na&modo=contiene', ['Pizza Napolitana', 'Empanada de carne', 'Limonada']),
+            ('q=con%20g&modo=contiene', ['Agua con gas']),
+            ('q=carne&modo=prefijo', []),
+            (f'categoria={self.bebidas.pk}&orden=-precio', ['Limonada', 'Agua con gas']),
+            ('precio_min=10&precio_max=50&orden=precio', ['Empanada de carne', 'Limonada', 'Pizza Muzzarella']),
+            ('con_stock=true&orden=nombre_producto', ['Agua con gas', 'Empanada de carne', 'Limonada',
+                                                      'Pizza Muzzarella']),
+            ('q=pizza&con_stock=true', ['Pizza Muzzarella']),
+        ]
+        for indice in (False, True):
+            with override_settings(BUSQUEDA_INDICE=indice):
+                for consulta, esperado in casos:
+                    with self.subTest(consulta=consulta, indice=indice):
+                        caches[CATALOGO_CACHE].clear()
+                        self.assertEqual(self.nombres(consulta), esperado)
+
+    @override_settings(BUSQUEDA_INDICE=True)
+    def test_indice_evita_like_y_se_reconstruye_al_cambiar_el_catalogo(self):
+        self.nombres('q=zza&modo=contiene')
+        invalidar = caches[CATALOGO_CACHE].delete
+        invalidar('catalogo:version')
+        with CaptureQueriesContext(connection) as consultas:
+            self.assertEqual(self.nombres('q=zza&modo=contiene'), ['Pizza Muzzarella', 'Pizza Napolitana'])
+        self.assertFalse(any('LIKE' in consulta['sql'] for consulta in consultas.captured_queries))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Producto.objects.create(nombre_producto='Calzone', descripcion='-', precio=60.0, stock=1,
+                                    id_categoria=self.bebidas)
+        self.assertEqual(self.nombres('q=calz'), ['Calzone'])
+
+        # Con más candidatos que el máximo va por SQL
+        with override_settings(BUSQUEDA_INDICE_MAXIMO=1):
+            invalidar('catalogo:version')
+            with CaptureQueriesContext(connection) as consultas:
+                self.assertEqual(len(self.nombres('q=pizza')), 2)
+            self.assertTrue(any('LIKE' in consulta['sql'] for consulta in consultas.captured_queries))
+
+    def test_parametros_invalidos(self):
+        respuesta = self.client.get('/api/producto/buscar/?modo=exacto&precio_min=barato')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(set(respuesta.json()), {'modo', 'precio_min'})
+
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CamposAPedidoTests(TestCase):
+
+    def setUp(self):
+        caches[CATALOGO_CACHE].clear()
+        self.categoria = CategoriaProducto.objects.create(nombre_categoria='Comidas', descripcion='Platos')
+        self.producto = Producto.objects.create(
+            nombre_producto='Pizza', descripcion='Muzzarella', precio=50.0, stock=5, id_categoria=self.categoria
+        )
+        self.client = APIClient()
+
+    def test_fields_poda_la_respuesta_y_las_columnas(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get('/api/producto/?fields=id_producto,nombre_producto')
+
+        self.assertEqual(respuesta.json(), [{'id_producto': self.producto.pk, 'nombre_producto': 'Pizza'}])
+        sql = consultas.captured_queries[-1]['sql']
+        self.assertNotIn('descripcion', sql)
+        self.assertNotIn('stock_shard', sql)
+        # Sin fields la respuesta no cambia
+        self.assertIn('disponible', self.client.get('/api/producto/').json()[0])
+
+    def test_expand_con_campos_anidados(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(
+                '/api/producto/buscar/?q=pi&fields=nombre_producto,id_categoria.nombre_categoria&expand=id_categoria'
+            )
+
+        self.assertEqual(respuesta.json()['results'],
+                         [{'nombre_producto': 'Pizza', 'id_categoria': {'nombre_categoria': 'Comidas'}}])
+        # La categoría viene en el mismo JOIN
+        self.assertEqual(len(consultas), 1)
+
+    def test_campos_desconocidos(self):
+        self.assertEqual(self.client.get('/api/producto/?fields=nombre,precio').status_code, 400)
+        self.assertEqual(self.client.get('/api/producto/?expand=descripcion').status_code, 400)
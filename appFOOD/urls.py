@@ -1,6 +1,7 @@
 from django.urls import path,include
 from rest_framework.routers import DefaultRouter
-from .views import ProductoViewSet
+from Food_ISPC.asincrono import segun_modo
+from .views import BuscarProductosAsincrono, CatalogoAsincrono, ProductoViewSet
 
 router = DefaultRouter()
 router.register('', ProductoViewSet )
@@ -8,5 +9,8 @@ router.register('', ProductoViewSet )
 app_name = 'producto'
 
 urlpatterns = [
+    path('', segun_modo(CatalogoAsincrono), name='producto-list'),
+    # Antes del router, que tomaría `buscar` como un id
+    path('buscar/', segun_modo(BuscarProductosAsincrono), name='producto-buscar'),
     path('', include(router.urls)),
 ]
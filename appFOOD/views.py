@@ -1,10 +1,73 @@
-from rest_framework import viewsets
+from rest_framework import generics, viewsets
+from rest_framework.filters import OrderingFilter
+from Food_ISPC.pagination import PaginacionCatalogo, PaginacionProductos
+from Food_ISPC.asincrono import VistaAsincrona
+from .busqueda import buscar, leer_filtros
+from .cache import CatalogoCacheMixin, arespuesta_cacheada
 from .models import Producto
 from .serializers import ProductoSerializer
 
 # Create your views here.
 
 
-class ProductoViewSet(viewsets.ModelViewSet):
+def productos_para(serializer):
+    """Productos con solo las columnas que usa `serializer`; suma los shards solo si muestra el stock."""
+    productos = Producto.objects.con_shards() if serializer.muestra_stock() else Producto.objects.all()
+    return serializer.optimizar(productos)
+
+
+class ProductoViewSet(CatalogoCacheMixin, viewsets.ModelViewSet):
     serializer_class = ProductoSerializer
-    queryset = Producto.objects.all()
+    queryset = Producto.objects.con_shards()
+    pagination_class = PaginacionCatalogo
+
+    def get_queryset(self):
+        if self.request.method != 'GET':
+            return super().get_queryset()
+        return productos_para(self.get_serializer())
+
+
+class CatalogoAsincrono(VistaAsincrona):
+    """Listado del catálogo bajo ASGI; las altas siguen en `ProductoViewSet`."""
+    vista_sincrona = ProductoViewSet.as_view({'get': 'list', 'post': 'create'})
+    requiere_autenticacion = False
+
+    async def get(self, request):
+        return await arespuesta_cacheada(request, type(self).vista_sincrona)
+
+
+class OrdenProductos(OrderingFilter):
+    ordering_param = 'orden'
+
+    def get_ordering(self, request, queryset, view):
+        # Desempate por id, así el cursor de la paginación es estable
+        orden = list(super().get_ordering(request, queryset, view))
+        if not any(campo.lstrip('-') == 'id_producto' for campo in orden):
+            orden.append('id_producto')
+        return orden
+
+
+class BuscarProductos(CatalogoCacheMixin, generics.ListAPIView):
+    """
+    `?q=` (con `modo=prefijo` o `contiene`), `categoria`, `precio_min`,
+    `precio_max`, `con_stock=true` y `orden` (`precio`, `nombre_producto` o
+    `id_producto`, con `-` para descendente). Paginado por cursor y servido
+    desde la caché del catálogo, como el listado.
+    """
+    serializer_class = ProductoSerializer
+    pagination_class = PaginacionProductos
+    filter_backends = [OrdenProductos]
+    ordering_fields = ['precio', 'nombre_producto', 'id_producto']
+    ordering = ['id_producto']
+
+    def get_queryset(self):
+        return buscar(leer_filtros(self.request.query_params), productos_para(self.get_serializer()))
+
+
+class BuscarProductosAsincrono(VistaAsincrona):
+    vista_sincrona = BuscarProductos.as_view()
+    requiere_autenticacion = False
+
+    async def get(self, request):
+        return await arespuesta_cacheada(request, type(self).vista_sincrona)
+
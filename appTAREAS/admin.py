@@ -0,0 +1,11 @@
+from django.contrib import admin
+
+from .models import Tarea
+
+
+class TareaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'tipo', 'estado', 'intentos', 'creada', 'terminada')
+    list_filter = ('estado', 'tipo')
+
+
+admin.site.register(Tarea, TareaAdmin)
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class AppTareasConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'appTAREAS'
+
+    def ready(self):
+        # Registra las tareas que declara cada app en su módulo `tareas`
+        autodiscover_modules('tareas')
@@ -0,0 +1,175 @@
+"""
+Cola de tareas en la base de datos. Las tareas se encolan dentro de la
+transacción de quien las genera (si esa transacción se deshace, la tarea no
+existe) y las ejecuta el worker `python manage.py procesar_tareas`.
+"""
+import logging
+import random
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Tarea
+
+logger = logging.getLogger(__name__)
+
+_registro = {}
+
+
+def tarea(tipo):
+    """Registra la función que ejecuta las tareas de `tipo`; recibe `datos` como argumentos con nombre."""
+    def registrar(funcion):
+        _registro[tipo] = funcion
+        return funcion
+    return registrar
+
+
+def encolar(tipo, datos=None, demora=0, max_intentos=None):
+    return Tarea.objects.create(
+        tipo=tipo, datos=datos or {},
+        max_intentos=max_intentos or settings.TAREAS_MAX_INTENTOS,
+        disponible_desde=timezone.now() + timedelta(seconds=demora),
+    )
+
+
+def reclamar(cantidad, duracion=None):
+    """
+    Toma hasta `cantidad` tareas listas y las marca en curso por `duracion`
+    segundos. Con `SKIP LOCKED` (MySQL 8, PostgreSQL) varios workers reclaman
+    lotes a la vez sin esperarse; en otras bases se turnan.
+    """
+    duracion = duracion or settings.TAREAS_DURACION
+    lote = Tarea.objects.select_for_update(
+        skip_locked=connection.features.has_select_for_update_skip_locked
+    )
+    with transaction.atomic():
+        ahora = timezone.now()
+        hasta = ahora + timedelta(seconds=duracion)
+        tareas = list(
+            lote.filter(estado__in=[Tarea.PENDIENTE, Tarea.EN_CURSO], disponible_desde__lte=ahora)
+            .order_by('disponible_desde')[:cantidad]
+        )
+        if tareas:
+            Tarea.objects.filter(pk__in=[t.pk for t in tareas]).update(
+                estado=Tarea.EN_CURSO, intentos=F('intentos') + 1, iniciada=ahora, disponible_desde=hasta,
+            )
+    for t in tareas:
+        t.estado, t.intentos, t.iniciada, t.disponible_desde = Tarea.EN_CURSO, t.intentos + 1, ahora, hasta
+    return tareas
+
+
+def espera_reintento(intentos):
+    """Backoff exponencial con jitter, acotado por `TAREAS_BACKOFF_MAXIMO`."""
+    espera = min(settings.TAREAS_BACKOFF * 2 ** (intentos - 1), settings.TAREAS_BACKOFF_MAXIMO)
+    return espera * random.uniform(0.5, 1.0)
+
+
+def ejecutar(t):
+    """
+    Ejecuta una tarea reclamada en su propia transacción, junto con la marca de
+    hecha. Si falla se reintenta con backoff; al agotar los intentos queda muerta.
+
+    Solo escribe el resultado si la tarea sigue siendo de este worker: si el
+    lease venció y otro la reclamó, se deshace lo que hizo y no se la pisa.
+    """
+    funcion = _registro.get(t.tipo)
+    propia = Tarea.objects.filter(pk=t.pk, estado=Tarea.EN_CURSO, disponible_desde=t.disponible_desde)
+    try:
+        if funcion is None:
+            raise LookupError(f'No hay una tarea registrada como {t.tipo!r}.')
+        with transaction.atomic():
+            funcion(**t.datos)
+            if not propia.update(estado=Tarea.HECHA, terminada=timezone.now(), error=None):
+                transaction.set_rollback(True)
+                logger.warning('Se venció el lease de la tarea %s y la tomó otro worker: se deshace', t)
+                return False
+        return True
+    except Exception:
+        error = traceback.format_exc()
+        muerta = funcion is None or t.intentos >= t.max_intentos
+        # El traceback completo queda en `error`
+        logger.warning('Falló la tarea %s (intento %s de %s): %s',
+                       t, t.intentos, t.max_intentos, error.strip().splitlines()[-1])
+        actualizadas = propia.update(
+            estado=Tarea.MUERTA if muerta else Tarea.PENDIENTE,
+            disponible_desde=timezone.now() + timedelta(seconds=0 if muerta else espera_reintento(t.intentos)),
+            terminada=timezone.now() if muerta else None,
+            error=error,
+        )
+        if not actualizadas:
+            logger.warning('Se venció el lease de la tarea %s y la tomó otro worker: no se registra el fallo', t)
+        return False
+
+
+def procesar(lote=10, duracion=None):
+    """Reclama y ejecuta un lote; devuelve cuántas tareas tomó."""
+    tareas = reclamar(lote, duracion)
+    for t in tareas:
+        ejecutar(t)
+    return len(tareas)
+
+
+def reintentar_muertas(tipo=None):
+    muertas = Tarea.objects.filter(estado=Tarea.MUERTA)
+    if tipo:
+        muertas = muertas.filter(tipo=tipo)
+    return muertas.update(estado=Tarea.PENDIENTE, intentos=0, disponible_desde=timezone.now(), terminada=None)
+
+
+def depurar_hechas(lote=1000, pausa=0.0):
+    """Borra en lotes las tareas hechas hace más de `TAREAS_RETENCION` segundos. Devuelve cuántas borró."""
+    limite = timezone.now() - timedelta(seconds=settings.TAREAS_RETENCION)
+    borradas = 0
+    while True:
+        ids = list(
+            Tarea.objects.filter(estado=Tarea.HECHA, terminada__lte=limite)
+            .order_by('terminada').values_list('pk', flat=True)[:lote]
+        )
+        if not ids:
+            return borradas
+        with transaction.atomic():
+            borradas += Tarea.objects.filter(pk__in=ids).delete()[0]
+        if pausa:
+            time.sleep(pausa)
+
+
+def _percentil(valores, p):
+    if not valores:
+        return 0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(p / 100 * len(ordenados)))]
+
+
+def metricas(ventana=3600, muestras=1000):
+    """
+    Profundidad de la cola por estado, antigüedad de la tarea lista más vieja y,
+    sobre las últimas `muestras` tareas terminadas en `ventana` segundos, espera
+    (de encolada a iniciada) y duración en milisegundos.
+    """
+    ahora = timezone.now()
+    pendientes = Tarea.objects.filter(estado=Tarea.PENDIENTE)
+    listas = pendientes.filter(disponible_desde__lte=ahora)
+    mas_vieja = listas.order_by('disponible_desde').values_list('disponible_desde', flat=True).first()
+    terminadas = list(
+        Tarea.objects.filter(estado=Tarea.HECHA, terminada__gte=ahora - timedelta(seconds=ventana))
+        .order_by('-terminada').values_list('creada', 'iniciada', 'terminada')[:muestras]
+    )
+    esperas = [(iniciada - creada).total_seconds() * 1000 for creada, iniciada, _ in terminadas]
+    duraciones = [(terminada - iniciada).total_seconds() * 1000 for _, iniciada, terminada in terminadas]
+    return {
+        'listas': listas.count(),
+        'programadas': pendientes.filter(disponible_desde__gt=ahora).count(),
+        'en_curso': Tarea.objects.filter(estado=Tarea.EN_CURSO).count(),
+        'muertas': Tarea.objects.filter(estado=Tarea.MUERTA).count(),
+        'antiguedad_s': round((ahora - mas_vieja).total_seconds(), 3) if mas_vieja else 0,
+        'hechas': len(terminadas),
+        'espera_p50_ms': round(_percentil(esperas, 50), 3),
+        'espera_p95_ms': round(_percentil(esperas, 95), 3),
+        'duracion_p50_ms': round(_percentil(duraciones, 50), 3),
+        'duracion_p95_ms': round(_percentil(duraciones, 95), 3),
+    }
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from appTAREAS.cola import depurar_hechas
+
+
+class Command(BaseCommand):
+    help = 'Borra en lotes las tareas terminadas hace más de TAREAS_RETENCION segundos.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Tareas por transacción (por defecto 1000).')
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help='Segundos de espera entre lotes, para repartir la carga.')
+        parser.add_argument('--cada', type=int,
+                            help='Queda corriendo y repite la depuración cada tantos segundos.')
+
+    def handle(self, *args, **options):
+        while True:
+            borradas = depurar_hechas(options['lote'], options['pausa'])
+            self.stdout.write(f'{borradas} tareas terminadas borradas')
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
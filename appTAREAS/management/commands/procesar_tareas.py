@@ -0,0 +1,45 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from appTAREAS.cola import procesar, reintentar_muertas
+
+
+class Command(BaseCommand):
+    help = 'Worker de la cola de tareas: reclama lotes de tareas listas y las ejecuta.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=10,
+                            help='Tareas que reclama por vez (por defecto 10).')
+        parser.add_argument('--pausa', type=float, default=1.0,
+                            help='Segundos de espera cuando no hay tareas listas.')
+        parser.add_argument('--duracion', type=int,
+                            help='Segundos que retiene cada tarea antes de que otro worker pueda tomarla '
+                                 '(por defecto TAREAS_DURACION).')
+        parser.add_argument('--una-vez', action='store_true',
+                            help='Procesa las tareas listas y termina.')
+        parser.add_argument('--reintentar-muertas', nargs='?', const='', metavar='TIPO',
+                            help='Vuelve a encolar las tareas muertas (de un tipo o todas) y termina.')
+
+    def handle(self, *args, **options):
+        if options['reintentar_muertas'] is not None:
+            reencoladas = reintentar_muertas(options['reintentar_muertas'])
+            self.stdout.write(f'{reencoladas} tareas muertas reencoladas')
+            return
+
+        self.detener = False
+        # Con SIGTERM termina el lote en curso y sale
+        signal.signal(signal.SIGTERM, lambda *_: setattr(self, 'detener', True))
+        procesadas = 0
+        while not self.detener:
+            tomadas = procesar(options['lote'], options['duracion'])
+            procesadas += tomadas
+            if not tomadas:
+                if options['una_vez']:
+                    break
+                # Como al terminar un request: renueva la conexión si venció o quedó rota
+                close_old_connections()
+                time.sleep(options['pausa'])
+        self.stdout.write(f'{procesadas} tareas procesadas')
@@ -0,0 +1,42 @@
+# Generated by Django 4.2 on 2026-10-18 14:38
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tarea',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(max_length=100)),
+                ('datos', models.JSONField(default=dict)),
+                ('estado', models.CharField(choices=[('pendiente', 'Pendiente'), ('en_curso', 'En curso'), ('hecha', 'Hecha'), ('muerta', 'Muerta')], default='pendiente', max_length=10)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('max_intentos', models.PositiveSmallIntegerField()),
+                ('disponible_desde', models.DateTimeField(default=django.utils.timezone.now)),
+                ('creada', models.DateTimeField(default=django.utils.timezone.now)),
+                ('iniciada', models.DateTimeField(null=True)),
+                ('terminada', models.DateTimeField(null=True)),
+                ('error', models.TextField(null=True)),
+            ],
+            options={
+                'db_table': 'tarea',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='tarea',
+            index=models.Index(fields=['estado', 'disponible_desde'], name='tarea_estado_disponible_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tarea',
+            index=models.Index(fields=['estado', 'terminada'], name='tarea_estado_terminada_idx'),
+        ),
+    ]
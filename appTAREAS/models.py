@@ -0,0 +1,34 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Tarea(models.Model):
+    PENDIENTE = 'pendiente'
+    EN_CURSO = 'en_curso'
+    HECHA = 'hecha'
+    # Agotó sus intentos: queda para revisarla y reintentarla a mano
+    MUERTA = 'muerta'
+    ESTADOS = [(PENDIENTE, 'Pendiente'), (EN_CURSO, 'En curso'), (HECHA, 'Hecha'), (MUERTA, 'Muerta')]
+
+    tipo = models.CharField(max_length=100)
+    datos = models.JSONField(default=dict)
+    estado = models.CharField(max_length=10, choices=ESTADOS, default=PENDIENTE)
+    intentos = models.PositiveSmallIntegerField(default=0)
+    max_intentos = models.PositiveSmallIntegerField()
+    # Desde cuándo la puede tomar un worker: el backoff de los reintentos y, en
+    # curso, el vencimiento del lease (si el worker se cae, la toma otro)
+    disponible_desde = models.DateTimeField(default=timezone.now)
+    creada = models.DateTimeField(default=timezone.now)
+    iniciada = models.DateTimeField(null=True)
+    terminada = models.DateTimeField(null=True)
+    error = models.TextField(null=True)
+
+    class Meta:
+        db_table = 'tarea'
+        indexes = [
+            models.Index(fields=['estado', 'disponible_desde'], name='tarea_estado_disponible_idx'),
+            models.Index(fields=['estado', 'terminada'], name='tarea_estado_terminada_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.tipo} #{self.pk} ({self.estado})'
@@ -0,0 +1,124 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from appUSERS.models import Usuario
+from .cola import depurar_hechas, ejecutar, encolar, metricas, procesar, reclamar, reintentar_muertas, tarea
+from .models import Tarea
+
+ejecutadas = []
+
+
+@tarea('prueba_anotar')
+def anotar(valor):
+    ejecutadas.append(valor)
+
+
+@tarea('prueba_fallar')
+def fallar():
+    raise RuntimeError('falla de prueba')
+
+
+@tarea('prueba_encolar')
+def encolar_otra():
+    encolar('prueba_anotar', {'valor': 'encolada'})
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, TAREAS_MAX_INTENTOS=2, TAREAS_BACKOFF=10)
+class ColaTareasTests(TestCase):
+
+    def setUp(self):
+        ejecutadas.clear()
+
+    def test_ejecuta_y_marca_hechas(self):
+        encolar('prueba_anotar', {'valor': 1})
+        encolar('prueba_anotar', {'valor': 2})
+        encolar('prueba_anotar', {'valor': 3}, demora=60)
+
+        salida = StringIO()
+        call_command('procesar_tareas', '--una-vez', '--lote', '1', stdout=salida)
+        self.assertIn('2 tareas procesadas', salida.getvalue())
+        self.assertEqual(ejecutadas, [1, 2])
+        self.assertEqual(Tarea.objects.filter(estado=Tarea.HECHA).count(), 2)
+        datos = metricas()
+        self.assertEqual((datos['listas'], datos['programadas'], datos['hechas']), (0, 1, 2))
+
+    def test_reintenta_con_backoff_y_despues_queda_muerta(self):
+        t = encolar('prueba_fallar')
+        procesar()
+        t.refresh_from_db()
+        self.assertEqual((t.estado, t.intentos), (Tarea.PENDIENTE, 1))
+        self.assertGreater(t.disponible_desde, timezone.now() + timedelta(seconds=4))
+        self.assertIn('falla de prueba', t.error)
+        self.assertEqual(procesar(), 0)
+
+        Tarea.objects.update(disponible_desde=timezone.now())
+        procesar()
+        t.refresh_from_db()
+        self.assertEqual((t.estado, t.intentos), (Tarea.MUERTA, 2))
+        self.assertEqual(metricas()['muertas'], 1)
+
+        self.assertEqual(reintentar_muertas('prueba_fallar'), 1)
+        t.refresh_from_db()
+        self.assertEqual((t.estado, t.intentos), (Tarea.PENDIENTE, 0))
+
+    def test_tipo_desconocido_queda_muerta(self):
+        t = encolar('no_existe')
+        procesar()
+        t.refresh_from_db()
+        self.assertEqual((t.estado, t.intentos), (Tarea.MUERTA, 1))
+
+    def test_retoma_tareas_de_un_worker_caido(self):
+        encolar('prueba_anotar', {'valor': 1})
+        self.assertEqual(len(reclamar(10, duracion=60)), 1)
+        self.assertEqual(reclamar(10), [])
+
+        Tarea.objects.update(disponible_desde=timezone.now())
+        procesar()
+        self.assertEqual(ejecutadas, [1])
+        self.assertEqual(Tarea.objects.get().intentos, 2)
+
+    def test_lease_vencido_no_pisa_al_worker_que_la_retomo(self):
+        t = encolar('prueba_encolar')
+        f = encolar('prueba_fallar')
+        viejas = reclamar(10, duracion=60)
+        Tarea.objects.update(disponible_desde=timezone.now())
+        nuevas = reclamar(10, duracion=60)
+
+        # El worker lento termina tarde: lo que hizo se deshace y no toca las tareas
+        with self.assertLogs('appTAREAS.cola', 'WARNING') as logs:
+            for vieja in viejas:
+                self.assertFalse(ejecutar(vieja))
+        self.assertEqual(len([linea for linea in logs.output if 'lease' in linea]), 2)
+        self.assertEqual(Tarea.objects.count(), 2)
+        for actual in (t, f):
+            actual.refresh_from_db()
+            self.assertEqual((actual.estado, actual.intentos, actual.error), (Tarea.EN_CURSO, 2, None))
+
+        for nueva in nuevas:
+            ejecutar(nueva)
+        t.refresh_from_db()
+        f.refresh_from_db()
+        self.assertEqual((t.estado, f.estado), (Tarea.HECHA, Tarea.MUERTA))
+        self.assertEqual(Tarea.objects.filter(tipo='prueba_anotar').count(), 1)
+
+    def test_depura_hechas_viejas(self):
+        encolar('prueba_anotar', {'valor': 1})
+        procesar()
+        with override_settings(TAREAS_RETENCION=0):
+            self.assertEqual(depurar_hechas(), 1)
+
+    def test_metricas_solo_staff(self):
+        cliente = APIClient()
+        usuario = Usuario.objects.create_user(
+            email='cliente@test.com', password='clave-segura-123', nombre='Cliente', apellido='Test', telefono='1'
+        )
+        cliente.force_authenticate(usuario)
+        self.assertEqual(cliente.get('/metricas/tareas/').status_code, 403)
+        usuario.is_staff = True
+        usuario.save()
+        self.assertEqual(cliente.get('/metricas/tareas/').json()['listas'], 0)
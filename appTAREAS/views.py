@@ -0,0 +1,13 @@
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from .cola import metricas
+
+
+class MetricasTareasView(APIView):
+    """Profundidad de la cola de tareas y latencia de las últimas terminadas."""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(metricas())
@@ -0,0 +1,74 @@
+from django.utils.translation import gettext_lazy as _
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .cache import aguardar_usuario, ausuario_cacheado, guardar_usuario, usuario_cacheado
+
+
+def id_usuario_del_token(validated_token):
+    try:
+        return validated_token[api_settings.USER_ID_CLAIM]
+    except KeyError:
+        raise InvalidToken(_('Token contained no recognizable user identification'))
+
+
+def verificar_usuario(user, validated_token):
+    # Mismas verificaciones que JWTAuthentication.get_user
+    if not user.is_active:
+        raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+    if api_settings.CHECK_REVOKE_TOKEN and (
+        validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password)
+    ):
+        raise AuthenticationFailed(_("The user's password has been changed."), code='password_changed')
+    return user
+
+
+class JWTAuthenticationCacheada(JWTAuthentication):
+    """
+    `JWTAuthentication` que toma el usuario de la caché `usuarios` en lugar de
+    consultarlo en cada request. La copia se descarta cada vez que se guarda el
+    usuario (ver signals.py), así una baja o un cambio de perfil rigen enseguida.
+
+    Las escrituras siempre leen el usuario de la base: si la invalidación no
+    llegó a este proceso, una baja igual rige para todo lo que modifica datos.
+    """
+    lee_de_cache = True
+
+    def authenticate(self, request):
+        self.lee_de_cache = request.method in SAFE_METHODS
+        return super().authenticate(request)
+
+    def get_user(self, validated_token):
+        user = usuario_cacheado(id_usuario_del_token(validated_token)) if self.lee_de_cache else None
+        if user is None:
+            user = super().get_user(validated_token)
+            guardar_usuario(user)
+        return verificar_usuario(user, validated_token)
+
+
+class JWTAuthenticationAsincrona(JWTAuthentication):
+    """`JWTAuthenticationCacheada` para las vistas async: caché y ORM por sus APIs async."""
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        user_id = id_usuario_del_token(validated_token)
+        user = await ausuario_cacheado(user_id)
+        if user is None:
+            try:
+                user = await self.user_model.objects.aget(**{api_settings.USER_ID_FIELD: user_id})
+            except self.user_model.DoesNotExist:
+                raise AuthenticationFailed(_('User not found'), code='user_not_found')
+            await aguardar_usuario(user)
+        return verificar_usuario(user, validated_token)
@@ -0,0 +1,52 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+USUARIOS_CACHE = 'usuarios'
+# Marca que deja una invalidación: mientras dura, un request que leyó el usuario
+# de la base antes del cambio no puede volver a guardar su copia vieja.
+INVALIDADO = 'invalidado'
+DURACION_INVALIDACION = 10
+
+
+def _cache():
+    return caches[USUARIOS_CACHE]
+
+
+def _clave(id_usuario):
+    return f'usuario:{id_usuario}'
+
+
+def _vigente(valor):
+    return None if valor == INVALIDADO else valor
+
+
+# Sin `USUARIOS_CACHE_ACTIVA` (memoria local con varios workers) no se lee ni se
+# guarda nada: cada request consulta la base.
+
+def usuario_cacheado(id_usuario):
+    if not settings.USUARIOS_CACHE_ACTIVA:
+        return None
+    return _vigente(_cache().get(_clave(id_usuario)))
+
+
+async def ausuario_cacheado(id_usuario):
+    if not settings.USUARIOS_CACHE_ACTIVA:
+        return None
+    return _vigente(await _cache().aget(_clave(id_usuario)))
+
+
+def guardar_usuario(usuario):
+    # add y no set: no pisa una invalidación reciente
+    if settings.USUARIOS_CACHE_ACTIVA:
+        _cache().add(_clave(usuario.pk), usuario)
+
+
+async def aguardar_usuario(usuario):
+    if settings.USUARIOS_CACHE_ACTIVA:
+        await _cache().aadd(_clave(usuario.pk), usuario)
+
+
+def invalidar_usuario(id_usuario):
+    """Descarta la copia cacheada del usuario cuando la transacción actual confirma."""
+    transaction.on_commit(lambda: _cache().set(_clave(id_usuario), INVALIDADO, DURACION_INVALIDACION))
@@ -0,0 +1,121 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+logger = logging.getLogger(__name__)
+
+
+class HashSaturado(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Hay demasiados inicios de sesión en curso, reintentá en unos segundos.'
+    default_code = 'hash_saturado'
+    # DRF lo devuelve como Retry-After
+    wait = 1
+
+
+class PoolHash:
+    """
+    Pool acotado donde se calculan los hashes de contraseñas. Como mucho hay
+    `PASSWORD_HASH_HILOS` hashes en paralelo y `PASSWORD_HASH_COLA` esperando;
+    pasado ese límite se rechaza enseguida con `HashSaturado` (503) en vez de
+    dejar a todos los workers calculando PBKDF2 mientras el carrito espera.
+
+    El pool acota la CPU, no los hilos de request: `ejecutar` bloquea al hilo
+    que llama hasta que termina su hash (el login y el registro son vistas DRF
+    sincrónicas). Cada hash en espera es un hilo de request parado, por eso la
+    cola es 0 por defecto y con el pool ocupado se responde 503 sin esperar.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.reiniciar()
+
+    def _iniciar(self):
+        if self.executor is None:
+            self.hilos = settings.PASSWORD_HASH_HILOS
+            self.capacidad = self.hilos + settings.PASSWORD_HASH_COLA
+            self.executor = ThreadPoolExecutor(max_workers=self.hilos, thread_name_prefix='hash')
+
+    def _medir(self, encolado, funcion, *args):
+        inicio = time.perf_counter()
+        try:
+            return funcion(*args)
+        finally:
+            fin = time.perf_counter()
+            with self.lock:
+                self.completados += 1
+                self.espera_total += inicio - encolado
+                self.hash_total += fin - inicio
+
+    def ejecutar(self, funcion, *args):
+        encolado = time.perf_counter()
+        with self.lock:
+            self._iniciar()
+            if self.pendientes >= self.capacidad:
+                self.rechazados += 1
+                rechazo = True
+            else:
+                rechazo = False
+                self.pendientes += 1
+                self.maximo_pendientes = max(self.maximo_pendientes, self.pendientes)
+                futuro = self.executor.submit(self._medir, encolado, funcion, *args)
+        if rechazo:
+            logger.warning('Pool de hash saturado: %s', self.metricas())
+            raise HashSaturado()
+        try:
+            return futuro.result()
+        finally:
+            with self.lock:
+                self.pendientes -= 1
+
+    def metricas(self):
+        with self.lock:
+            return {
+                'hilos': self.hilos,
+                'capacidad': self.capacidad,
+                'pendientes': self.pendientes,
+                'maximo_pendientes': self.maximo_pendientes,
+                'completados': self.completados,
+                'rechazados': self.rechazados,
+                'espera_media_ms': round(1000 * self.espera_total / self.completados, 2) if self.completados else 0,
+                'hash_medio_ms': round(1000 * self.hash_total / self.completados, 2) if self.completados else 0,
+            }
+
+    def reiniciar(self):
+        """Descarta el pool y las métricas; el próximo hash lo crea con los settings vigentes."""
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+            self.executor = None
+            self.hilos = self.capacidad = 0
+            self.pendientes = self.maximo_pendientes = 0
+            self.completados = self.rechazados = 0
+            self.espera_total = self.hash_total = 0.0
+
+
+pool_hash = PoolHash()
+
+
+class PBKDF2Acotado(PBKDF2PasswordHasher):
+    """
+    PBKDF2 calculado en `pool_hash`, con el costo de `PASSWORD_HASH_ITERACIONES`.
+
+    Usa el mismo algoritmo que el hasher de Django, así que verifica los hashes
+    existentes. Si se cambia el costo, `check_password` detecta el hash viejo y
+    lo recalcula con el nuevo en el siguiente login correcto.
+    """
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_HASH_ITERACIONES or PBKDF2PasswordHasher.iterations
+
+    def encode(self, password, salt, iterations=None):
+        # verify() y harden_runtime() también pasan por acá
+        return pool_hash.ejecutar(super().encode, password, salt, iterations)
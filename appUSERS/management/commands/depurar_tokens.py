@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from appUSERS.tokens import depurar_tokens_vencidos
+
+
+class Command(BaseCommand):
+    help = 'Borra en lotes los refresh tokens vencidos y sus entradas en la blacklist.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lote', type=int, default=1000,
+                            help='Tokens por transacción (por defecto 1000).')
+        parser.add_argument('--pausa', type=float, default=0.0,
+                            help='Segundos de espera entre lotes, para repartir la carga.')
+        parser.add_argument('--cada', type=int,
+                            help='Queda corriendo y repite la depuración cada tantos segundos.')
+
+    def handle(self, *args, **options):
+        while True:
+            tokens, en_blacklist = depurar_tokens_vencidos(options['lote'], options['pausa'])
+            self.stdout.write(f'{tokens} tokens vencidos borrados ({en_blacklist} en la blacklist)')
+            if not options['cada']:
+                break
+            time.sleep(options['cada'])
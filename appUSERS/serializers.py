@@ -1,5 +1,8 @@
 from django.contrib.auth import get_user_model,authenticate
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+
+from .tokens import RefreshTokenFiltrado
 
 class UsuarioSerializer(serializers.ModelSerializer):
     imagen_perfil_url = serializers.CharField(required=False, allow_blank=True, allow_null=True)
@@ -52,4 +55,8 @@ class AuthTokenSerializer(serializers.Serializer):
             raise serializers.ValidationError('No se pudo Autenticar', code = 'autorizacion')
         
         data['user'] = user
-        return data
\ No newline at end of file
+        return data
+
+
+class RefreshFiltradoSerializer(TokenRefreshSerializer):
+    token_class = RefreshTokenFiltrado
@@ -0,0 +1,10 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache import invalidar_usuario
+from .models import Usuario
+
+
+@receiver([post_save, post_delete], sender=Usuario)
+def invalidar_usuario_al_guardar(sender, instance, **kwargs):
+    invalidar_usuario(instance.pk)
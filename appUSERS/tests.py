@@ -1,3 +1,232 @@
-from django.test import TestCase
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .cache import USUARIOS_CACHE, guardar_usuario, invalidar_usuario, usuario_cacheado
+from .hashers import pool_hash
+from .models import Usuario
+from .tokens import RefreshTokenFiltrado, filtro_blacklist
+from .views import PerfilUsuarioAsincrono
+
+
+def crear_usuario(email='cliente@test.com'):
+    return Usuario.objects.create_user(
+        email=email, password='clave-segura-123', nombre='Cliente', apellido='Test', telefono='1'
+    )
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class PerfilUsuarioTests(TestCase):
+
+    def setUp(self):
+        caches[USUARIOS_CACHE].clear()
+
+    def test_version_async_devuelve_el_mismo_perfil(self):
+        usuario = crear_usuario()
+        token = f'Bearer {AccessToken.for_user(usuario)}'
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=token)
+
+        with self.assertNumQueries(1):
+            asincrona = async_to_sync(PerfilUsuarioAsincrono.as_view())(
+                RequestFactory().get('/appUSERS/me/', HTTP_AUTHORIZATION=token)
+            )
+        self.assertEqual(asincrona.status_code, 200)
+        self.assertEqual(asincrona.content, client.get('/appUSERS/me/').content)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class UsuarioCacheadoTests(TestCase):
+
+    def setUp(self):
+        caches[USUARIOS_CACHE].clear()
+        self.usuario = crear_usuario()
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.usuario)}')
+
+    def test_segundo_request_no_consulta_el_usuario(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/appUSERS/me/').status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/appUSERS/me/').json()['nombre'], 'Cliente')
+
+    def test_cambios_de_perfil_invalidan_la_copia(self):
+        self.client.get('/appUSERS/me/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.put('/appUSERS/update/', {'nombre': 'Nuevo'}, format='json')
+        self.assertEqual(self.client.get('/appUSERS/me/').json()['nombre'], 'Nuevo')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/appUSERS/update-image/', {'imagen_perfil_url': 'https://img.example.com/a.png'},
+                             format='json')
+        self.assertEqual(self.client.get('/appUSERS/me/').json()['imagen_perfil_url'], 'https://img.example.com/a.png')
+
+    def test_baja_rige_en_el_request_siguiente(self):
+        self.client.get('/appUSERS/me/')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete('/appUSERS/delete/').status_code, 200)
+        self.assertEqual(self.client.get('/appUSERS/me/').status_code, 401)
+
+    def test_guardar_desde_el_modelo_invalida(self):
+        # Es lo que hace el admin al editar un usuario
+        self.client.get('/appUSERS/me/')
+        self.usuario.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+        self.assertEqual(self.client.get('/appUSERS/me/').status_code, 401)
+
+    def test_escrituras_leen_el_usuario_de_la_base(self):
+        self.client.get('/appUSERS/me/')
+        # Una baja hecha en otro proceso: la invalidación no llegó a esta caché
+        Usuario.objects.filter(pk=self.usuario.pk).update(is_active=False)
+        self.assertEqual(self.client.get('/appUSERS/me/').status_code, 200)
+        self.assertEqual(self.client.put('/appUSERS/update/', {'nombre': 'Nuevo'}, format='json').status_code, 401)
+
+    @override_settings(USUARIOS_CACHE_ACTIVA=False)
+    def test_sin_cache_compartida_no_cachea(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.assertEqual(self.client.get('/appUSERS/me/').status_code, 200)
+        self.assertIsNone(caches[USUARIOS_CACHE].get(f'usuario:{self.usuario.pk}'))
+
+    def test_copia_vieja_no_pisa_una_invalidacion(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidar_usuario(self.usuario.pk)
+        # Un request que leyó el usuario antes del cambio llega tarde a guardarlo
+        guardar_usuario(self.usuario)
+        self.assertIsNone(usuario_cacheado(self.usuario.pk))
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class BlacklistTokensTests(TestCase):
+
+    def setUp(self):
+        filtro_blacklist.reiniciar()
+        self.usuario = crear_usuario()
+        self.refresh = str(RefreshTokenFiltrado.for_user(self.usuario))
+        self.client = APIClient()
+
+    def refrescar(self, refresh):
+        return self.client.post('/appUSERS/refresh/', {'refresh': refresh}, format='json')
+
+    def test_refresh_rota_y_rechaza_el_token_usado(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.refrescar(self.refresh)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertNotEqual(respuesta.json()['refresh'], self.refresh)
+        self.assertEqual(self.refrescar(self.refresh).status_code, 401)
+
+    def test_token_fuera_del_filtro_no_consulta_la_blacklist(self):
+        RefreshTokenFiltrado(self.refresh)
+        with self.assertNumQueries(0):
+            RefreshTokenFiltrado(self.refresh)
+
+    def test_blacklist_de_otro_proceso_entra_al_sincronizar(self):
+        RefreshTokenFiltrado(self.refresh)
+        token = OutstandingToken.objects.get(user=self.usuario)
+        BlacklistedToken.objects.create(token=token)
+
+        with override_settings(TOKENS_FILTRO_SINCRONIZACION=0), self.assertRaises(TokenError):
+            RefreshTokenFiltrado(self.refresh)
+
+    def test_logout_pone_el_refresh_en_la_blacklist(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.usuario)}')
+        otro = str(RefreshTokenFiltrado.for_user(crear_usuario('otro@test.com')))
+
+        self.assertEqual(self.client.post('/appUSERS/logout/', {'refresh': otro}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/appUSERS/logout/', {'refresh': 'basura'}, format='json').status_code, 400)
+        self.assertEqual(self.client.post('/appUSERS/logout/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post('/appUSERS/logout/', {'refresh': self.refresh}, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.refrescar(self.refresh).status_code, 401)
+
+    def test_depurar_borra_solo_los_vencidos_en_lotes(self):
+        vencido = timezone.now() - timedelta(days=1)
+        tokens = OutstandingToken.objects.bulk_create(
+            OutstandingToken(jti=f'vencido-{i}', token='-', expires_at=vencido) for i in range(5)
+        )
+        BlacklistedToken.objects.bulk_create(BlacklistedToken(token=token) for token in tokens[:3])
+
+        salida = StringIO()
+        call_command('depurar_tokens', lote=2, stdout=salida)
+
+        self.assertIn('5 tokens vencidos borrados (3 en la blacklist)', salida.getvalue())
+        self.assertEqual(OutstandingToken.objects.count(), 1)
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+@override_settings(SECURE_SSL_REDIRECT=False, PASSWORD_HASH_HILOS=1, PASSWORD_HASH_COLA=0,
+                   PASSWORD_HASH_ITERACIONES=1000)
+class HashContraseniasTests(TestCase):
+
+    def setUp(self):
+        caches[USUARIOS_CACHE].clear()
+        pool_hash.reiniciar()
+        self.addCleanup(pool_hash.reiniciar)
+        self.usuario = crear_usuario()
+        self.client = APIClient()
+
+    def login(self):
+        return self.client.post('/appUSERS/login/', {'email': 'cliente@test.com', 'password': 'clave-segura-123'},
+                                format='json')
+
+    def test_cambio_de_costo_rehashea_en_el_login(self):
+        self.assertTrue(self.usuario.password.startswith('pbkdf2_sha256$1000$'))
+        with override_settings(PASSWORD_HASH_ITERACIONES=2000):
+            self.assertEqual(self.login().status_code, 200)
+        self.usuario.refresh_from_db()
+        self.assertTrue(self.usuario.password.startswith('pbkdf2_sha256$2000$'))
+        self.assertEqual(pool_hash.metricas()['rechazados'], 0)
+
+    def test_pool_lleno_responde_503_sin_hashear(self):
+        empezo, liberar = threading.Event(), threading.Event()
+
+        def ocupar():
+            empezo.set()
+            liberar.wait(5)
+
+        ocupante = threading.Thread(target=pool_hash.ejecutar, args=(ocupar,))
+        ocupante.start()
+        empezo.wait(5)
+        try:
+            inicio = time.perf_counter()
+            respuesta = self.login()
+            # Con la cola en 0 el rechazo no espera a que se libere el pool
+            demora = time.perf_counter() - inicio
+            registro = self.client.post('/appUSERS/register/', {
+                'email': 'nuevo@test.com', 'password': 'clave-segura-123',
+                'nombre': 'N', 'apellido': 'N', 'telefono': '1',
+            }, format='json')
+        finally:
+            liberar.set()
+            ocupante.join()
+
+        self.assertEqual(respuesta.status_code, 503)
+        self.assertEqual(respuesta['Retry-After'], '1')
+        self.assertLess(demora, 1)
+        self.assertEqual(registro.status_code, 503)
+        self.assertEqual(pool_hash.metricas()['rechazados'], 2)
+        self.assertEqual(self.login().status_code, 200)
+
+    def test_metricas_solo_para_admin(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.usuario)}')
+        self.assertEqual(self.client.get('/appUSERS/metricas-hash/').status_code, 403)
+
+        self.usuario.is_staff = True
+        with self.captureOnCommitCallbacks(execute=True):
+            self.usuario.save()
+        metricas = self.client.get('/appUSERS/metricas-hash/').json()
+        self.assertEqual(metricas['hilos'], 1)
+        self.assertGreaterEqual(metricas['completados'], 1)
@@ -0,0 +1,127 @@
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+
+class FiltroBlacklist:
+    """
+    Filtro de Bloom en memoria con los `jti` de la blacklist. Si un jti no está
+    en el filtro el token seguro no está en la blacklist y no se consulta la base;
+    si está (o es un falso positivo, ~1%) se confirma con la consulta de siempre.
+
+    Se arma desde la tabla y después solo trae las filas nuevas (por id) cada
+    `TOKENS_FILTRO_SINCRONIZACION` segundos; cada `TOKENS_FILTRO_RECONSTRUCCION`
+    se rearma entero para soltar los tokens depurados. Lo que se agrega a la
+    blacklist en este proceso entra al filtro en el momento.
+    """
+    hashes = 7
+    bits_por_token = 10
+    # Al sincronizar se releen las últimas filas ya vistas: un INSERT que confirmó
+    # después que otro con id mayor no queda afuera del filtro.
+    solapamiento = 100
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bits = None
+        self.ultimo_id = 0
+        self.sincronizado = 0.0
+        self.construido = 0.0
+
+    def _posiciones(self, jti, tamanio):
+        digest = hashlib.blake2b(jti.encode(), digest_size=self.hashes * 4).digest()
+        return [int.from_bytes(digest[i:i + 4], 'little') % tamanio for i in range(0, len(digest), 4)]
+
+    def _marcar(self, bits, jti):
+        for posicion in self._posiciones(jti, len(bits) * 8):
+            bits[posicion >> 3] |= 1 << (posicion & 7)
+
+    def agregar(self, jti):
+        with self.lock:
+            if self.bits is not None:
+                self._marcar(self.bits, jti)
+
+    def puede_estar(self, jti):
+        self.sincronizar()
+        bits = self.bits
+        return all(bits[posicion >> 3] & (1 << (posicion & 7)) for posicion in self._posiciones(jti, len(bits) * 8))
+
+    def sincronizar(self):
+        ahora = time.monotonic()
+        if self.bits is not None and ahora - self.sincronizado < settings.TOKENS_FILTRO_SINCRONIZACION:
+            return
+        with self.lock:
+            if self.bits is None or ahora - self.construido >= settings.TOKENS_FILTRO_RECONSTRUCCION:
+                self._reconstruir(ahora)
+            elif ahora - self.sincronizado >= settings.TOKENS_FILTRO_SINCRONIZACION:
+                self._traer_nuevos(self.bits)
+            self.sincronizado = ahora
+
+    def _reconstruir(self, ahora):
+        # Los tokens vencidos los rechaza igual la verificación de `exp`
+        vigentes = BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now())
+        capacidad = max(settings.TOKENS_FILTRO_CAPACIDAD, 2 * vigentes.count())
+        bits = bytearray(capacidad * self.bits_por_token // 8 + 1)
+        self.ultimo_id = 0
+        self._traer_nuevos(bits, vigentes)
+        self.bits = bits
+        self.construido = ahora
+
+    def _traer_nuevos(self, bits, filas=None):
+        filas = BlacklistedToken.objects.all() if filas is None else filas
+        desde = max(0, self.ultimo_id - self.solapamiento)
+        for id_fila, jti in filas.filter(pk__gt=desde).order_by('pk').values_list('pk', 'token__jti').iterator():
+            self._marcar(bits, jti)
+            self.ultimo_id = max(self.ultimo_id, id_fila)
+
+    def reiniciar(self):
+        with self.lock:
+            self.bits = None
+
+
+filtro_blacklist = FiltroBlacklist()
+
+
+class RefreshTokenFiltrado(RefreshToken):
+    """`RefreshToken` que consulta la blacklist solo si el filtro en memoria no la descarta."""
+
+    def check_blacklist(self):
+        if filtro_blacklist.puede_estar(self.payload[api_settings.JTI_CLAIM]):
+            super().check_blacklist()
+
+    def blacklist(self):
+        resultado = super().blacklist()
+        jti = self.payload[api_settings.JTI_CLAIM]
+        transaction.on_commit(lambda: filtro_blacklist.agregar(jti))
+        return resultado
+
+
+def depurar_tokens_vencidos(lote=1000, pausa=0.0):
+    """
+    Borra los tokens vencidos y sus entradas en la blacklist en lotes por pk,
+    cada uno en su propia transacción corta para no bloquear las tablas.
+    Devuelve cuántos tokens y cuántas entradas de la blacklist borró.
+    """
+    ahora = timezone.now()
+    tokens = en_blacklist = 0
+    ultimo = 0
+    while True:
+        ids = list(
+            OutstandingToken.objects.filter(pk__gt=ultimo, expires_at__lte=ahora)
+            .order_by('pk').values_list('pk', flat=True)[:lote]
+        )
+        if not ids:
+            return tokens, en_blacklist
+        with transaction.atomic():
+            _, por_modelo = OutstandingToken.objects.filter(pk__in=ids).delete()
+        tokens += por_modelo.get(OutstandingToken._meta.label, 0)
+        en_blacklist += por_modelo.get(BlacklistedToken._meta.label, 0)
+        ultimo = ids[-1]
+        if pausa:
+            time.sleep(pausa)
@@ -1,13 +1,17 @@
 from django.urls import path
 from appUSERS import views
+from rest_framework_simplejwt.views import TokenRefreshView
+from Food_ISPC.asincrono import segun_modo
 
 urlpatterns = [
     path('register/', views.CreateUsuarioView.as_view()),
     path('login/', views.CreateTokenView.as_view()),
     path('logout/', views.LogoutView.as_view()),
+    path('refresh/', TokenRefreshView.as_view(), name='token-refresh'),
     path('update/', views.UpdateProfileView.as_view(), name='update-profile'),
     path('update-image/', views.UpdateProfileImageView.as_view(), name='update-profile-image'),
     path('delete/', views.DeleteProfileView.as_view(), name='delete-profile'),
-    path('me/', views.PerfilUsuarioView.as_view(), name='perfil-usuario'),  # Nuevo endpoint para perfil
+    path('metricas-hash/', views.MetricasHashView.as_view(), name='metricas-hash'),
+    path('me/', segun_modo(views.PerfilUsuarioAsincrono), name='perfil-usuario'),  # Nuevo endpoint para perfil
 ]
 
@@ -3,7 +3,12 @@ from appCART.models import Carrito, Pedido
 from appUSERS.serializers import UsuarioSerializer, AuthTokenSerializer 
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
+from Food_ISPC.asincrono import VistaAsincrona, respuesta_api
+from appUSERS.hashers import HashSaturado, pool_hash
+from appUSERS.tokens import RefreshTokenFiltrado
 import logging
 
 logger = logging.getLogger(__name__)
@@ -44,7 +49,9 @@ class CreateUsuarioView(generics.CreateAPIView):
             else:
                 logger.error(f"Errores de validación: {serializer.errors}")
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-                
+
+        except HashSaturado:
+            raise
         except Exception as e:
             logger.error(f"Error interno al crear usuario: {str(e)}", exc_info=True)
             return Response({
@@ -88,12 +95,18 @@ class CreateTokenView(APIView):
 class LogoutView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
-    def post(self, request):       
-        try:           
-            return Response({"detalle": "Logout Satisfactorio."}, status=status.HTTP_200_OK)
-        except Exception as e:
-            
-            return Response({"detalle": "Error inesperado."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    def post(self, request):
+        # Clientes anteriores no envían el refresh: no hay nada que invalidar
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                token = RefreshTokenFiltrado(refresh)
+            except TokenError:
+                return Response({"detalle": "Token inválido o expirado."}, status=status.HTTP_400_BAD_REQUEST)
+            if token.get(api_settings.USER_ID_CLAIM) != request.user.pk:
+                return Response({"detalle": "El token no pertenece al usuario."}, status=status.HTTP_400_BAD_REQUEST)
+            token.blacklist()
+        return Response({"detalle": "Logout Satisfactorio."}, status=status.HTTP_200_OK)
 
 class UpdateProfileView(APIView):
     permission_classes = [permissions.IsAuthenticated]
@@ -169,3 +182,18 @@ class PerfilUsuarioView(APIView):
     def get(self, request):
         serializer = UsuarioSerializer(request.user)
         return Response(serializer.data)
+
+
+class MetricasHashView(APIView):
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response(pool_hash.metricas())
+
+
+class PerfilUsuarioAsincrono(VistaAsincrona):
+    vista_sincrona = PerfilUsuarioView.as_view()
+
+    async def get(self, request):
+        # El usuario ya viene cargado por la autenticación: no hay más consultas
+        return respuesta_api(request, UsuarioSerializer(request.user).data)
@@ -0,0 +1 @@
+# Benchmarks reproducibles sobre una base SQLite temporal
@@ -0,0 +1,192 @@
+"""
+Lecturas (catálogo, perfil, carrito, dashboard, detalle) con muchos clientes
+lentos a la vez, servidas como WSGI (vistas DRF en un pool de hilos, como
+gunicorn con `--threads`) o como ASGI (vistas async en un solo event loop,
+como un worker de uvicorn).
+
+Cada cliente tarda `--latencia-ms` en enviar el request y en recibir la
+respuesta, como un móvil en una red lenta. En WSGI ese tiempo ocupa un hilo
+del pool; en ASGI solo una corrutina. Se corre una vez por modo y se comparan
+los resultados:
+
+    python -m benchmarks.asgi_wsgi --modo wsgi --salida wsgi.json
+    python -m benchmarks.asgi_wsgi --modo asgi --salida asgi.json
+    python -m benchmarks.comparar wsgi.json asgi.json
+"""
+import argparse
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.comun import base_temporal, commit_actual, configurar_django, emitir, resumir
+from benchmarks.flujo_pedidos import sembrar
+
+
+def urls_por_usuario(usuarios):
+    from rest_framework_simplejwt.tokens import AccessToken
+
+    from appCART.models import Pedido
+    from appUSERS.models import Usuario
+
+    pedidos = dict(Pedido.objects.order_by('id_usuario', 'pk').values_list('id_usuario', 'pk'))
+    clientes = []
+    for usuario in Usuario.objects.order_by('pk')[:usuarios]:
+        clientes.append((f'Bearer {AccessToken.for_user(usuario)}', [
+            ('catalogo', '/api/producto/'),
+            ('perfil', '/appUSERS/me/'),
+            ('carrito', '/appCART/ver/'),
+            ('dashboard', '/appCART/ver_dashboard/'),
+            ('detalle', f'/appCART/detalle_pedido/{pedidos[usuario.pk]}/'),
+        ]))
+    return clientes
+
+
+class Monitor:
+    """Registra el máximo de hilos vivos durante la corrida."""
+
+    def __init__(self):
+        self.maximo = threading.active_count()
+        self.activo = True
+        self.hilo = threading.Thread(target=self.medir, daemon=True)
+
+    def medir(self):
+        while self.activo:
+            self.maximo = max(self.maximo, threading.active_count())
+            time.sleep(0.005)
+
+    def __enter__(self):
+        self.hilo.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.activo = False
+        self.hilo.join()
+
+
+def correr_wsgi(clientes, requests_por_cliente, latencia, hilos):
+    from django.test import Client
+
+    mediciones = defaultdict(list)
+    locales = threading.local()
+
+    def atender(autorizacion, url):
+        if not hasattr(locales, 'http'):
+            locales.http = Client(raise_request_exception=False)
+        # El hilo queda tomado mientras el cliente envía el request y recibe la respuesta
+        time.sleep(latencia / 2)
+        respuesta = locales.http.get(url, secure=True, HTTP_AUTHORIZATION=autorizacion)
+        time.sleep(latencia / 2)
+        return respuesta.status_code
+
+    async def cliente(pool, indice, autorizacion, urls):
+        azar = random.Random(indice)
+        for _ in range(requests_por_cliente):
+            nombre, url = azar.choice(urls)
+            # La latencia incluye la espera hasta que se libera un hilo
+            inicio = time.perf_counter()
+            estado = await asyncio.get_running_loop().run_in_executor(pool, atender, autorizacion, url)
+            mediciones[nombre].append((time.perf_counter() - inicio, estado))
+
+    async def todos():
+        with ThreadPoolExecutor(max_workers=hilos) as pool:
+            await asyncio.gather(*(cliente(pool, i, *datos) for i, datos in enumerate(clientes)))
+
+    asyncio.run(todos())
+    return mediciones
+
+
+def correr_asgi(clientes, requests_por_cliente, latencia):
+    from django.core.asgi import get_asgi_application
+
+    aplicacion = get_asgi_application()
+    mediciones = defaultdict(list)
+
+    async def pedir(autorizacion, nombre, url):
+        ruta, _, consulta = url.partition('?')
+        scope = {
+            'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET',
+            'scheme': 'https', 'path': ruta, 'raw_path': ruta.encode(), 'query_string': consulta.encode(),
+            'root_path': '', 'server': ('testserver', 443), 'client': ('127.0.0.1', 5000),
+            'headers': [(b'host', b'testserver'), (b'authorization', autorizacion.encode())],
+        }
+        estado = []
+
+        async def receive():
+            await asyncio.sleep(latencia / 2)
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                estado.append(mensaje['status'])
+            elif not mensaje.get('more_body'):
+                await asyncio.sleep(latencia / 2)
+
+        inicio = time.perf_counter()
+        await aplicacion(scope, receive, send)
+        mediciones[nombre].append((time.perf_counter() - inicio, estado[0]))
+
+    async def cliente(indice, autorizacion, urls):
+        azar = random.Random(indice)
+        for _ in range(requests_por_cliente):
+            await pedir(autorizacion, *azar.choice(urls))
+
+    async def todos():
+        await asyncio.gather(*(cliente(i, *datos) for i, datos in enumerate(clientes)))
+
+    asyncio.run(todos())
+    return mediciones
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--modo', choices=['wsgi', 'asgi'], required=True)
+    parser.add_argument('--clientes', type=int, default=100, help='Clientes conectados a la vez')
+    parser.add_argument('--requests', type=int, default=5, help='Requests por cliente')
+    parser.add_argument('--latencia-ms', type=float, default=200, help='Ida y vuelta de la red del cliente')
+    parser.add_argument('--hilos', type=int, default=8, help='Hilos del worker WSGI')
+    parser.add_argument('--productos', type=int, default=200)
+    parser.add_argument('--pedidos-historicos', type=int, default=10)
+    parser.add_argument('--salida', help='Archivo JSON donde guardar el resultado')
+    args = parser.parse_args()
+
+    # Se fija antes de cargar Django: decide qué vistas quedan en las URLs
+    os.environ['VISTAS_ASINCRONAS'] = 'True' if args.modo == 'asgi' else 'False'
+    configurar_django()
+    latencia = args.latencia_ms / 1000
+
+    with base_temporal():
+        sembrar(args.clientes, args.productos, args.pedidos_historicos, 3)
+        clientes = urls_por_usuario(args.clientes)
+        with Monitor() as monitor:
+            inicio = time.perf_counter()
+            if args.modo == 'wsgi':
+                mediciones = correr_wsgi(clientes, args.requests, latencia, args.hilos)
+            else:
+                mediciones = correr_asgi(clientes, args.requests, latencia)
+            duracion = time.perf_counter() - inicio
+
+    total = sum(len(muestras) for muestras in mediciones.values())
+    emitir({
+        'benchmark': 'asgi_wsgi',
+        'commit': commit_actual(),
+        'configuracion': vars(args),
+        'duracion_s': round(duracion, 3),
+        'requests': total,
+        'rps': round(total / duracion, 2),
+        'hilos_maximos': monitor.maximo,
+        'endpoints': {
+            nombre: {
+                **resumir([latencia for latencia, _ in muestras]),
+                'errores_http': sum(1 for _, estado in muestras if estado >= 400),
+                'rps': round(len(muestras) / duracion, 2),
+            } for nombre, muestras in mediciones.items()
+        },
+    }, args.salida)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+"""
+Búsqueda de productos (`/api/producto/buscar/`) sobre un catálogo sintético,
+por SQL con los índices de la base y con el índice de trigramas en memoria
+(`BUSQUEDA_INDICE`). Cada request se mide con la caché de respuestas fría, así
+se ve el costo de la búsqueda y no el de la caché.
+
+Reporta el tiempo y la memoria de armar el índice y, por consulta y por modo,
+latencias p50/p95/p99 y cuántos resultados hubo.
+
+    python -m benchmarks.busqueda_productos --productos 100000 --repeticiones 30
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from benchmarks.comun import base_temporal, commit_actual, configurar_django, emitir, medir, resumir
+
+PLATOS = ['Pizza', 'Empanada', 'Hamburguesa', 'Milanesa', 'Lomito', 'Ensalada', 'Tarta', 'Sándwich',
+          'Calzone', 'Ravioles', 'Ñoquis', 'Sorrentinos', 'Limonada', 'Agua', 'Gaseosa', 'Cerveza']
+VARIANTES = ['Napolitana', 'Muzzarella', 'Completa', 'de carne', 'de pollo', 'de verdura', 'Caprese',
+             'Especial', 'Vegana', 'Picante', 'con gas', 'sin TACC', 'Casera', 'Clásica', 'Grande']
+
+CONSULTAS = [
+    ('typeahead 1 letra', 'q=p'),
+    ('typeahead 3 letras', 'q=piz'),
+    ('prefijo selectivo', 'q=pizza%20napolitana%2012'),
+    ('substring selectivo', 'q=napolitana%20123&modo=contiene'),
+    ('substring amplio', 'q=carne&modo=contiene'),
+    ('categoría y precio', 'categoria={categoria}&precio_min=100&precio_max=200&orden=precio'),
+    ('prefijo con stock', 'q=milanesa%20de%20pollo%201&con_stock=true&orden=-precio'),
+]
+
+
+def sembrar(cantidad, categorias):
+    from appFOOD.models import CategoriaProducto, Producto
+
+    creadas = CategoriaProducto.objects.bulk_create(
+        CategoriaProducto(nombre_categoria=f'Categoría {i}', descripcion='-') for i in range(categorias)
+    )
+    azar = random.Random(0)
+    lote = []
+    for i in range(cantidad):
+        lote.append(Producto(
+            nombre_producto=f'{azar.choice(PLATOS)} {azar.choice(VARIANTES)} {i}', descripcion='-',
+            precio=round(azar.uniform(50, 5000), 2), stock=azar.choice([0, 0, 5, 20, 100]),
+            id_categoria=creadas[i % categorias],
+        ))
+        if len(lote) == 5000:
+            Producto.objects.bulk_create(lote)
+            lote = []
+    Producto.objects.bulk_create(lote)
+    return CategoriaProducto.objects.order_by('pk').values_list('pk', flat=True).first()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--motor', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--productos', type=int, default=100_000)
+    parser.add_argument('--categorias', type=int, default=20)
+    parser.add_argument('--repeticiones', type=int, default=30)
+    parser.add_argument('--salida', help='Archivo JSON donde guardar el resultado')
+    args = parser.parse_args()
+
+    configurar_django(args.motor)
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+
+    from appFOOD import busqueda
+    from appFOOD.cache import invalidar_catalogo
+
+    resultado = {}
+    with base_temporal():
+        categoria = sembrar(args.productos, args.categorias)
+        cliente = APIClient()
+
+        inicio = time.perf_counter()
+        busqueda.construir_indice()
+        construccion = time.perf_counter() - inicio
+        # La memoria en una construcción aparte: tracemalloc la hace mucho más lenta
+        tracemalloc.start()
+        indice = busqueda.construir_indice()
+        memoria = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del indice
+
+        for modo, activo in (('sql', False), ('indice', True)):
+            with override_settings(BUSQUEDA_INDICE=activo):
+                # El índice se arma en la primera búsqueda; esa no se mide
+                cliente.get('/api/producto/buscar/?q=x', secure=True)
+                por_consulta = {}
+                for nombre, consulta in CONSULTAS:
+                    url = f'/api/producto/buscar/?{consulta.format(categoria=categoria)}'
+                    resultados = []
+
+                    def pedir():
+                        respuesta = cliente.get(url, secure=True)
+                        assert respuesta.status_code == 200, respuesta.status_code
+                        resultados[:] = respuesta.data['results']
+
+                    por_consulta[nombre] = {
+                        **resumir(medir(pedir, args.repeticiones, antes=invalidar_catalogo)),
+                        'resultados': len(resultados),
+                    }
+                resultado[modo] = por_consulta
+
+    emitir({
+        'benchmark': 'busqueda_productos',
+        'commit': commit_actual(),
+        'configuracion': vars(args),
+        'indice': {'construccion_s': round(construccion, 3), 'memoria_mb': round(memoria / 2 ** 20, 1)},
+        'modos': resultado,
+    }, args.salida)
+
+
+if __name__ == '__main__':
+    main()
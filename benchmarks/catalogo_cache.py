@@ -0,0 +1,56 @@
+"""
+Latencia del listado completo del catálogo con la caché fría y caliente.
+
+    python -m benchmarks.catalogo_cache --productos 2000 --repeticiones 50
+"""
+import argparse
+
+from benchmarks.comun import base_temporal, configurar_django, emitir, medir, resumir
+
+
+def sembrar_catalogo(cantidad):
+    from appFOOD.models import CategoriaProducto, Producto
+
+    categoria = CategoriaProducto.objects.create(nombre_categoria='Comidas', descripcion='Platos')
+    Producto.objects.bulk_create(
+        Producto(
+            nombre_producto=f'Producto {i}', descripcion='Descripción de prueba', precio=100.0 + i,
+            stock=50, imageURL=f'https://img.example.com/{i}.png', id_categoria=categoria,
+        ) for i in range(cantidad)
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--productos', type=int, default=2000)
+    parser.add_argument('--repeticiones', type=int, default=50)
+    args = parser.parse_args()
+
+    configurar_django()
+    from django.core.cache import caches
+    from rest_framework.test import APIClient
+    from appFOOD.cache import CATALOGO_CACHE
+
+    with base_temporal():
+        sembrar_catalogo(args.productos)
+        cliente = APIClient()
+        cache = caches[CATALOGO_CACHE]
+
+        def listar():
+            respuesta = cliente.get('/api/producto/', secure=True)
+            assert respuesta.status_code == 200, respuesta.status_code
+
+        fria = medir(listar, args.repeticiones, antes=cache.clear)
+        listar()
+        caliente = medir(listar, args.repeticiones)
+
+    emitir({
+        'benchmark': 'catalogo_cache',
+        'productos': args.productos,
+        'fria': resumir(fria),
+        'caliente': resumir(caliente),
+    })
+
+
+if __name__ == '__main__':
+    main()
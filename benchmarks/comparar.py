@@ -0,0 +1,43 @@
+"""
+Compara dos resultados de benchmarks/flujo_pedidos.py (por ejemplo, de dos commits).
+
+    python -m benchmarks.comparar base.json actual.json
+"""
+import argparse
+import json
+
+
+def variacion(antes, despues):
+    if not antes:
+        return None
+    return round((despues - antes) / antes * 100, 1)
+
+
+def comparar(base, actual, metricas=('p50_ms', 'p95_ms', 'p99_ms', 'rps')):
+    resultado = {
+        'base': base.get('commit'),
+        'actual': actual.get('commit'),
+        'rps_%': variacion(base['rps'], actual['rps']),
+        'endpoints': {},
+    }
+    for nombre, datos in actual['endpoints'].items():
+        anterior = base['endpoints'].get(nombre)
+        if anterior:
+            resultado['endpoints'][nombre] = {
+                f'{metrica}_%': variacion(anterior[metrica], datos[metrica]) for metrica in metricas
+            }
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('base')
+    parser.add_argument('actual')
+    args = parser.parse_args()
+
+    with open(args.base, encoding='utf-8') as base, open(args.actual, encoding='utf-8') as actual:
+        print(json.dumps(comparar(json.load(base), json.load(actual)), indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
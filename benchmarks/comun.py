@@ -0,0 +1,82 @@
+import contextlib
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def configurar_django(motor='sqlite'):
+    # Por defecto SQLite local. Con motor='mysql' se usan las variables DB_* (p. ej.
+    # un contenedor local); en ambos casos se trabaja sobre una base de pruebas
+    # aparte (ver `base_temporal`), nunca sobre la base configurada.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Food_ISPC.settings')
+    if motor == 'sqlite':
+        os.environ['DB_ENGINE'] = 'sqlite'
+    else:
+        os.environ.pop('DB_ENGINE', None)
+    import django
+    django.setup()
+
+
+@contextlib.contextmanager
+def base_temporal():
+    """Crea (y al salir destruye) una base de pruebas con todas las tablas."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    nombre = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(nombre, verbosity=0)
+        teardown_test_environment()
+
+
+def percentil(muestras, p):
+    ordenadas = sorted(muestras)
+    indice = min(len(ordenadas) - 1, max(0, round(p / 100 * len(ordenadas)) - 1))
+    return ordenadas[indice]
+
+
+def resumir(muestras):
+    """Estadísticas de latencia en milisegundos."""
+    ms = [m * 1000 for m in muestras]
+    return {
+        'n': len(ms),
+        'media_ms': round(statistics.mean(ms), 3),
+        'p50_ms': round(percentil(ms, 50), 3),
+        'p95_ms': round(percentil(ms, 95), 3),
+        'p99_ms': round(percentil(ms, 99), 3),
+    }
+
+
+def medir(funcion, repeticiones, antes=None):
+    muestras = []
+    for _ in range(repeticiones):
+        if antes:
+            antes()
+        inicio = time.perf_counter()
+        funcion()
+        muestras.append(time.perf_counter() - inicio)
+    return muestras
+
+
+def commit_actual():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def emitir(resultado, salida=None):
+    """Imprime el resultado en JSON y, si se indica, lo guarda en `salida`."""
+    texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+    sys.stdout.write(texto + '\n')
+    if salida:
+        with open(salida, 'w', encoding='utf-8') as archivo:
+            archivo.write(texto + '\n')
@@ -0,0 +1,134 @@
+"""
+Contención sobre el stock de un producto muy pedido: varios clientes agregan y
+quitan del carrito el mismo producto a la vez, con el stock en la fila del
+producto (`--shards 0`) y repartido en sub-contadores (`appFOOD/shards.py`).
+
+Reporta, por diseño, operaciones por segundo, latencias p50/p95/p99 de agregar y
+eliminar, y errores. En SQLite (un solo escritor) los diseños dan parecido: la
+diferencia se ve con `--motor mysql`, donde los locks son por fila.
+
+    python -m benchmarks.contencion_stock --motor mysql --concurrencia 32 --shards 0 8 16
+"""
+import argparse
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.comun import base_temporal, commit_actual, configurar_django, emitir, resumir
+
+
+def sembrar(clientes):
+    from django.contrib.auth.hashers import make_password
+
+    from appFOOD.models import CategoriaProducto
+    from appUSERS.models import Usuario
+
+    clave = make_password('clave-benchmark-123')
+    Usuario.objects.bulk_create(
+        Usuario(
+            email=f'cliente{i}@bench.com', password=clave, nombre='Cliente', apellido=str(i),
+            telefono='3510000000', direccion=f'Calle {i}',
+        ) for i in range(clientes)
+    )
+    return CategoriaProducto.objects.create(nombre_categoria='Promo', descripcion='-')
+
+
+def correr(producto_id, concurrencia, iteraciones):
+    from django.db import connection
+
+    from appCART.models import Carrito
+    from appCART.services import StockInsuficiente, agregar_producto, aplicar_operaciones
+    from appUSERS.models import Usuario
+
+    usuarios = list(Usuario.objects.order_by('pk')[:concurrencia])
+    mediciones = [defaultdict(list) for _ in range(concurrencia)]
+    errores = []
+    barrera = threading.Barrier(concurrencia)
+
+    def trabajador(indice):
+        usuario = usuarios[indice]
+        medicion = mediciones[indice]
+        try:
+            barrera.wait()
+            for _ in range(iteraciones):
+                inicio = time.perf_counter()
+                try:
+                    agregar_producto(usuario, producto_id, 1)
+                except StockInsuficiente:
+                    medicion['sin_stock'].append(0)
+                    continue
+                medicion['agregar'].append(time.perf_counter() - inicio)
+
+                linea = Carrito.objects.filter(
+                    usuario_id=usuario.pk, producto_id=producto_id
+                ).values_list('pk', flat=True)[0]
+                inicio = time.perf_counter()
+                aplicar_operaciones(usuario, [{'accion': 'eliminar', 'carrito_id': linea}])
+                medicion['eliminar'].append(time.perf_counter() - inicio)
+        except Exception as exc:
+            errores.append(repr(exc))
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(concurrencia)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    por_operacion = defaultdict(list)
+    for medicion in mediciones:
+        for nombre, muestras in medicion.items():
+            por_operacion[nombre].extend(muestras)
+    return duracion, por_operacion, errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--motor', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--concurrencia', type=int, default=16, help='Clientes en paralelo sobre el mismo producto')
+    parser.add_argument('--iteraciones', type=int, default=50, help='Altas y bajas por cliente')
+    parser.add_argument('--stock', type=int, default=1_000_000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[0, 8],
+                        help='Diseños a comparar: 0 es la fila única del producto')
+    parser.add_argument('--salida', help='Archivo JSON donde guardar el resultado')
+    args = parser.parse_args()
+
+    configurar_django(args.motor)
+    from appFOOD.models import Producto
+    from appFOOD.shards import repartir_stock
+
+    disenios = {}
+    with base_temporal():
+        categoria = sembrar(args.concurrencia)
+        for shards in args.shards:
+            producto = Producto.objects.create(
+                nombre_producto=f'Promo {shards}', descripcion='-', precio=100.0,
+                stock=args.stock, id_categoria=categoria,
+            )
+            repartir_stock(producto.pk, shards)
+            duracion, por_operacion, errores = correr(producto.pk, args.concurrencia, args.iteraciones)
+            operaciones = len(por_operacion['agregar']) + len(por_operacion['eliminar'])
+            disenios[f'shards_{shards}'] = {
+                'duracion_s': round(duracion, 3),
+                'ops': round(operaciones / duracion, 2),
+                'sin_stock': len(por_operacion['sin_stock']),
+                'errores': errores,
+                'operaciones': {
+                    nombre: resumir(por_operacion[nombre]) for nombre in ('agregar', 'eliminar') if por_operacion[nombre]
+                },
+                'disponible_final': Producto.objects.con_shards().get(pk=producto.pk).disponible,
+            }
+
+    emitir({
+        'benchmark': 'contencion_stock',
+        'commit': commit_actual(),
+        'configuracion': vars(args),
+        'disenios': disenios,
+    }, args.salida)
+
+
+if __name__ == '__main__':
+    main()
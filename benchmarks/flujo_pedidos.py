@@ -0,0 +1,187 @@
+"""
+Carga concurrente sobre el flujo completo de un pedido, por las rutas reales de
+Food_ISPC/urls.py: login -> catálogo -> agregar al carrito -> ver carrito ->
+modificar cantidad -> confirmar -> dashboard.
+
+Siembra una base temporal con usuarios, productos y pedidos históricos y
+reporta, por endpoint, throughput y latencias p50/p95/p99 en JSON.
+
+    python -m benchmarks.flujo_pedidos --concurrencia 8 --iteraciones 10 --salida actual.json
+    python -m benchmarks.comparar base.json actual.json
+"""
+import argparse
+import random
+import threading
+import time
+from collections import defaultdict
+
+from benchmarks.comun import base_temporal, commit_actual, configurar_django, emitir, resumir
+
+CLAVE = 'clave-benchmark-123'
+
+
+def sembrar(usuarios, productos, pedidos_por_usuario, lineas_por_pedido):
+    from datetime import date, time as hora
+
+    from django.contrib.auth.hashers import make_password
+    from django.utils import timezone
+
+    from appCART.models import DetallePedido, Pedido
+    from appFOOD.models import CategoriaProducto, Producto
+    from appUSERS.models import Usuario
+
+    # Un único hash para todos: sembrar no debería costar un PBKDF2 por usuario
+    clave = make_password(CLAVE)
+    Usuario.objects.bulk_create(
+        Usuario(
+            email=f'cliente{i}@bench.com', password=clave, nombre='Cliente', apellido=str(i),
+            telefono='3510000000', direccion=f'Calle {i}',
+        ) for i in range(usuarios)
+    )
+    categorias = CategoriaProducto.objects.bulk_create(
+        CategoriaProducto(nombre_categoria=f'Categoría {i}', descripcion='-') for i in range(10)
+    )
+    Producto.objects.bulk_create(
+        Producto(
+            nombre_producto=f'Producto {i}', descripcion='Descripción de prueba', precio=round(500 + i * 1.5, 2),
+            stock=10_000_000, imageURL=f'https://img.example.com/{i}.png', id_categoria=categorias[i % 10],
+        ) for i in range(productos)
+    )
+
+    productos = list(Producto.objects.values_list('id_producto', 'precio'))
+    azar = random.Random(42)
+    for usuario_id in Usuario.objects.values_list('id_usuario', flat=True):
+        lineas = [azar.sample(productos, lineas_por_pedido) for _ in range(pedidos_por_usuario)]
+        pedidos = Pedido.objects.bulk_create(
+            Pedido(
+                id_usuario_id=usuario_id, fecha_pedido=date.today(), hora_pedido=hora(12, 0),
+                direccion_entrega='Calle', estado='Entregado', fecha_modificacion=timezone.now(),
+                monto_total=sum(precio * 2 for _, precio in elegidos),
+                cantidad_lineas=lineas_por_pedido, cantidad_unidades=2 * lineas_por_pedido,
+            ) for elegidos in lineas
+        )
+        if pedidos[0].pk is None:
+            # MySQL no devuelve las claves de bulk_create
+            pedidos = list(Pedido.objects.filter(id_usuario_id=usuario_id).order_by('pk'))
+        DetallePedido.objects.bulk_create(
+            DetallePedido(
+                id_pedido=pedido, id_producto_id=producto_id, cantidad_productos=2,
+                precio_producto=precio, subtotal=precio * 2, direccion_entrega='Calle',
+            ) for pedido, elegidos in zip(pedidos, lineas) for producto_id, precio in elegidos
+        )
+    return [producto_id for producto_id, _ in productos]
+
+
+class Cliente:
+    """Un cliente móvil: registra la latencia de cada llamada por endpoint."""
+
+    def __init__(self, mediciones):
+        from django.test import Client
+
+        # Un error del servidor se mide como un 500, igual que lo vería la app
+        self.http = Client(raise_request_exception=False)
+        self.mediciones = mediciones
+        self.cabeceras = {}
+
+    def llamar(self, nombre, metodo, url, datos=None):
+        inicio = time.perf_counter()
+        respuesta = getattr(self.http, metodo)(
+            url, datos, content_type='application/json', secure=True, **self.cabeceras
+        )
+        self.mediciones[nombre].append((time.perf_counter() - inicio, respuesta.status_code))
+        return respuesta
+
+    def flujo(self, email, producto_ids, azar):
+        login = self.llamar('login', 'post', '/appUSERS/login/', {'email': email, 'password': CLAVE})
+        if login.status_code != 200:
+            return
+        self.cabeceras = {'HTTP_AUTHORIZATION': f'Bearer {login.json()["access"]}'}
+
+        self.llamar('catalogo', 'get', '/api/producto/')
+        for producto_id in azar.sample(producto_ids, 2):
+            self.llamar('agregar', 'post', f'/appCART/agregar/{producto_id}/', {'cantidad': azar.randint(1, 3)})
+        carrito = self.llamar('ver_carrito', 'get', '/appCART/ver/')
+        if carrito.status_code == 200 and carrito.json()['items']:
+            linea = carrito.json()['items'][0]
+            self.llamar('modificar', 'put', f'/appCART/modificar_cantidad/{linea["id"]}/', {'cantidad': 4})
+        self.llamar('confirmar', 'post', '/appCART/confirmar/')
+        self.llamar('dashboard', 'get', '/appCART/ver_dashboard/')
+
+
+def correr(concurrencia, iteraciones, usuarios, producto_ids):
+    from django.db import connection
+
+    mediciones = [defaultdict(list) for _ in range(concurrencia)]
+    errores = []
+
+    def trabajador(indice):
+        azar = random.Random(indice)
+        cliente = Cliente(mediciones[indice])
+        try:
+            # Cada hilo usa sus propios usuarios, como clientes distintos en paralelo
+            for iteracion in range(iteraciones):
+                usuario = (indice + iteracion * concurrencia) % usuarios
+                cliente.flujo(f'cliente{usuario}@bench.com', producto_ids, azar)
+        except Exception as exc:
+            errores.append(repr(exc))
+        finally:
+            connection.close()
+
+    hilos = [threading.Thread(target=trabajador, args=(i,)) for i in range(concurrencia)]
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    duracion = time.perf_counter() - inicio
+
+    por_endpoint = defaultdict(list)
+    for medicion in mediciones:
+        for nombre, muestras in medicion.items():
+            por_endpoint[nombre].extend(muestras)
+    return duracion, por_endpoint, errores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--motor', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--usuarios', type=int, default=200)
+    parser.add_argument('--productos', type=int, default=500)
+    parser.add_argument('--pedidos-historicos', type=int, default=20, help='Pedidos previos por usuario')
+    parser.add_argument('--lineas', type=int, default=3, help='Líneas por pedido histórico')
+    parser.add_argument(
+        '--concurrencia', type=int,
+        help='Hilos en paralelo (por defecto 1 en SQLite, que admite un solo escritor, y 8 en MySQL)',
+    )
+    parser.add_argument('--iteraciones', type=int, default=5, help='Flujos completos por hilo')
+    parser.add_argument('--salida', help='Archivo JSON donde guardar el resultado')
+    args = parser.parse_args()
+    if args.concurrencia is None:
+        args.concurrencia = 1 if args.motor == 'sqlite' else 8
+
+    configurar_django(args.motor)
+    with base_temporal():
+        producto_ids = sembrar(args.usuarios, args.productos, args.pedidos_historicos, args.lineas)
+        duracion, por_endpoint, errores = correr(args.concurrencia, args.iteraciones, args.usuarios, producto_ids)
+
+    total = sum(len(muestras) for muestras in por_endpoint.values())
+    emitir({
+        'benchmark': 'flujo_pedidos',
+        'commit': commit_actual(),
+        'configuracion': vars(args),
+        'duracion_s': round(duracion, 3),
+        'requests': total,
+        'rps': round(total / duracion, 2),
+        'errores': errores,
+        'endpoints': {
+            nombre: {
+                **resumir([latencia for latencia, _ in muestras]),
+                'errores_http': sum(1 for _, estado in muestras if estado >= 400),
+                'rps': round(len(muestras) / duracion, 2),
+            } for nombre, muestras in por_endpoint.items()
+        },
+    }, args.salida)
+
+
+if __name__ == '__main__':
+    main()
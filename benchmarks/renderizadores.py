@@ -0,0 +1,90 @@
+"""
+Micro-benchmark de los renderers y parsers de la API sobre respuestas reales:
+una página del catálogo, el dashboard y el detalle de varios pedidos (con las
+fechas, horas y montos de `Pedido`), armadas con las mismas funciones que las
+vistas sobre una base sembrada como la de `flujo_pedidos`.
+
+Compara el `JSONRenderer`/`JSONParser` de DRF con `JSONRapidoRenderer`/
+`JSONRapidoParser` y, si `msgpack` está instalado, con MessagePack. Reporta
+bytes, p50/p95 de renderizar y de parsear, y si la salida es idéntica a la de DRF.
+
+    python -m benchmarks.renderizadores --productos 100 --pedidos 50 --lineas 4
+"""
+import argparse
+import io
+
+from benchmarks.comun import base_temporal, commit_actual, configurar_django, emitir, medir, resumir
+
+
+def armar_respuestas(productos):
+    from django.test import RequestFactory
+
+    from appCART.views import CamposDashboard, datos_dashboard, datos_pedidos, pedidos_con_detalles, pedidos_dashboard
+    from appFOOD.serializers import ProductoSerializer
+    from appFOOD.views import productos_para
+    from appUSERS.models import Usuario
+
+    request = RequestFactory().get('/')
+    usuario = Usuario.objects.get()
+    campos = CamposDashboard(request)
+    pedidos = list(pedidos_con_detalles(usuario))
+    serializer = ProductoSerializer()
+    return {
+        'catálogo': ProductoSerializer(productos_para(serializer).order_by('pk')[:productos], many=True).data,
+        'dashboard': {'results': datos_dashboard(pedidos_dashboard(usuario, campos), usuario, campos)},
+        'detalle de pedidos': datos_pedidos([p.pk for p in pedidos], pedidos, usuario),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--motor', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--productos', type=int, default=100)
+    parser.add_argument('--pedidos', type=int, default=50)
+    parser.add_argument('--lineas', type=int, default=4)
+    parser.add_argument('--repeticiones', type=int, default=500)
+    parser.add_argument('--salida', help='Archivo JSON donde guardar el resultado')
+    args = parser.parse_args()
+
+    configurar_django(args.motor)
+    from rest_framework.parsers import JSONParser
+    from rest_framework.renderers import JSONRenderer
+
+    from benchmarks.flujo_pedidos import sembrar
+    from Food_ISPC import renderers
+
+    formatos = {
+        'drf': (JSONRenderer(), JSONParser()),
+        'orjson': (renderers.JSONRapidoRenderer(), renderers.JSONRapidoParser()),
+    }
+    if renderers.msgpack is not None:
+        formatos['msgpack'] = (renderers.MessagePackRenderer(), renderers.MessagePackParser())
+
+    resultado = {}
+    with base_temporal():
+        sembrar(1, args.productos, args.pedidos, args.lineas)
+        respuestas = armar_respuestas(args.productos)
+
+        for nombre, datos in respuestas.items():
+            referencia = JSONRenderer().render(datos)
+            por_formato = {}
+            for formato, (renderer, parser_) in formatos.items():
+                contenido = renderer.render(datos)
+                por_formato[formato] = {
+                    'bytes': len(contenido),
+                    'igual_a_drf': contenido == referencia if formato != 'msgpack' else None,
+                    'render': resumir(medir(lambda: renderer.render(datos), args.repeticiones)),
+                    'parse': resumir(medir(lambda: parser_.parse(io.BytesIO(contenido)), args.repeticiones)),
+                }
+            resultado[nombre] = por_formato
+
+    emitir({
+        'benchmark': 'renderizadores',
+        'commit': commit_actual(),
+        'configuracion': vars(args),
+        'respuestas': resultado,
+    }, args.salida)
+
+
+if __name__ == '__main__':
+    main()
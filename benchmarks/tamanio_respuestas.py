@@ -0,0 +1,82 @@
+"""
+Bytes que viajan por endpoint: la respuesta completa, con `?fields=` y
+comprimida con gzip y brotli (si está instalado), sobre una base sembrada como
+la de `flujo_pedidos`. También mide cuánto suma la compresión al tiempo de
+respuesta.
+
+    python -m benchmarks.tamanio_respuestas --productos 500 --pedidos 50 --lineas 4
+"""
+import argparse
+
+from benchmarks.comun import base_temporal, commit_actual, configurar_django, emitir, medir, resumir
+
+CASOS = [
+    ('catálogo', '/api/producto/?page_size=100'),
+    ('catálogo: nombre y precio', '/api/producto/?page_size=100&fields=id_producto,nombre_producto,precio'),
+    ('catálogo: con categoría', '/api/producto/?page_size=100&expand=id_categoria'),
+    ('búsqueda', '/api/producto/buscar/?q=producto%201&page_size=100'),
+    ('búsqueda: nombre', '/api/producto/buscar/?q=producto%201&page_size=100&fields=id_producto,nombre_producto'),
+    ('dashboard', '/appCART/ver_dashboard/?page_size=50'),
+    ('dashboard: sin detalles', '/appCART/ver_dashboard/?page_size=50&fields=id_pedidos,estado,monto_total'),
+    ('dashboard: detalles resumidos',
+     '/appCART/ver_dashboard/?page_size=50&fields=id_pedidos,estado,detalles.nombre_producto,detalles.subtotal'),
+    ('detalle de pedidos', '/appCART/detalle_pedido/?ids={ids}'),
+    ('detalle de pedidos: solo el pedido', '/appCART/detalle_pedido/?ids={ids}&fields=pedido'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--motor', choices=['sqlite', 'mysql'], default='sqlite')
+    parser.add_argument('--productos', type=int, default=500)
+    parser.add_argument('--pedidos', type=int, default=50)
+    parser.add_argument('--lineas', type=int, default=4)
+    parser.add_argument('--repeticiones', type=int, default=30)
+    parser.add_argument('--salida', help='Archivo JSON donde guardar el resultado')
+    args = parser.parse_args()
+
+    configurar_django(args.motor)
+    from django.test.utils import override_settings
+    from rest_framework.test import APIClient
+
+    from appCART.models import Pedido
+    from appFOOD.cache import invalidar_catalogo
+    from appUSERS.models import Usuario
+    from benchmarks.flujo_pedidos import sembrar
+    from Food_ISPC.middleware import brotli
+
+    codificaciones = ['identity', 'gzip'] + (['br'] if brotli is not None else [])
+    resultado = {}
+    with base_temporal(), override_settings(SECURE_SSL_REDIRECT=False):
+        sembrar(1, args.productos, args.pedidos, args.lineas)
+        cliente = APIClient()
+        cliente.force_authenticate(Usuario.objects.get())
+        ids = ','.join(str(pk) for pk in Pedido.objects.order_by('pk').values_list('pk', flat=True)[:20])
+
+        for nombre, url in CASOS:
+            url = url.format(ids=ids)
+            por_caso = {}
+            for codificacion in codificaciones:
+                def pedir():
+                    respuesta = cliente.get(url, HTTP_ACCEPT_ENCODING=codificacion)
+                    assert respuesta.status_code == 200, respuesta.status_code
+                    return respuesta
+
+                respuesta = pedir()
+                assert respuesta.get('Content-Encoding', 'identity') == codificacion, respuesta.get('Content-Encoding')
+                por_caso[codificacion] = {
+                    'bytes': len(respuesta.content),
+                    **resumir(medir(pedir, args.repeticiones, antes=invalidar_catalogo)),
+                }
+            resultado[nombre] = por_caso
+
+    emitir({
+        'benchmark': 'tamanio_respuestas',
+        'commit': commit_actual(),
+        'configuracion': vars(args),
+        'endpoints': resultado,
+    }, args.salida)
+
+
+if __name__ == '__main__':
+    main()